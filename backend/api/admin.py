@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, Category, ProductSpecification, Cart, CartItem, Order, OrderItem, Contact, PaymentCard
+from .models import Product, Category, ProductSpecification, Cart, CartItem, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, Contact, PaymentCard, Job
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -12,7 +12,7 @@ class ProductSpecificationInline(admin.TabularInline):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'price', 'in_stock', 'created_at']
+    list_display = ['name', 'category', 'price', 'in_stock', 'stock', 'created_at']
     list_filter = ['category', 'in_stock', 'created_at']
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
@@ -54,3 +54,20 @@ class PaymentCardAdmin(admin.ModelAdmin):
     list_filter = ['is_default', 'created_at']
     search_fields = ['user__username', 'card_number', 'card_holder_name']
     readonly_fields = ['created_at']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at', 'locked_by', 'locked_at', 'last_error']
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'status', 'payment_method', 'total_price', 'created_at', 'archived_at']
+    list_filter = ['status', 'payment_method']
+    search_fields = ['user__username', 'email', 'phone']
+    inlines = [ArchivedOrderItemInline]
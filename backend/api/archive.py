@@ -0,0 +1,84 @@
+"""
+Архив заказов: давние доставленные и отмененные заказы переносятся из
+Order/OrderItem в ArchivedOrder/ArchivedOrderItem с теми же id, чтобы
+оперативные таблицы и их индексы оставались небольшими.
+
+Перенос идет пачками, каждая - отдельная транзакция: копия в архив и
+удаление из оперативных таблиц фиксируются вместе. Переносятся только
+заказы, чей вклад в сводки продаж (api.rollups) уже соответствует статусу,
+поэтому задачи rollups.sync_order для архива не нужны. Остальные старые
+заказы в конечном статусе (задача сводок еще не выполнена) пропускаются и
+попадают в отчет archive_orders. Чтение истории
+заказов смотрит в обе таблицы (pagination.paginate_keyset_merged, get_order).
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+
+def _fields(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+FINAL_STATUSES = ['delivered', 'cancelled']
+ROLLUPS_SETTLED = Q(status='delivered', in_rollups=True) | Q(status='cancelled', in_rollups=False)
+
+
+def archivable(cutoff):
+    """Заказы, созданные до cutoff, в конечном статусе и с учтенным вкладом в сводки"""
+    return Order.objects.filter(ROLLUPS_SETTLED, created_at__lt=cutoff)
+
+
+def skipped(cutoff):
+    """Заказы до cutoff в конечном статусе, чей вклад в сводки еще не соответствует статусу"""
+    return Order.objects.filter(status__in=FINAL_STATUSES, created_at__lt=cutoff).exclude(ROLLUPS_SETTLED)
+
+
+def archive_batch(cutoff, batch_size=500):
+    """Переносит до batch_size заказов в архив; (заказов, позиций)"""
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    with transaction.atomic():
+        # Заказы, которые сейчас меняет администратор, перенесем в следующий раз
+        order_ids = list(
+            archivable(cutoff).order_by('id').select_for_update(skip_locked=skip_locked)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not order_ids:
+            return 0, 0
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(**row) for row in Order.objects.filter(id__in=order_ids).values(*_fields(Order))
+        ])
+        items = OrderItem.objects.filter(order_id__in=order_ids)
+        archived_items = ArchivedOrderItem.objects.bulk_create(
+            [ArchivedOrderItem(**row) for row in items.values(*_fields(OrderItem))],
+            batch_size=1000,
+        )
+        items.delete()
+        Order.objects.filter(id__in=order_ids).delete()
+    return len(order_ids), len(archived_items)
+
+
+def archive_orders(days, batch_size=500, progress=None):
+    """
+    Переносит все подходящие заказы старше days дней; progress(заказов, позиций)
+    после каждой пачки. Возвращает (заказов, позиций, пропущено заказов).
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    total_orders = total_items = 0
+    while True:
+        orders, items = archive_batch(cutoff, batch_size)
+        if not orders:
+            return total_orders, total_items, skipped(cutoff).count()
+        total_orders += orders
+        total_items += items
+        if progress:
+            progress(total_orders, total_items)
+
+
+def get_order(queryset, archived_queryset, **lookup):
+    """Заказ из оперативной таблицы, иначе из архива; None, если нет нигде"""
+    return queryset.filter(**lookup).first() or archived_queryset.filter(**lookup).first()
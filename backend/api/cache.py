@@ -0,0 +1,163 @@
+"""
+Кэш ответов публичных эндпоинтов каталога.
+
+Ключ = эндпоинт + параметры запроса + версии "областей" (scopes), от которых
+зависит ответ: 'products' (списки), 'product:<id|slug>' (карточка товара),
+'categories'. Запись в модели каталога увеличивает версии только затронутых
+областей (api.signals), старые записи просто перестают читаться и вытесняются
+по TIMEOUT. Работает с любым бэкендом Django: locmem локально, Redis/Memcached
+в production (настройка CATALOG_CACHE_ALIAS).
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+KEY_PREFIX = 'catalog'
+ENDPOINTS = ['products', 'product-detail', 'categories']
+
+
+def _cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def _version_key(scope):
+    return f'{KEY_PREFIX}:v:{scope}'
+
+
+def _mtime_key(scope):
+    return f'{KEY_PREFIX}:mtime:{scope}'
+
+
+def get_scope_state(scopes):
+    """
+    Текущие версии областей и время последнего изменения (max по областям)
+    одним обращением к кэшу. Отсутствующую версию инициализируем временем
+    в мс: если счетчик вытеснили, новая версия все равно больше старой, и
+    устаревшие записи не "оживут".
+    """
+    cache = _cache()
+    keys = [_version_key(scope) for scope in scopes] + [_mtime_key(scope) for scope in scopes]
+    values = cache.get_many(keys)
+    now = time.time()
+    missing = {
+        key: int(now * 1000) if key.startswith(f'{KEY_PREFIX}:v:') else now
+        for key in keys if key not in values
+    }
+    if missing:
+        for key, value in missing.items():
+            cache.add(key, value, None)
+        values.update(cache.get_many(list(missing)))
+    get = lambda key: values.get(key, missing.get(key))
+    versions = [get(_version_key(scope)) for scope in scopes]
+    last_modified = max(get(_mtime_key(scope)) for scope in scopes)
+    return versions, last_modified
+
+
+def get_versions(scopes):
+    return get_scope_state(scopes)[0]
+
+
+def bump(*scopes):
+    cache = _cache()
+    now = time.time()
+    for scope in set(scopes):
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(now * 1000), None)
+    cache.set_many({_mtime_key(scope): now for scope in scopes}, None)
+
+
+def bump_on_commit(*scopes):
+    """Версии увеличиваем после коммита, иначе параллельный запрос закэширует старые данные под новой версией"""
+    transaction.on_commit(lambda: bump(*scopes))
+
+
+def _record(endpoint, outcome):
+    cache = _cache()
+    key = f'{KEY_PREFIX}:stats:{endpoint}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_stats():
+    cache = _cache()
+    keys = [f'{KEY_PREFIX}:stats:{endpoint}:{outcome}' for endpoint in ENDPOINTS for outcome in ('hit', 'miss')]
+    values = cache.get_many(keys)
+    stats = {}
+    for endpoint in ENDPOINTS:
+        hits = values.get(f'{KEY_PREFIX}:stats:{endpoint}:hit', 0)
+        misses = values.get(f'{KEY_PREFIX}:stats:{endpoint}:miss', 0)
+        total = hits + misses
+        stats[endpoint] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else None,
+        }
+    return stats
+
+
+def _params_digest(request, kwargs=None):
+    params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+    return hashlib.md5(repr((params, sorted((kwargs or {}).items()))).encode()).hexdigest()
+
+
+def build_key(endpoint, request, scopes, kwargs=None):
+    versions = get_versions(scopes)
+    return f'{KEY_PREFIX}:{endpoint}:{_params_digest(request, kwargs)}:' + '.'.join(str(v) for v in versions)
+
+
+def scope_etag(endpoint, scopes):
+    """
+    etag_func для django.views.decorators.http.condition: строгий ETag из версий
+    областей и параметров запроса, без сериализации и хеширования тела ответа.
+    """
+    def etag_func(request, *args, **kwargs):
+        versions = get_versions(scopes(request, **kwargs))
+        return f'{endpoint}-{_params_digest(request, kwargs)}-' + '.'.join(str(v) for v in versions)
+    return etag_func
+
+
+def scope_last_modified(scopes):
+    def last_modified_func(request, *args, **kwargs):
+        _, last_modified = get_scope_state(scopes(request, **kwargs))
+        return datetime.fromtimestamp(last_modified, tz=timezone.utc)
+    return last_modified_func
+
+
+def cache_response(endpoint, scopes):
+    """
+    Декоратор GET-вью каталога. scopes(request, **kwargs) -> список областей.
+    Ставится под @api_view/@permission_classes. Кэшируются только ответы 200.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            key = build_key(endpoint, request, scopes(request, **kwargs), kwargs)
+            data = _cache().get(key)
+            if data is not None:
+                _record(endpoint, 'hit')
+                return Response(data)
+            _record(endpoint, 'miss')
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                _cache().set(key, response.data, _timeout())
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,191 @@
+"""
+Изменение корзины пачкой операций без чтения строк в Python.
+
+Операции {"op": "add"|"set"|"remove", "product_id": ..., "quantity": ...}
+сворачиваются по товару в одно итоговое действие, после чего применяются
+несколькими SQL-запросами независимо от их числа:
+- remove: один DELETE;
+- set: один INSERT ... ON CONFLICT (cart, product) DO UPDATE;
+- add: INSERT ... ON CONFLICT DO NOTHING для новых строк и один UPDATE
+  quantity = quantity + n (F-выражение), поэтому параллельные добавления
+  не теряются.
+Количество в строке не превышает CART_MAX_QUANTITY: больше в операции
+не принимается, а сумма добавлений обрезается до него.
+Вызывать внутри transaction.atomic().
+"""
+from django.conf import settings
+from django.db.models import Case, DecimalField, F, PositiveIntegerField, Sum, Value, When
+from django.db.models.functions import Least
+
+from .fastserialize import compile_serializer
+from .models import Cart, CartItem, Product
+from .serializers import CartLineSerializer, format_money
+
+OPERATIONS = ('add', 'set', 'remove')
+
+
+class CartOperationError(ValueError):
+    """Некорректная операция; index - ее номер в запросе"""
+
+    def __init__(self, message, index=None):
+        super().__init__(message)
+        self.index = index
+
+
+class UnknownProducts(LookupError):
+    def __init__(self, product_ids):
+        super().__init__(product_ids)
+        self.product_ids = product_ids
+
+
+class UnavailableProducts(Exception):
+    """Товары не в наличии (in_stock=False) - добавить их в корзину нельзя"""
+
+    def __init__(self, product_ids):
+        super().__init__(product_ids)
+        self.product_ids = product_ids
+
+
+def max_operations():
+    return getattr(settings, 'CART_BATCH_MAX_OPERATIONS', 100)
+
+
+def max_quantity():
+    return getattr(settings, 'CART_MAX_QUANTITY', 999)
+
+
+def _parse_int(value, index, name):
+    if isinstance(value, bool):
+        raise CartOperationError(f'{name} должно быть целым числом', index)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise CartOperationError(f'{name} должно быть целым числом', index)
+
+
+def parse_operations(items):
+    """Список (op, product_id, quantity) из JSON запроса; бросает CartOperationError"""
+    if not isinstance(items, list) or not items:
+        raise CartOperationError('operations должен быть непустым списком')
+    if len(items) > max_operations():
+        raise CartOperationError(f'Не более {max_operations()} операций за запрос')
+    operations = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise CartOperationError('Операция должна быть объектом', index)
+        op = item.get('op')
+        if op not in OPERATIONS:
+            raise CartOperationError(f'Недопустимая операция. Доступны: {", ".join(OPERATIONS)}', index)
+        product_id = _parse_int(item.get('product_id'), index, 'product_id')
+        quantity = 0
+        if op == 'add':
+            quantity = _parse_int(item.get('quantity', 1), index, 'quantity')
+            if quantity < 1:
+                raise CartOperationError('quantity для add должно быть положительным', index)
+        elif op == 'set':
+            quantity = _parse_int(item.get('quantity'), index, 'quantity')
+            if quantity < 0:
+                raise CartOperationError('quantity для set не может быть отрицательным', index)
+        if quantity > max_quantity():
+            raise CartOperationError(f'quantity не может быть больше {max_quantity()}', index)
+        operations.append((op, product_id, quantity))
+    return operations
+
+
+def fold_operations(operations):
+    """
+    {product_id: (action, quantity)} - итог последовательности операций по товару.
+    add поверх неизвестного состояния остается add, поверх set/remove дает set;
+    set 0 равносилен remove. Сумма добавлений не превышает max_quantity().
+    """
+    folded = {}
+    for op, product_id, quantity in operations:
+        current = folded.get(product_id)
+        if op == 'remove' or (op == 'set' and quantity == 0):
+            folded[product_id] = ('remove', 0)
+        elif op == 'set':
+            folded[product_id] = ('set', quantity)
+        elif current is None:
+            folded[product_id] = ('add', quantity)
+        else:
+            action, previous = current
+            folded[product_id] = ('add' if action == 'add' else 'set', min(previous + quantity, max_quantity()))
+    return folded
+
+
+def check_products(operations):
+    """
+    Одним запросом: бросает UnknownProducts, если каких-то товаров нет в каталоге,
+    и UnavailableProducts, если операция добавляет товар не в наличии (убрать его можно)
+    """
+    product_ids = {product_id for _, product_id, _ in operations}
+    in_stock = dict(Product.objects.filter(id__in=product_ids).values_list('id', 'in_stock'))
+    missing = sorted(product_ids - set(in_stock))
+    if missing:
+        raise UnknownProducts(missing)
+    unavailable = sorted({
+        product_id for op, product_id, quantity in operations
+        if op != 'remove' and quantity > 0 and not in_stock[product_id]
+    })
+    if unavailable:
+        raise UnavailableProducts(unavailable)
+
+
+def apply_operations(cart_id, operations):
+    """Применяет операции к корзине; не больше четырех запросов на любую пачку"""
+    removes, sets, adds = [], {}, {}
+    for product_id, (action, quantity) in fold_operations(operations).items():
+        if action == 'remove':
+            removes.append(product_id)
+        elif action == 'set':
+            sets[product_id] = quantity
+        else:
+            adds[product_id] = quantity
+
+    items = CartItem.objects.filter(cart_id=cart_id)
+    if removes:
+        items.filter(product_id__in=removes).delete()
+    if sets:
+        CartItem.objects.bulk_create(
+            [CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity) for product_id, quantity in sets.items()],
+            update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'],
+        )
+    if adds:
+        # Недостающие строки с нулевым количеством, затем общий инкремент
+        CartItem.objects.bulk_create(
+            [CartItem(cart_id=cart_id, product_id=product_id, quantity=0) for product_id in adds],
+            ignore_conflicts=True,
+        )
+        amounts = set(adds.values())
+        if len(amounts) == 1:
+            increment = Value(amounts.pop())
+        else:
+            increment = Case(
+                *[When(product_id=product_id, then=Value(quantity)) for product_id, quantity in adds.items()],
+                output_field=PositiveIntegerField(),
+            )
+        # Сумма с уже лежащим в корзине тоже не больше max_quantity()
+        items.filter(product_id__in=adds).update(quantity=Least(F('quantity') + increment, Value(max_quantity())))
+
+
+def compact_cart_payload(user):
+    """
+    Компактная корзина: строки с минимумом полей товара и итоги.
+    Три запроса при любом числе строк: id корзины, строки с товарами (JOIN),
+    агрегат суммы и количества.
+    """
+    cart_id = Cart.objects.filter(user=user).values_list('id', flat=True).first()
+    if cart_id is None:
+        return {"id": None, "items": [], "total_price": format_money(0), "total_items": 0}
+    items = CartItem.objects.filter(cart_id=cart_id).order_by('id')
+    lines = compile_serializer(CartLineSerializer).serialize(items)
+    totals = items.order_by().aggregate(
+        total_price=Sum(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        total_items=Sum('quantity'),
+    )
+    return {
+        "id": cart_id,
+        "items": lines,
+        "total_price": format_money(totals['total_price'] or 0),
+        "total_items": totals['total_items'] or 0,
+    }
@@ -0,0 +1,437 @@
+"""
+Массовый импорт каталога: upsert товаров по slug из CSV, NDJSON или JSON.
+
+Файл читается потоком и обрабатывается пачками по PRODUCT_IMPORT_BATCH_SIZE
+строк, каждая пачка - одна транзакция:
+- существующие товары пачки читаются одним запросом, новые создаются
+  bulk_create, измененные (и только они) - bulk_update;
+- характеристики сравниваются с текущими: bulk_create / bulk_update / DELETE;
+- bulk-операции не шлют сигналы, поэтому поисковый индекс, фасеты и версии
+  кэша обновляются здесь явно и один раз на пачку.
+Ошибки строк (валидация, повтор slug, не UTF-8) попадают в отчет и не прерывают
+импорт; файл с ошибкой в заголовке или в JSON-массиве отклоняется целиком.
+
+Формат строки: slug, name, description, price, image_url, category (slug
+категории), in_stock, stock и характеристики - в CSV колонками spec.<Название>,
+в JSON - "specifications" как объект {"Название": "значение"} или список
+[{"name", "value"}]. Отсутствующая колонка (ключ) оставляет поле товара без
+изменений; пустая - очищает необязательное поле; непустой stock задает и
+in_stock (stock > 0). Так же и с характеристиками: меняются только названные
+в файле, пустое значение удаляет характеристику, остальные характеристики
+товара не трогаются. Для выгрузок с полными записями товаров - replace_specs:
+характеристики строки заменяют весь набор товара, и выпавшие из выгрузки удаляются.
+"""
+import codecs
+import csv
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from . import cache, facets, search
+from .models import Category, Product, ProductSpecification
+
+SPEC_PREFIX = facets.SPEC_PARAM_PREFIX
+# Поля товара, которые задает импорт (category приходит slug-ом и становится category_id)
+FIELDS = ['name', 'description', 'price', 'image_url', 'category_id', 'in_stock', 'stock']
+DEFAULTS = {'description': '', 'image_url': None, 'category_id': None, 'in_stock': True, 'stock': None}
+REQUIRED_ON_CREATE = ['name', 'price']
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+TRUE_VALUES = {'1', 'true', 'yes', 'да'}
+FALSE_VALUES = {'0', 'false', 'no', 'нет'}
+# Сколько ошибок строк возвращается в отчете (всего считаются все)
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(ValueError):
+    """Файл целиком не читается: нет колонки slug, JSON не массив и т.п."""
+
+
+def batch_size():
+    return getattr(settings, 'PRODUCT_IMPORT_BATCH_SIZE', 1000)
+
+
+def detect_format(name='', content_type=''):
+    """Формат по расширению файла или Content-Type; None, если не распознан"""
+    extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+    if extension in FORMATS:
+        return extension
+    content_type = content_type.split(';')[0].strip().lower()
+    for import_format, known in FORMATS.items():
+        if content_type == known:
+            return import_format
+    return None
+
+
+def _text(stream):
+    # utf-8-sig: Excel сохраняет CSV с BOM
+    return codecs.getreader('utf-8-sig')(stream)
+
+
+class _Lines:
+    """
+    Строки байтового потока в UTF-8 (BOM в начале пропускается). Файл читается
+    потоком, и предыдущие пачки к этому моменту могут быть уже зафиксированы,
+    поэтому строка не в UTF-8 не прерывает импорт: она декодируется с заменой,
+    а флаг invalid делает ее ошибкой строки в отчете.
+    """
+
+    def __init__(self, stream):
+        self.stream = iter(stream)
+        self.first = True
+        self.invalid = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.stream)
+        if self.first:
+            line = line.removeprefix(codecs.BOM_UTF8)
+            self.first = False
+        try:
+            return line.decode('utf-8')
+        except UnicodeDecodeError:
+            self.invalid = True
+            return line.decode('utf-8', 'replace')
+
+
+NOT_UTF8 = 'Файл не в кодировке UTF-8 (в Excel - "CSV UTF-8")'
+
+
+def read_csv(stream):
+    lines = _Lines(stream)
+    reader = csv.DictReader(lines)
+    try:
+        columns = reader.fieldnames or []
+    except csv.Error as e:
+        raise ImportFormatError(f'Некорректный CSV: {e}') from e
+    # Заголовок читается до первой пачки - неверная кодировка в нем отклоняет файл целиком
+    if lines.invalid:
+        raise ImportFormatError(NOT_UTF8)
+    if 'slug' not in columns:
+        raise ImportFormatError('В CSV нет колонки slug')
+    spec_columns = [column for column in columns if column.startswith(SPEC_PREFIX)]
+    while True:
+        lines.invalid = False
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield ValidationError(f'Некорректная строка CSV: {e}')
+            continue
+        if lines.invalid:
+            yield ValidationError(NOT_UTF8)
+            continue
+        record = {key: value for key, value in row.items() if key and not key.startswith(SPEC_PREFIX)}
+        if spec_columns:
+            record['specifications'] = {column[len(SPEC_PREFIX):]: row[column] for column in spec_columns}
+        yield record
+
+
+def read_ndjson(stream):
+    lines = _Lines(stream)
+    for line in lines:
+        if lines.invalid:
+            lines.invalid = False
+            yield ValidationError(NOT_UTF8)
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            # Битая строка - ошибка этой строки, а не всего файла
+            yield ValidationError(f'Некорректный JSON: {e}')
+
+
+def read_json(stream):
+    """JSON-массив читается целиком; для больших файлов - NDJSON"""
+    try:
+        data = json.load(_text(stream))
+    except UnicodeDecodeError as e:
+        raise ImportFormatError(NOT_UTF8) from e
+    except ValueError as e:
+        raise ImportFormatError(f'Некорректный JSON: {e}') from e
+    if not isinstance(data, list):
+        raise ImportFormatError('Ожидается JSON-массив товаров')
+    yield from data
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson, 'json': read_json}
+
+
+def _clean_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValidationError('Ожидается true/false')
+
+
+def clean_specifications(value):
+    """
+    Характеристики {name: value} из объекта или списка [{"name", "value"}].
+    Пустое значение - None (характеристику нужно удалить), строки без названия пропускаются.
+    """
+    if isinstance(value, list):
+        pairs = [(spec.get('name'), spec.get('value')) for spec in value if isinstance(spec, dict)]
+    elif isinstance(value, dict):
+        pairs = list(value.items())
+    else:
+        raise ValidationError('Ожидается объект или список характеристик')
+    name_field = ProductSpecification._meta.get_field('name')
+    value_field = ProductSpecification._meta.get_field('value')
+    specs = {}
+    for name, spec_value in pairs:
+        if name in (None, ''):
+            continue
+        if isinstance(name, (dict, list)) or isinstance(spec_value, (dict, list)):
+            raise ValidationError(f'Характеристика {name}: ожидается строка или число')
+        name = name_field.clean(str(name).strip(), None)
+        spec_value = str(spec_value).strip() if spec_value is not None else ''
+        specs[name] = value_field.clean(spec_value, None) if spec_value else None
+    return specs
+
+
+def clean_record(record, categories):
+    """
+    (slug, {поле: значение} для переданных полей, характеристики или None).
+    categories - {slug: id}. Бросает ValidationError со словарем ошибок по полям.
+    """
+    if isinstance(record, ValidationError):
+        raise record
+    if not isinstance(record, dict):
+        raise ValidationError('Строка должна быть объектом')
+    errors = {}
+    values = {}
+    slug = None
+    try:
+        slug = Product._meta.get_field('slug').clean(str(record.get('slug') or '').strip(), None)
+    except ValidationError as e:
+        errors['slug'] = e.messages
+    for name in FIELDS:
+        source = 'category' if name == 'category_id' else name
+        if source not in record:
+            continue
+        value = record[source]
+        if isinstance(value, str):
+            value = value.strip()
+        elif isinstance(value, float):
+            # 1.99 из JSON - через строку, иначе DecimalField увидит 1.9899999...
+            value = str(value)
+        try:
+            if isinstance(value, (dict, list)):
+                raise ValidationError('Ожидается строка или число')
+            if value in ('', None):
+                if name in REQUIRED_ON_CREATE or name == 'in_stock':
+                    raise ValidationError('Обязательное поле')
+                values[name] = DEFAULTS[name]
+            elif name == 'category_id':
+                if not isinstance(value, str) or value not in categories:
+                    raise ValidationError(f'Категория {value} не найдена')
+                values[name] = categories[value]
+            elif name == 'in_stock':
+                values[name] = _clean_bool(value)
+            else:
+                values[name] = Product._meta.get_field(name).clean(value, None)
+        except ValidationError as e:
+            errors[source] = e.messages
+    if values.get('stock') is not None:
+        # Наличие следует из остатка, как в Product.save()
+        values['in_stock'] = values['stock'] > 0
+    specs = None
+    if 'specifications' in record:
+        try:
+            specs = clean_specifications(record['specifications'])
+        except ValidationError as e:
+            errors['specifications'] = e.messages
+    if errors:
+        raise ValidationError(errors)
+    return slug, values, specs
+
+
+def sync_specifications(products_specs, replace=False):
+    """
+    Применяет характеристики товаров [(product, {name: value})]: value None -
+    удалить. Не названные характеристики остаются, с replace=True - удаляются.
+    Возвращает (id товаров с изменениями, затронутые пары фасетов).
+    """
+    current = defaultdict(dict)
+    for spec_id, product_id, name, value in ProductSpecification.objects.filter(
+            product_id__in=[product.id for product, _ in products_specs]).values_list('id', 'product_id', 'name', 'value'):
+        current[product_id][name] = (spec_id, value)
+
+    to_create, to_update, to_delete = [], [], []
+    changed, pairs = set(), set()
+    for product, specs in products_specs:
+        old = current[product.id]
+        for name, value in specs.items():
+            if value is None:
+                continue
+            if name not in old:
+                to_create.append(ProductSpecification(product_id=product.id, name=name, value=value))
+            elif old[name][1] != value:
+                to_update.append(ProductSpecification(id=old[name][0], value=value))
+                pairs.add((name, old[name][1]))
+            else:
+                continue
+            pairs.add((name, value))
+            changed.add(product.id)
+        for name, (spec_id, value) in old.items():
+            if specs.get(name) is None and (replace or name in specs):
+                to_delete.append(spec_id)
+                pairs.add((name, value))
+                changed.add(product.id)
+
+    if to_delete:
+        ProductSpecification.objects.filter(id__in=to_delete).delete()
+    ProductSpecification.objects.bulk_update(to_update, ['value'])
+    ProductSpecification.objects.bulk_create(to_create)
+    return changed, pairs
+
+
+def update_specifications(product, specs):
+    """
+    Заменяет все характеристики одного товара по диффу (правка товара в админке).
+    Индекс, фасеты и кэш товара обновляются, только если что-то изменилось; True - изменилось.
+    """
+    changed, pairs = sync_specifications([(product, specs)], replace=True)
+    if not changed:
+        return False
+    search.index_product(product.id)
+    facets.schedule_refresh(pairs)
+    cache.bump_on_commit('products', f'product:{product.id}', f'product:{product.slug}')
+    return True
+
+
+def _import_batch(batch, replace_specs=False):
+    """
+    Одна пачка [(номер строки, slug, поля, характеристики)].
+    Возвращает ({номер строки: created/updated/unchanged}, {номер строки: ValidationError}).
+    """
+    existing = {
+        product.slug: product
+        for product in Product.objects.filter(slug__in=[slug for _, slug, _, _ in batch]).only('id', 'slug', *FIELDS)
+    }
+    now = timezone.now()
+    to_create, to_update, update_fields = [], [], set()
+    facet_products = set()  # у товара сменились наличие или категория - пересчитываются все его пары
+    outcomes, errors = {}, {}
+    for row_number, slug, values, _ in batch:
+        product = existing.get(slug)
+        if product is None:
+            missing = [name for name in REQUIRED_ON_CREATE if name not in values]
+            if missing:
+                errors[row_number] = ValidationError({name: ['Обязательное поле для нового товара'] for name in missing})
+                continue
+            existing[slug] = Product(slug=slug, **{**DEFAULTS, **values})
+            to_create.append(existing[slug])
+            outcomes[row_number] = 'created'
+            continue
+        changed = [name for name, value in values.items() if getattr(product, name) != value]
+        outcomes[row_number] = 'updated' if changed else 'unchanged'
+        if not changed:
+            continue
+        if {'in_stock', 'category_id'} & set(changed):
+            facet_products.add(product.id)
+        for name in changed:
+            setattr(product, name, values[name])
+        product.updated_at = now
+        update_fields |= {*changed, 'updated_at'}
+        to_update.append(product)
+
+    Product.objects.bulk_create(to_create)
+    if to_update:
+        Product.objects.bulk_update(to_update, sorted(update_fields))
+
+    spec_changed, pairs = sync_specifications([
+        (existing[slug], specs) for row_number, slug, _, specs in batch if specs is not None and row_number in outcomes
+    ], replace=replace_specs)
+    changed_products = to_create + to_update
+    spec_only = spec_changed - {product.id for product in changed_products}
+    if spec_only:
+        Product.objects.filter(id__in=spec_only).update(updated_at=now)
+        for row_number, slug, _, _ in batch:
+            if row_number in outcomes and existing[slug].id in spec_only:
+                outcomes[row_number] = 'updated'
+                changed_products.append(existing[slug])
+
+    if changed_products:
+        search.index_products(product.id for product in changed_products)
+        pairs |= set(ProductSpecification.objects.filter(product_id__in=facet_products).values_list('name', 'value'))
+        facets.schedule_refresh(pairs)
+        scopes = ['products']
+        for product in changed_products:
+            scopes += [f'product:{product.id}', f'product:{product.slug}']
+        cache.bump_on_commit(*scopes)
+    return outcomes, errors
+
+
+def _report_error(summary, row_number, slug, error):
+    summary['error_count'] += 1
+    if len(summary['errors']) < MAX_REPORTED_ERRORS:
+        messages = error.message_dict if hasattr(error, 'error_dict') else {'__all__': error.messages}
+        summary['errors'].append({"row": row_number, "slug": slug, "errors": messages})
+
+
+def _run_batch(batch, summary, dry_run, replace_specs):
+    try:
+        with transaction.atomic():
+            outcomes, errors = _import_batch(batch, replace_specs)
+            if dry_run:
+                transaction.set_rollback(True)
+    except DatabaseError as e:
+        # Конфликт с параллельной записью и т.п. - пачка не применена целиком
+        outcomes, errors = {}, {row_number: ValidationError(f'Ошибка базы данных: {e}') for row_number, _, _, _ in batch}
+    for row_number, slug, _, _ in batch:
+        if row_number in errors:
+            _report_error(summary, row_number, slug, errors[row_number])
+        else:
+            summary[outcomes[row_number]] += 1
+
+
+def import_products(records, size=None, dry_run=False, progress=None, replace_specs=False):
+    """
+    Импортирует поток записей (см. READERS). dry_run - все проверки и запросы
+    выполняются, но каждая пачка откатывается. progress(summary) - после пачки.
+    replace_specs - характеристики строки заменяют весь набор товара.
+    """
+    size = size or batch_size()
+    categories = dict(Category.objects.values_list('slug', 'id'))
+    summary = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'error_count': 0, 'errors': []}
+    seen = set()
+    batch = []
+    for row_number, record in enumerate(records, 1):
+        summary['rows'] += 1
+        slug = record.get('slug') if isinstance(record, dict) else None
+        try:
+            slug, values, specs = clean_record(record, categories)
+            if slug in seen:
+                raise ValidationError({'slug': ['Товар с этим slug уже встречался в файле']})
+        except ValidationError as e:
+            _report_error(summary, row_number, slug, e)
+            continue
+        seen.add(slug)
+        batch.append((row_number, slug, values, specs))
+        if len(batch) >= size:
+            _run_batch(batch, summary, dry_run, replace_specs)
+            batch = []
+            if progress:
+                progress(summary)
+    if batch:
+        _run_batch(batch, summary, dry_run, replace_specs)
+        if progress:
+            progress(summary)
+    return summary
@@ -0,0 +1,129 @@
+"""
+Потоковая выгрузка заказов и позиций заказов в CSV или NDJSON.
+
+Строки читаются через .values_list().iterator(chunk_size=ORDER_EXPORT_CHUNK_SIZE):
+в PostgreSQL это серверный курсор, поэтому в памяти воркера одновременно
+не больше одной пачки строк при любом размере выгрузки. Ответ отдается
+StreamingHttpResponse по мере чтения курсора.
+"""
+import csv
+import datetime
+import re
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+# (заголовок, поле для values_list)
+ORDER_COLUMNS = [
+    ('id', 'id'),
+    ('created_at', 'created_at'),
+    ('status', 'status'),
+    ('payment_method', 'payment_method'),
+    ('total_price', 'total_price'),
+    ('user_id', 'user_id'),
+    ('username', 'user__username'),
+    ('first_name', 'first_name'),
+    ('last_name', 'last_name'),
+    ('email', 'email'),
+    ('phone', 'phone'),
+    ('city', 'city'),
+    ('address', 'address'),
+    ('postal_code', 'postal_code'),
+]
+ITEM_COLUMNS = [
+    ('order_id', 'order_id'),
+    ('order_created_at', 'order__created_at'),
+    ('order_status', 'order__status'),
+    ('payment_method', 'order__payment_method'),
+    ('item_id', 'id'),
+    ('product_id', 'product_id'),
+    ('product_slug', 'product__slug'),
+    ('product_name', 'product__name'),
+    ('quantity', 'quantity'),
+    ('price', 'price'),
+]
+# Телефоны и числа (+375 29 123-45-67, -5) формулой не считаются
+PLAIN_NUMBER = re.compile(r'[+-][\d\s()-]*')
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def chunk_size():
+    return getattr(settings, 'ORDER_EXPORT_CHUNK_SIZE', 2000)
+
+
+def _day_start(value):
+    return timezone.make_aware(datetime.datetime.combine(datetime.date.fromisoformat(value), datetime.time.min))
+
+
+def filter_orders(params, prefix=''):
+    """
+    Условия выгрузки из параметров запроса: ?date_from=, ?date_to= (YYYY-MM-DD,
+    включительно), ?status= и ?payment_method= (можно через запятую).
+    prefix - путь до заказа ('order__' для позиций). ValueError при ошибке.
+    """
+    conditions = {}
+    if params.get('date_from'):
+        conditions[f'{prefix}created_at__gte'] = _day_start(params['date_from'])
+    if params.get('date_to'):
+        conditions[f'{prefix}created_at__lt'] = _day_start(params['date_to']) + datetime.timedelta(days=1)
+    for name, choices in (('status', Order.STATUS_CHOICES), ('payment_method', Order.PAYMENT_METHOD_CHOICES)):
+        if not params.get(name):
+            continue
+        values = params[name].split(',')
+        unknown = set(values) - set(dict(choices))
+        if unknown:
+            raise ValueError(f'неизвестное значение {name}: {", ".join(sorted(unknown))}')
+        conditions[f'{prefix}{name}__in'] = values
+    return conditions
+
+
+def export_queryset(params, items=False, archived=False):
+    """(заголовки, queryset строк-кортежей) в порядке id; archived - из архива заказов (api.archive)"""
+    if items:
+        model, columns, prefix = (ArchivedOrderItem if archived else OrderItem), ITEM_COLUMNS, 'order__'
+    else:
+        model, columns, prefix = (ArchivedOrder if archived else Order), ORDER_COLUMNS, ''
+    rows = (
+        model.objects.filter(**filter_orders(params, prefix))
+        .order_by(f'{prefix}id', 'id')
+        .values_list(*[lookup for _, lookup in columns])
+    )
+    return [header for header, _ in columns], rows
+
+
+class _Echo:
+    """Буфер для csv.writer, который просто возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    # Данные покупателя не должны выполняться как формула при открытии в Excel
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@', '\t', '\r') and not PLAIN_NUMBER.fullmatch(value):
+        return "'" + value
+    return value
+
+
+def stream_csv(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows.iterator(chunk_size=chunk_size()):
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+def stream_ndjson(headers, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows.iterator(chunk_size=chunk_size()):
+        yield encoder.encode(dict(zip(headers, row))) + '\n'
+
+
+STREAMS = {'csv': stream_csv, 'ndjson': stream_ndjson}
@@ -0,0 +1,135 @@
+"""
+Фасетная фильтрация каталога по характеристикам (?spec.Бренд=Nike&spec.Материал=...).
+
+Счетчики хранятся в FacetCount и пересчитываются только для затронутых пар
+(name, value) после коммита транзакции, в которой менялись товары или
+характеристики (см. api.signals). Запрос каталога читает готовые счетчики.
+"""
+import threading
+import zlib
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+
+from .models import FacetCount, ProductSpecification
+
+SPEC_PARAM_PREFIX = 'spec.'
+# Первый ключ advisory-блокировок пересчета (второй - crc32 пары)
+LOCK_NAMESPACE = 0x46414345
+
+_pending = threading.local()
+
+
+def parse_spec_filters(query_params):
+    """{name: [values]} из параметров вида spec.<name>=<value>"""
+    filters = {}
+    for key in query_params:
+        if key.startswith(SPEC_PARAM_PREFIX) and len(key) > len(SPEC_PARAM_PREFIX):
+            values = [v for v in query_params.getlist(key) if v]
+            if values:
+                filters[key[len(SPEC_PARAM_PREFIX):]] = values
+    return filters
+
+
+def filter_by_specs(queryset, spec_filters):
+    """Значения одной характеристики объединяются по ИЛИ, разные характеристики - по И"""
+    for name, values in spec_filters.items():
+        queryset = queryset.filter(Exists(ProductSpecification.objects.filter(
+            product=OuterRef('pk'), name=name, value__in=values,
+        )))
+    return queryset
+
+
+def facet_counts(category_slug=None):
+    """{name: [{"value": ..., "count": ...}, ...]} из предрасчитанного индекса"""
+    counts = FacetCount.objects.filter(product_count__gt=0)
+    if category_slug:
+        counts = counts.filter(category__slug=category_slug)
+    else:
+        counts = counts.filter(category__isnull=True)
+    facets = defaultdict(list)
+    for name, value, count in counts.order_by('name', '-product_count', 'value').values_list('name', 'value', 'product_count'):
+        facets[name].append({"value": value, "count": count})
+    return dict(facets)
+
+
+def _pairs_q(pairs):
+    condition = Q()
+    for name, value in pairs:
+        condition |= Q(name=name, value=value)
+    return condition
+
+
+def _lock(pairs):
+    """
+    Сериализует пересчеты одних и тех же пар, иначе два параллельных пересчета
+    удалят и вставят одинаковые строки и второй упадет на уникальном индексе.
+    В PostgreSQL - advisory-блокировки пар до конца транзакции (полный пересчет
+    блокирует таблицу); SQLite и так пишет по одной транзакции за раз.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        if pairs is None:
+            cursor.execute(f'LOCK TABLE {FacetCount._meta.db_table} IN SHARE ROW EXCLUSIVE MODE')
+            return
+        # Ключи в одном порядке во всех транзакциях - без взаимных блокировок
+        keys = sorted({zlib.crc32(f'{name}\0{value}'.encode()) - 2 ** 31 for name, value in pairs})
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s, key) FROM (SELECT unnest(%s::int[]) AS key ORDER BY 1) AS keys',
+            [LOCK_NAMESPACE, keys],
+        )
+
+
+def refresh_facets(pairs=None):
+    """
+    Пересчитывает счетчики для пар (name, value); pairs=None - полный пересчет.
+    Один агрегирующий запрос по индексу (name, value) на весь набор пар;
+    считаем уже под блокировкой, чтобы последний пересчет видел последние данные.
+    """
+    if pairs is not None:
+        pairs = set(pairs)
+        if not pairs:
+            return
+
+    with transaction.atomic():
+        _lock(pairs)
+        specs = ProductSpecification.objects.filter(product__in_stock=True)
+        stale = FacetCount.objects.all()
+        if pairs is not None:
+            specs = specs.filter(_pairs_q(pairs))
+            stale = stale.filter(_pairs_q(pairs))
+
+        per_category = defaultdict(int)
+        for row in specs.values('name', 'value', 'product__category_id').annotate(n=Count('id')).order_by():
+            per_category[(row['product__category_id'], row['name'], row['value'])] += row['n']
+
+        rows = []
+        totals = defaultdict(int)
+        for (category_id, name, value), n in per_category.items():
+            totals[(name, value)] += n
+            if category_id is not None:
+                rows.append(FacetCount(category_id=category_id, name=name, value=value, product_count=n))
+        rows += [FacetCount(category=None, name=name, value=value, product_count=n) for (name, value), n in totals.items()]
+
+        stale.delete()
+        FacetCount.objects.bulk_create(rows, batch_size=500)
+
+
+def schedule_refresh(pairs):
+    """Откладывает пересчет до коммита, объединяя пары всех записей транзакции"""
+    pairs = set(pairs)
+    if not pairs:
+        return
+    if not hasattr(_pending, 'pairs'):
+        _pending.pairs = set()
+    _pending.pairs |= pairs
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    pairs = getattr(_pending, 'pairs', None)
+    if pairs:
+        _pending.pairs = set()
+        refresh_facets(pairs)
@@ -0,0 +1,160 @@
+"""
+Быстрый путь сериализации для read-only списков.
+
+compile_serializer() один раз разбирает объявленные поля DRF-сериализатора и
+генерирует функцию "строка .values() -> dict" с теми же to_representation,
+что вызывает ModelSerializer, поэтому JSON совпадает байт в байт. На каждую
+строку не создаются ни модели, ни BoundField, ни вложенные сериализаторы.
+
+Поддерживаются: обычные поля модели, PrimaryKeyRelatedField, вложенный
+сериализатор по ForeignKey и вложенный many=True по обратной связи (одним
+дополнительным запросом на пачку родителей). Поля-свойства и прочие
+вычисляемые поля описываются в атрибуте сериализатора fast_fields:
+    fast_fields = {'average_rating': (['rating_sum', 'review_count'], func)}
+func получает значения перечисленных колонок (для many-поля - список его
+сырых строк). SerializerMethodField без описания в fast_fields не поддерживается.
+"""
+from functools import lru_cache
+
+from rest_framework import serializers
+
+CHILDREN_BATCH_SIZE = 500
+
+
+class UnsupportedField(TypeError):
+    """Поле сериализатора нельзя вычислить из .values()"""
+
+
+class CompiledSerializer:
+    def __init__(self, serializer):
+        self.model = serializer.Meta.model
+        self.columns = []
+        self.children = []  # (row_key, CompiledSerializer, fk_name)
+        self._namespace = {}
+        self._temp_count = 0
+        self._child_refs = set()
+        body = self._compile(serializer, prefix='')
+        missing = self._child_refs - {key for key, _, _ in self.children}
+        if missing:
+            raise UnsupportedField(f'{self.model.__name__}: fast_fields ссылаются на отсутствующие поля {sorted(missing)}')
+        if self.children and 'id' not in self.columns:
+            self.columns.append('id')
+        source = f'def build(row):\n    return {body}\n'
+        exec(compile(source, f'<fast {serializer.__class__.__name__}>', 'exec'), self._namespace)
+        self.build = self._namespace['build']
+        self.source = source
+
+    def _bind(self, value):
+        name = f'_v{len(self._namespace)}'
+        self._namespace[name] = value
+        return name
+
+    def _column(self, path):
+        if path not in self.columns:
+            self.columns.append(path)
+        return f'row[{path!r}]'
+
+    def _compile(self, serializer, prefix):
+        model = serializer.Meta.model
+        hints = getattr(serializer, 'fast_fields', {})
+        items = []
+        for field in serializer._readable_fields:
+            name = field.field_name
+            items.append(f'{name!r}: {self._compile_field(model, field, hints.get(name), prefix)}')
+        return '{' + ', '.join(items) + '}'
+
+    def _compile_field(self, model, field, hint, prefix):
+        if hint is not None:
+            columns, func = hint
+            args = []
+            for column in columns:
+                if not prefix and '__' not in column and model._meta.get_field(column).one_to_many:
+                    # Сырые строки many-поля того же сериализатора
+                    child_key = f'__children:{column}'
+                    self._child_refs.add(child_key)
+                    args.append(f'row[{child_key!r}]')
+                else:
+                    args.append(self._column(prefix + column))
+            value = f'{self._bind(func)}({", ".join(args)})'
+            return self._none_or(value, self._bind(field.to_representation), nullable=True)
+
+        if field.source == '*' or '.' in field.source.replace('.all', ''):
+            raise UnsupportedField(f'{model.__name__}.{field.field_name}: source={field.source!r}')
+        source = field.source.replace('.all', '')
+
+        if isinstance(field, serializers.ListSerializer):
+            if prefix:
+                raise UnsupportedField(f'{model.__name__}.{field.field_name}: many внутри вложенного сериализатора')
+            relation = model._meta.get_field(source)
+            child = CompiledSerializer(field.child)
+            row_key = f'__children:{source}'
+            self.children.append((row_key, child, relation.field.name))
+            builder = self._bind(child.build)
+            return f'[{builder}(r) for r in row[{row_key!r}]]'
+
+        if isinstance(field, serializers.BaseSerializer):
+            relation = model._meta.get_field(source)
+            key = self._column(prefix + source)
+            nested = self._compile(field, prefix=f'{prefix}{source}__')
+            return f'(None if {key} is None else {nested})' if relation.null else nested
+
+        if isinstance(field, serializers.SerializerMethodField):
+            raise UnsupportedField(f'{model.__name__}.{field.field_name}: SerializerMethodField без fast_fields')
+
+        try:
+            model_field = model._meta.get_field(source)
+        except Exception as e:
+            raise UnsupportedField(f'{model.__name__}.{field.field_name}: {source!r} не колонка модели') from e
+        key = self._column(prefix + source)
+        if isinstance(field, (serializers.RelatedField, serializers.ReadOnlyField)):
+            # values() отдает id связи; ReadOnlyField возвращает значение как есть
+            return key
+        # Вложенные по FK колонки могут быть NULL из-за LEFT JOIN, но до них
+        # доходим только при непустом FK, поэтому достаточно флага null поля
+        return self._none_or(key, self._bind(field.to_representation), nullable=model_field.null)
+
+    def _none_or(self, value, converter, nullable):
+        if not nullable:
+            return f'{converter}({value})'
+        # Как и DRF, для None не вызываем to_representation
+        self._temp_count += 1
+        temp = f'_t{self._temp_count}'
+        return f'(None if ({temp} := {value}) is None else {converter}({temp}))'
+
+    def values(self, queryset, extra=()):
+        """values()-queryset с колонками плана (+ extra, например ключ пагинации)"""
+        return queryset.values(*self.columns, *[c for c in extra if c not in self.columns])
+
+    def attach_children(self, rows):
+        if not self.children:
+            return rows
+        ids = [row['id'] for row in rows]
+        for row_key, child, fk_name in self.children:
+            groups = {}
+            for start in range(0, len(ids), CHILDREN_BATCH_SIZE):
+                batch = ids[start:start + CHILDREN_BATCH_SIZE]
+                child_rows = child.values(child.model.objects.filter(**{f'{fk_name}__in': batch}), extra=(fk_name,)).order_by('pk')
+                for child_row in child.attach_children(list(child_rows)):
+                    groups.setdefault(child_row[fk_name], []).append(child_row)
+            for row in rows:
+                row[row_key] = groups.get(row['id'], [])
+        return rows
+
+    def serialize_rows(self, rows):
+        rows = self.attach_children(list(rows))
+        build = self.build
+        return [build(row) for row in rows]
+
+    def serialize(self, queryset):
+        return self.serialize_rows(self.values(queryset))
+
+
+@lru_cache(maxsize=64)
+def _compile_cached(serializer_class, fields):
+    kwargs = {'fields': list(fields)} if fields else {}
+    return CompiledSerializer(serializer_class(**kwargs))
+
+
+def compile_serializer(serializer_class, fields=None):
+    """Скомпилированный план для класса сериализатора (и набора ?fields=), кэшируется"""
+    return _compile_cached(serializer_class, tuple(fields) if fields else None)
@@ -0,0 +1,151 @@
+"""
+Корзины неавторизованных посетителей в кэше Django.
+
+Посетитель получает подписанный токен (поле guest_token в ответе корзины) и
+передает его в заголовке X-Guest-Cart. Содержимое корзины - {product_id: quantity}
+под ключом guest-cart:<id> с TTL GUEST_CART_TTL, который продлевается при
+каждой записи. В основную базу гостевая корзина попадает только при входе
+или регистрации (merge_into_user) - одним пакетом через api.carts.
+
+Запись идет по схеме "прочитать-изменить-записать" в кэше, поэтому два
+одновременных запроса одного гостя могут перетереть друг друга; для гостевой
+корзины это допустимо. Размер записи в кэше ограничен: не больше
+GUEST_CART_MAX_LINES товаров и CART_MAX_QUANTITY штук каждого.
+"""
+import logging
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db import transaction
+
+from .carts import CartOperationError, apply_operations as apply_db_operations, fold_operations, max_quantity
+from .fastserialize import compile_serializer
+from .models import Cart, Product
+from .serializers import CartProductSerializer, format_money
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_X_GUEST_CART'
+SALT = 'api.guest-cart'
+KEY_PREFIX = 'guest-cart'
+
+
+def _cache():
+    return caches[getattr(settings, 'GUEST_CART_CACHE_ALIAS', 'default')]
+
+
+def _ttl():
+    return getattr(settings, 'GUEST_CART_TTL', 7 * 24 * 60 * 60)
+
+
+def max_lines():
+    return getattr(settings, 'GUEST_CART_MAX_LINES', 100)
+
+
+def _key(cart_id):
+    return f'{KEY_PREFIX}:{cart_id}'
+
+
+def resolve(request, create=False):
+    """
+    (токен, id корзины) из заголовка X-Guest-Cart. Без заголовка или с неверной
+    подписью - (None, None), либо новый токен при create=True.
+    """
+    token = request.META.get(HEADER)
+    if token:
+        try:
+            return token, signing.Signer(salt=SALT).unsign(token)
+        except signing.BadSignature:
+            pass
+    if not create:
+        return None, None
+    cart_id = uuid.uuid4().hex
+    return signing.Signer(salt=SALT).sign(cart_id), cart_id
+
+
+def load(cart_id):
+    if cart_id is None:
+        return {}
+    return _cache().get(_key(cart_id)) or {}
+
+
+def apply_operations(cart_id, operations):
+    """
+    Применяет операции (см. api.carts.parse_operations) и возвращает новое содержимое.
+    Бросает CartOperationError, если товаров стало бы больше max_lines().
+    """
+    items = load(cart_id)
+    lines_before = len(items)
+    for product_id, (action, quantity) in fold_operations(operations).items():
+        if action == 'remove':
+            items.pop(product_id, None)
+        elif action == 'set':
+            items[product_id] = quantity
+        else:
+            items[product_id] = min(items.get(product_id, 0) + quantity, max_quantity())
+    if len(items) > max(max_lines(), lines_before):
+        raise CartOperationError(f'В корзине может быть не больше {max_lines()} товаров')
+    if items:
+        _cache().set(_key(cart_id), items, _ttl())
+    else:
+        _cache().delete(_key(cart_id))
+    return items
+
+
+def cart_payload(token, items):
+    """
+    Тот же формат, что у api.carts.compact_cart_payload, плюс guest_token.
+    id строки = id товара (у гостевых строк нет своих id). Один запрос к
+    товарам; удаленные из каталога товары пропускаются.
+    """
+    compiled = compile_serializer(CartProductSerializer)
+    rows = {}
+    if items:
+        rows = {row['id']: row for row in compiled.values(Product.objects.filter(id__in=list(items)))}
+    lines = []
+    total_price = 0
+    total_items = 0
+    for product_id, quantity in items.items():
+        row = rows.get(product_id)
+        if row is None:
+            continue
+        line_price = quantity * row['price']
+        lines.append({
+            "id": product_id,
+            "product": compiled.build(row),
+            "quantity": quantity,
+            "total_price": format_money(line_price),
+        })
+        total_price += line_price
+        total_items += quantity
+    return {
+        "id": None,
+        "guest_token": token,
+        "items": lines,
+        "total_price": format_money(total_price),
+        "total_items": total_items,
+    }
+
+
+def merge_into_user(request, user):
+    """
+    Переносит гостевую корзину из заголовка запроса в корзину пользователя:
+    количества складываются с уже лежащими в базе. Ошибка переноса не должна
+    мешать входу, поэтому она только логируется.
+    """
+    _, cart_id = resolve(request)
+    items = load(cart_id)
+    if not items:
+        return
+    try:
+        existing = set(Product.objects.filter(id__in=list(items)).values_list('id', flat=True))
+        operations = [('add', product_id, quantity) for product_id, quantity in items.items() if product_id in existing]
+        if operations:
+            with transaction.atomic():
+                cart, created = Cart.objects.get_or_create(user=user)
+                apply_db_operations(cart.id, operations)
+        _cache().delete(_key(cart_id))
+    except Exception:
+        logger.exception("Failed to merge guest cart %s into user %s", cart_id, user.pk)
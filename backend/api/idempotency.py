@@ -0,0 +1,108 @@
+"""
+Идемпотентные POST-запросы по заголовку Idempotency-Key.
+
+Первый запрос с ключом выполняется в одной транзакции с записью
+IdempotencyRecord, поэтому ответ сохраняется вместе с результатом (заказом,
+строкой корзины) или не сохраняется вовсе. Повтор с тем же ключом получает
+сохраненный ответ без повторного выполнения вью. Параллельный повтор в
+PostgreSQL ждет на уникальном индексе (owner, key) коммита первого запроса и
+тоже получает его ответ. Ключи живут IDEMPOTENCY_KEY_TTL секунд; устаревшие
+записи удаляет команда purge_idempotency_keys.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from . import guest_carts
+from .models import IdempotencyRecord
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+
+
+def expired_before():
+    return timezone.now() - timedelta(seconds=ttl())
+
+
+def _owner(request):
+    """Ключи разных пользователей (и гостевых корзин) не пересекаются"""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    _, guest_cart_id = guest_carts.resolve(request)
+    return f'guest:{guest_cart_id}' if guest_cart_id else None
+
+
+def _request_hash(request):
+    payload = json.dumps([request.method, request.path, request.data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _replay(record, request_hash):
+    if record is None:
+        return Response({"error": "Запрос с этим Idempotency-Key еще выполняется, повторите позже"},
+                       status=status.HTTP_409_CONFLICT)
+    if record.request_hash != request_hash:
+        return Response({"error": "Idempotency-Key уже использован для другого запроса"},
+                       status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Декоратор POST-вью; ставится под @api_view/@permission_classes.
+    Сохраняются ответы со статусом < 500; ошибки сервера и исключения
+    откатываются вместе с записью ключа, и повтор выполнит вью заново.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if request.method != 'POST' or not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({"error": f"{HEADER} длиннее {MAX_KEY_LENGTH} символов"}, status=status.HTTP_400_BAD_REQUEST)
+        owner = _owner(request)
+        if owner is None:
+            # Гость без корзины: повтор все равно создаст новую корзину
+            return view(request, *args, **kwargs)
+
+        request_hash = _request_hash(request)
+        records = IdempotencyRecord.objects.filter(owner=owner, key=key)
+        cutoff = expired_before()
+        record = records.filter(created_at__gte=cutoff).first()
+        if record is not None:
+            return _replay(record, request_hash)
+
+        with transaction.atomic():
+            records.filter(created_at__lt=cutoff).delete()
+            try:
+                with transaction.atomic():
+                    record = IdempotencyRecord.objects.create(owner=owner, key=key, request_hash=request_hash)
+            except IntegrityError:
+                # Параллельный запрос с тем же ключом успел закоммитить ответ
+                return _replay(records.first(), request_hash)
+
+            response = view(request, *args, **kwargs)
+            if response.status_code >= 500:
+                # Откатываем и запись ключа, и то, что вью успело записать до ошибки
+                transaction.set_rollback(True)
+            else:
+                record.status_code = response.status_code
+                # Храним ровно то, что получил клиент (JSONRenderer сам приводит Decimal и даты)
+                record.response_body = json.loads(JSONRenderer().render(response.data) or b'null')
+                record.save(update_fields=['status_code', 'response_body'])
+        return response
+    return wrapped
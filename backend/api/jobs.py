@@ -0,0 +1,171 @@
+"""
+Очередь фоновых задач в таблице Job.
+
+Задача - функция, зарегистрированная декоратором @task('имя'); enqueue()
+кладет в очередь строку с аргументами (payload). Вызов в транзакции запроса
+делает постановку атомарной: задача появится только вместе с заказом,
+сообщением и т.п. Выполняют задачи процессы команды run_workers:
+- выборка: SELECT ... FOR UPDATE SKIP LOCKED (PostgreSQL), воркеры не ждут
+  друг друга; без SKIP LOCKED (SQLite) - условный UPDATE с токеном захвата;
+- ошибка: повтор с экспоненциальной задержкой и разбросом, после max_attempts
+  задача остается в статусе failed с текстом ошибки;
+- задачи упавшего воркера возвращаются в очередь через JOB_LOCK_TIMEOUT.
+Гарантия - "хотя бы один раз", поэтому задачи должны быть идемпотентными.
+"""
+import logging
+import random
+import traceback
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, Min, Q, Value, When
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def task(name):
+    """Регистрирует функцию как задачу; аргументы передаются из payload по имени"""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=None):
+    if name not in _registry:
+        raise KeyError(f'Неизвестная задача: {name}')
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or _setting('JOB_MAX_ATTEMPTS', 5),
+    )
+
+
+def enqueue_many(name, payloads, delay=0, max_attempts=None):
+    """Ставит в очередь задачу name для каждого payload одним INSERT"""
+    if name not in _registry:
+        raise KeyError(f'Неизвестная задача: {name}')
+    run_at = timezone.now() + timedelta(seconds=delay)
+    max_attempts = max_attempts or _setting('JOB_MAX_ATTEMPTS', 5)
+    return Job.objects.bulk_create([
+        Job(name=name, payload=payload, run_at=run_at, max_attempts=max_attempts) for payload in payloads
+    ])
+
+
+def retry_delay(attempts):
+    """Задержка перед повтором: base * 2^(n-1), не больше max, с разбросом +-20%"""
+    base = _setting('JOB_RETRY_BASE_DELAY', 10)
+    delay = min(base * 2 ** (attempts - 1), _setting('JOB_RETRY_MAX_DELAY', 3600))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def requeue_stale():
+    """
+    Возвращает в очередь задачи, захваченные воркером, который не отчитался за
+    JOB_LOCK_TIMEOUT. Зависшая попытка считается неудачной: исчерпавшая
+    max_attempts задача переходит в failed, а не крутится в очереди бесконечно.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=_setting('JOB_LOCK_TIMEOUT', 600))
+    exhausted = Q(attempts__gte=F('max_attempts') - 1)
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Case(When(exhausted, then=Value(Job.FAILED)), default=Value(Job.QUEUED)),
+        finished_at=Case(When(exhausted, then=Value(now)), default=None),
+        locked_by='', locked_at=None, attempts=F('attempts') + 1,
+        last_error='Воркер не завершил задачу за JOB_LOCK_TIMEOUT',
+    )
+
+
+def purge_finished():
+    """Удаляет выполненные задачи старше JOB_KEEP_FINISHED (failed остаются для разбора)"""
+    cutoff = timezone.now() - timedelta(seconds=_setting('JOB_KEEP_FINISHED', 7 * 24 * 60 * 60))
+    count, _ = Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff).delete()
+    return count
+
+
+def queue_stats(window=60):
+    """Глубина очереди по статусам, задержка самой старой готовой задачи и пропускная способность за window секунд"""
+    now = timezone.now()
+    counts = {status: 0 for status, _ in Job.STATUS_CHOICES}
+    counts.update(Job.objects.order_by().values_list('status').annotate(n=Count('id')))
+    oldest = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).aggregate(oldest=Min('run_at'))['oldest']
+    done = Job.objects.filter(status=Job.DONE, finished_at__gte=now - timedelta(seconds=window)).count()
+    return {
+        'counts': counts,
+        'oldest_ready_age': round((now - oldest).total_seconds(), 1) if oldest else 0,
+        'window': window,
+        'done_per_second': round(done / window, 2),
+    }
+
+
+class Worker:
+    def __init__(self, name=None, batch_size=10):
+        self.name = name or f'worker-{uuid.uuid4().hex[:8]}'
+        self.batch_size = batch_size
+
+    def claim(self):
+        """Захватывает до batch_size готовых задач и переводит их в running"""
+        now = timezone.now()
+        ready = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            with transaction.atomic():
+                jobs = list(ready.select_for_update(skip_locked=True)[:self.batch_size])
+                if jobs:
+                    Job.objects.filter(id__in=[job.id for job in jobs]).update(
+                        status=Job.RUNNING, locked_by=self.name, locked_at=now,
+                    )
+            return jobs
+        # Без SKIP LOCKED: кто первым сменил статус, тот и забрал задачу
+        token = f'{self.name}:{uuid.uuid4().hex[:8]}'
+        ids = list(ready.values_list('id', flat=True)[:self.batch_size])
+        if not ids:
+            return []
+        Job.objects.filter(id__in=ids, status=Job.QUEUED).update(status=Job.RUNNING, locked_by=token, locked_at=now)
+        return list(Job.objects.filter(status=Job.RUNNING, locked_by=token).order_by('run_at', 'id'))
+
+    def execute(self, job):
+        """Выполняет захваченную задачу; возвращает 'done', 'retried' или 'failed'"""
+        attempts = job.attempts + 1
+        try:
+            handler = _registry.get(job.name)
+            if handler is None:
+                raise KeyError(f'Неизвестная задача: {job.name}')
+            handler(**job.payload)
+        except Exception:
+            error = traceback.format_exc()
+            logger.warning("Job %s #%s failed (attempt %s/%s)", job.name, job.id, attempts, job.max_attempts, exc_info=True)
+            if attempts >= job.max_attempts:
+                Job.objects.filter(id=job.id).update(
+                    status=Job.FAILED, attempts=attempts, last_error=error, locked_by='', locked_at=None,
+                    finished_at=timezone.now(),
+                )
+                return 'failed'
+            Job.objects.filter(id=job.id).update(
+                status=Job.QUEUED, attempts=attempts, last_error=error, locked_by='', locked_at=None,
+                run_at=timezone.now() + timedelta(seconds=retry_delay(attempts)),
+            )
+            return 'retried'
+        Job.objects.filter(id=job.id).update(
+            status=Job.DONE, attempts=attempts, locked_by='', locked_at=None, finished_at=timezone.now(),
+        )
+        return 'done'
+
+    def run_batch(self):
+        """Один цикл: захват и выполнение; Counter исходов (пустой - очередь пуста)"""
+        outcomes = Counter()
+        for job in self.claim():
+            outcomes[self.execute(job)] += 1
+        return outcomes
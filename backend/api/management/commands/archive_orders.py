@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Переносит доставленные и отмененные заказы старше --days дней в архивные таблицы пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='Возраст заказа в днях')
+        parser.add_argument('--batch-size', type=int, default=500, help='Заказов в одной транзакции')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--days не может быть отрицательным, --batch-size должен быть положительным')
+        started = time.monotonic()
+
+        def progress(orders, items):
+            self.stdout.write(f'Перенесено заказов: {orders}, позиций: {items}')
+
+        orders, items, skipped = archive_orders(options['days'], options['batch_size'], progress=progress)
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f'Пропущено заказов: {skipped} - их вклад в сводки продаж еще не соответствует статусу. '
+                f'Нужны работающие run_workers или rebuild_sales_rollups'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово! Перенесено заказов: {orders}, позиций: {items} за {time.monotonic() - started:.1f} с'
+        ))
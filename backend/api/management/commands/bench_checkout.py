@@ -0,0 +1,142 @@
+import queue
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import Cart, CartItem, OrderItem, Product
+from api.views import create_order_view
+
+ORDER_DATA = {
+    'first_name': 'Иван', 'last_name': 'Иванов', 'email': 'bench@example.com',
+    'phone': '+375291234567', 'address': 'ул. Тестовая, 1', 'city': 'Минск',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Параллельное оформление заказов на товары с ограниченным остатком: '
+        'проверяет отсутствие перепродажи и считает заказы в секунду'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--buyers', type=int, default=200, help='Сколько покупателей оформляют заказ')
+        parser.add_argument('--products', type=int, default=1)
+        parser.add_argument('--stock', type=int, default=100, help='Начальный остаток каждого товара')
+        parser.add_argument('--quantity', type=int, default=1, help='Количество товара в каждой корзине')
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные данные')
+
+    def handle(self, *args, **options):
+        if min(options['threads'], options['buyers'], options['products'], options['quantity']) < 1:
+            raise CommandError('--threads, --buyers, --products и --quantity должны быть положительными')
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite блокирует базу целиком на запись: ошибки "database is locked" ожидаемы, '
+                'реалистичные цифры - на PostgreSQL'
+            ))
+        # Потоки работают в своих соединениях, поэтому данные коммитим и удаляем в конце
+        tag = uuid.uuid4().hex[:8]
+        products, users = self._populate(tag, options)
+        try:
+            results, latencies, elapsed, errors = self._run(users, options['threads'])
+            self._report(products, options, results, latencies, elapsed, errors)
+        finally:
+            if not options['keep']:
+                User.objects.filter(id__in=[user.id for user in users]).delete()
+                Product.objects.filter(id__in=[product.id for product in products]).delete()
+
+    def _populate(self, tag, options):
+        products = Product.objects.bulk_create([
+            Product(name=f'Bench checkout {tag} {i}', slug=f'bench-checkout-{tag}-{i}', description='',
+                    price='9.99', stock=options['stock'])
+            for i in range(options['products'])
+        ])
+        users = User.objects.bulk_create([
+            User(username=f'bench-checkout-{tag}-{i}', password='!') for i in range(options['buyers'])
+        ])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=products[i % len(products)], quantity=options['quantity'])
+            for i, cart in enumerate(carts)
+        ])
+        return products, users
+
+    def _run(self, users, threads):
+        factory = APIRequestFactory()
+        tasks = queue.Queue()
+        for user in users:
+            tasks.put(user)
+        results = Counter()
+        latencies = []
+        errors = Counter()
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        user = tasks.get_nowait()
+                    except queue.Empty:
+                        return
+                    request = factory.post('/api/orders/create/', ORDER_DATA, format='json')
+                    force_authenticate(request, user=user)
+                    start = time.perf_counter()
+                    try:
+                        outcome = create_order_view(request).status_code
+                    except Exception as e:
+                        outcome = 'error'
+                        with lock:
+                            errors[f'{type(e).__name__}: {e}'] += 1
+                    with lock:
+                        results[outcome] += 1
+                        latencies.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return results, latencies, time.perf_counter() - start, errors
+
+    def _report(self, products, options, results, latencies, elapsed, errors):
+        sold = dict(
+            OrderItem.objects.filter(product__in=products).values('product_id')
+            .annotate(total=Sum('quantity')).values_list('product_id', 'total')
+        )
+        remaining = dict(Product.objects.filter(id__in=[p.id for p in products]).values_list('id', 'stock'))
+        oversold = [
+            product.id for product in products
+            if sold.get(product.id, 0) + remaining[product.id] != options['stock'] or sold.get(product.id, 0) > options['stock']
+        ]
+
+        created = results[201]
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+        p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0
+        self.stdout.write(
+            f'Покупателей: {options["buyers"]}, потоков: {options["threads"]}, '
+            f'товаров: {options["products"]} x {options["stock"]} шт.'
+        )
+        self.stdout.write(
+            f'Заказов: {created}, отказов "нет на складе": {results[409]}, ошибок: {results["error"]}, '
+            f'прочих ответов: {sum(n for code, n in results.items() if code not in (201, 409, "error"))}'
+        )
+        self.stdout.write(
+            f'Время: {elapsed:.2f} с, {created / elapsed:.1f} заказов/с, '
+            f'задержка p50 {p50:.1f} мс, p95 {p95:.1f} мс'
+        )
+        for message, count in errors.most_common(3):
+            self.stdout.write(self.style.WARNING(f'  {count} x {message}'))
+        if oversold:
+            raise CommandError(f'Перепродажа или потеря остатка по товарам: {oversold}')
+        self.stdout.write(self.style.SUCCESS('Перепродаж нет: продано + остаток = начальный остаток по каждому товару'))
@@ -0,0 +1,83 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.fastserialize import compile_serializer
+from api.models import Category, Order, OrderItem, Product
+from api.serializers import OrderSerializer, ProductListSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает DRF-сериализацию и быстрый путь api.fastserialize (скорость и идентичность JSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help='Сколько синтетических товаров создать')
+        parser.add_argument('--orders', type=int, default=500, help='Сколько синтетических заказов создать')
+        parser.add_argument('--items', type=int, default=5, help='Позиций в заказе')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # Синтетические данные создаем в транзакции и откатываем после замеров
+        try:
+            with transaction.atomic():
+                self._populate(options)
+                self._bench('products', Product.objects.select_related('category').order_by('-created_at', 'id'),
+                            ProductListSerializer, options['repeat'])
+                self._bench('orders', Order.objects.order_by('-created_at'), OrderSerializer, options['repeat'],
+                            slow_queryset=Order.objects.select_related('payment_card').prefetch_related('items__product').order_by('-created_at'))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _populate(self, options):
+        category = Category.objects.create(name='bench-category', slug='bench-category')
+        products = Product.objects.bulk_create([
+            Product(name=f'Bench product {i}', slug=f'bench-product-{i}', description='Описание ' * 20,
+                    price='19.99', category=category if i % 2 else None,
+                    rating_sum=i % 50, review_count=i % 11)
+            for i in range(options['products'])
+        ])
+        if not products:
+            raise CommandError('Нужен хотя бы один товар')
+        user = User.objects.create_user(username='bench-user', password='bench-password')
+        orders = Order.objects.bulk_create([
+            Order(user=user, first_name='Иван', last_name='Иванов', email='bench@example.com', phone='1',
+                  address='ул. Тестовая, 1', city='Минск', total_price='99.95')
+            for _ in range(options['orders'])
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=products[(n + i) % len(products)], quantity=i + 1, price='19.99')
+            for n, order in enumerate(orders) for i in range(options['items'])
+        ])
+
+    def _bench(self, label, queryset, serializer_class, repeat, slow_queryset=None):
+        render = JSONRenderer().render
+        slow_queryset = slow_queryset if slow_queryset is not None else queryset
+
+        def slow():
+            return render(serializer_class(slow_queryset.all(), many=True).data)
+
+        def fast():
+            return render(compile_serializer(serializer_class).serialize(queryset.all()))
+
+        if slow() != fast():
+            raise CommandError(f'{label}: вывод быстрого пути отличается от DRF')
+        slow_time = min(self._time(slow) for _ in range(repeat))
+        fast_time = min(self._time(fast) for _ in range(repeat))
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: DRF {slow_time * 1000:.1f} мс, fast path {fast_time * 1000:.1f} мс, '
+            f'ускорение x{slow_time / fast_time:.1f} (JSON идентичен)'
+        ))
+
+    @staticmethod
+    def _time(func):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
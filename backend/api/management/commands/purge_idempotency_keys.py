@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.idempotency import expired_before
+from api.models import IdempotencyRecord
+
+
+class Command(BaseCommand):
+    help = 'Удаляет сохраненные ответы Idempotency-Key старше IDEMPOTENCY_KEY_TTL'
+
+    def handle(self, *args, **options):
+        count, _ = IdempotencyRecord.objects.filter(created_at__lt=expired_before()).delete()
+        self.stdout.write(self.style.SUCCESS(f'Готово! Удалено ключей: {count}'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.facets import refresh_facets
+from api.models import FacetCount
+
+
+class Command(BaseCommand):
+    help = 'Полностью пересчитывает счетчики фасетов по характеристикам товаров'
+
+    def handle(self, *args, **options):
+        refresh_facets()
+        self.stdout.write(self.style.SUCCESS(f'Готово! Значений фасетов: {FacetCount.objects.count()}'))
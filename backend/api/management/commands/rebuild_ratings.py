@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные рейтинги товаров по таблице отзывов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_ratings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Готово! Пересчитано товаров: {count}'))
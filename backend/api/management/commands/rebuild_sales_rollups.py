@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.models import SalesDay
+from api.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Полностью пересчитывает дневные сводки продаж (по дням, категориям и товарам) из заказов'
+
+    def handle(self, *args, **options):
+        rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Готово! Дней в сводке: {SalesDay.objects.count()}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.search import index_enabled, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс товаров (FTS5 / tsvector)'
+
+    def handle(self, *args, **options):
+        if not index_enabled():
+            self.stdout.write(self.style.WARNING('Поисковый индекс не поддерживается этой базой данных'))
+            return
+        with transaction.atomic():
+            count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Готово! Проиндексировано товаров: {count}'))
@@ -0,0 +1,129 @@
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api import jobs
+from api.models import Job
+
+# Как часто воркер возвращает в очередь задачи упавших воркеров и чистит выполненные
+MAINTENANCE_INTERVAL = 60
+
+
+def _work(name, options, stop, stats):
+    """Цикл одного воркера; stats(Counter) получает исходы задач после каждой пачки"""
+    worker = jobs.Worker(name=name, batch_size=options['batch_size'])
+    next_maintenance = 0
+    while not stop.is_set():
+        if time.monotonic() >= next_maintenance:
+            jobs.requeue_stale()
+            jobs.purge_finished()
+            next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+        outcomes = worker.run_batch()
+        if outcomes:
+            stats(outcomes)
+        elif options['once']:
+            break
+        else:
+            stop.wait(options['poll_interval'])
+
+
+def _process_main(name, options, stop, stats_queue):
+    # Останавливает родитель через stop; Ctrl+C в терминале приходит всей группе процессов
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    try:
+        _work(name, options, stop, lambda outcomes: stats_queue.put(dict(outcomes)))
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Запускает N процессов-воркеров очереди фоновых задач (api.jobs) и печатает пропускную способность'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Число процессов')
+        parser.add_argument('--batch-size', type=int, default=10, help='Сколько задач воркер захватывает за раз')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Пауза при пустой очереди, с')
+        parser.add_argument('--stats-interval', type=float, default=10.0, help='Как часто печатать метрики, с')
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и выйти')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers и --batch-size должны быть положительными')
+        self.totals = Counter()
+        self.reported = Counter()
+        self.started = self.last_report = time.monotonic()
+
+        if options['workers'] == 1:
+            # Один воркер - в текущем процессе (удобно для отладки)
+            stop = threading.Event()
+            self._handle_signals(stop)
+            _work('worker-1', options, stop, lambda outcomes: self._collect(outcomes, options))
+        else:
+            self._run_processes(options)
+        self._report(final=True)
+
+    def _run_processes(self, options):
+        # fork: дочерние процессы наследуют настроенный Django; соединения с базой не наследуем
+        context = multiprocessing.get_context('fork')
+        connections.close_all()
+        stop = context.Event()
+        stats_queue = context.Queue()
+        processes = [
+            context.Process(target=_process_main, args=(f'worker-{n}', options, stop, stats_queue), daemon=True)
+            for n in range(1, options['workers'] + 1)
+        ]
+        for process in processes:
+            process.start()
+        self._handle_signals(stop)
+        self.stdout.write(f'Запущено воркеров: {len(processes)}')
+        while any(process.is_alive() for process in processes) or not stats_queue.empty():
+            try:
+                self._collect(stats_queue.get(timeout=0.5), options)
+            except queue.Empty:
+                self._maybe_report(options)
+        for process in processes:
+            process.join()
+
+    def _handle_signals(self, stop):
+        def handler(signum, frame):
+            self.stdout.write('Останавливаем воркеры после текущих задач...')
+            stop.set()
+        signal.signal(signal.SIGINT, handler)
+        signal.signal(signal.SIGTERM, handler)
+
+    def _collect(self, outcomes, options):
+        self.totals.update(outcomes)
+        self._maybe_report(options)
+
+    def _maybe_report(self, options):
+        if time.monotonic() - self.last_report >= options['stats_interval']:
+            self._report()
+
+    def _report(self, final=False):
+        now = time.monotonic()
+        interval = max(now - self.last_report, 1e-9)
+        delta = self.totals - self.reported
+        processed = sum(self.totals.values())
+        if final:
+            elapsed = max(now - self.started, 1e-9)
+            line = (
+                f'Итого: задач {processed} за {elapsed:.1f} с ({processed / elapsed:.1f}/с), '
+                f'выполнено {self.totals["done"]}, повторов {self.totals["retried"]}, ошибок {self.totals["failed"]}'
+            )
+            self.stdout.write(self.style.SUCCESS(line))
+        else:
+            stats = jobs.queue_stats()
+            self.stdout.write(
+                f'{sum(delta.values()) / interval:.1f} задач/с за {interval:.1f} с '
+                f'(выполнено {delta["done"]}, повторов {delta["retried"]}, ошибок {delta["failed"]}); '
+                f'в очереди {stats["counts"][Job.QUEUED]}, задержка {stats["oldest_ready_age"]} с'
+            )
+        self.reported = Counter(self.totals)
+        self.last_report = now
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_alter_cart_id_alter_cartitem_id_alter_category_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at', 'id'], name='product_created_id_idx'),
+        ),
+    ]
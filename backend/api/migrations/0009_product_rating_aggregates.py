@@ -0,0 +1,64 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:39
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_ratings(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    Review = apps.get_model('api', 'Review')
+    stats = {}
+    for row in Review.objects.values('product_id', 'rating').annotate(n=Count('id')).order_by():
+        stats.setdefault(row['product_id'], {})[row['rating']] = row['n']
+    for product_id, counts in stats.items():
+        Product.objects.filter(pk=product_id).update(
+            rating_sum=sum(star * n for star, n in counts.items()),
+            review_count=sum(counts.values()),
+            **{f'rating_{star}_count': counts.get(star, 0) for star in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_product_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
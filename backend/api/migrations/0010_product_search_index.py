@@ -0,0 +1,69 @@
+from django.db import migrations
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE api_product_fts USING fts5("
+    "name, description, specs, tokenize = 'unicode61 remove_diacritics 2')",
+    """
+    INSERT INTO api_product_fts (rowid, name, description, specs)
+    SELECT p.id, p.name, p.description,
+           coalesce((SELECT group_concat(s.value, ' ') FROM api_productspecification s
+                     WHERE s.product_id = p.id), '')
+    FROM api_product p
+    """,
+]
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE api_product_search (
+        product_id integer PRIMARY KEY REFERENCES api_product (id) ON DELETE CASCADE,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX api_product_search_document_gin ON api_product_search USING gin (document)",
+    """
+    INSERT INTO api_product_search (product_id, document)
+    SELECT p.id,
+           setweight(to_tsvector('russian', p.name), 'A')
+           || setweight(to_tsvector('russian', coalesce(string_agg(s.value, ' '), '')), 'B')
+           || setweight(to_tsvector('russian', p.description), 'C')
+    FROM api_product p
+    LEFT JOIN api_productspecification s ON s.product_id = p.id
+    GROUP BY p.id
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_CREATE
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                # SQLite без FTS5 - api.search откатится на LIKE-поиск
+                return
+        statements = SQLITE_CREATE
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS api_product_search")
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS api_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:41
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_facets(apps, schema_editor):
+    FacetCount = apps.get_model('api', 'FacetCount')
+    ProductSpecification = apps.get_model('api', 'ProductSpecification')
+    rows = []
+    totals = defaultdict(int)
+    specs = ProductSpecification.objects.filter(product__in_stock=True)
+    for row in specs.values('name', 'value', 'product__category_id').annotate(n=Count('id')).order_by():
+        totals[(row['name'], row['value'])] += row['n']
+        if row['product__category_id'] is not None:
+            rows.append(FacetCount(category_id=row['product__category_id'], name=row['name'], value=row['value'], product_count=row['n']))
+    rows += [FacetCount(category_id=None, name=name, value=value, product_count=n) for (name, value), n in totals.items()]
+    FacetCount.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=200)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productspecification',
+            index=models.Index(fields=['name', 'value'], name='spec_name_value_idx'),
+        ),
+        migrations.AddField(
+            model_name='facetcount',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='api.category'),
+        ),
+        migrations.AddConstraint(
+            model_name='facetcount',
+            constraint=models.UniqueConstraint(fields=('category', 'name', 'value'), name='facetcount_category_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='facetcount',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('name', 'value'), name='facetcount_global_unique'),
+        ),
+        migrations.RunPython(backfill_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:52
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    # Старый add_to_cart мог создать дубли при параллельных запросах - складываем количества
+    CartItem = apps.get_model('api', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'product_id')
+        .annotate(n=Count('id'), keep_id=Min('id'), total=Sum('quantity'))
+        .filter(n__gt=1)
+        .order_by()
+    )
+    for row in duplicates:
+        CartItem.objects.filter(id=row['keep_id']).update(quantity=row['total'])
+        CartItem.objects.filter(cart_id=row['cart_id'], product_id=row['product_id']).exclude(id=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_review_helpful_and_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+    ]
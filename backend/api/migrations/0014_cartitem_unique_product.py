@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Отдельно от 0013: в PostgreSQL ALTER TABLE нельзя выполнить в транзакции,
+    # где уже удалялись строки с отложенными проверками внешних ключей
+
+    dependencies = [
+        ('api', '0013_merge_duplicate_cart_items'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='cartitem_cart_product_unique'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_idempotency_records'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='reserved',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stock',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_order_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.IntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='in_rollups',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='SalesCategoryDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.IntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='api.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'category'), name='salescategoryday_unique'), models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('date',), name='salescategoryday_none_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesProductDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.IntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='api.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'product'), name='salesproductday_unique')],
+            },
+        ),
+    ]
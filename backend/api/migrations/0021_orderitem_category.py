@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_categories(apps, schema_editor):
+    # Категория на момент прошлых заказов неизвестна - берем текущую категорию товара
+    Product = apps.get_model('api', 'Product')
+    category = Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('category_id')[:1])
+    for name in ('OrderItem', 'ArchivedOrderItem'):
+        apps.get_model('api', name).objects.update(category_id=category)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_order_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorderitem',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.category'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.category'),
+        ),
+        migrations.RunPython(backfill_categories, migrations.RunPython.noop),
+    ]
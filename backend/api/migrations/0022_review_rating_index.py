@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_orderitem_category'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', '-rating', '-id'], name='review_product_rating_idx'),
+        ),
+    ]
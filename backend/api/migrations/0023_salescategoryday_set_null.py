@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_review_rating_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='salescategoryday',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales_days', to='api.category'),
+        ),
+    ]
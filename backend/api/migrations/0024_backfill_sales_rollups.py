@@ -0,0 +1,56 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:20
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+
+
+def rebuild_sales_rollups(apps, schema_editor):
+    """
+    0019 добавила Order.in_rollups со значением False: заказы, оформленные до
+    нее, не попали ни в один отчет, а доставленные из них не архивируются.
+    Повторяет api.rollups.rebuild() на исторических моделях.
+    """
+    get = lambda name: apps.get_model('api', name)
+    for name in ('Order', 'ArchivedOrder'):
+        get(name).objects.update(in_rollups=Case(When(~Q(status='cancelled'), then=Value(True)), default=Value(False)))
+    for name in ('SalesDay', 'SalesCategoryDay', 'SalesProductDay'):
+        get(name).objects.all().delete()
+
+    aggregates = {
+        'revenue': Sum(F('quantity') * F('price'), output_field=models.DecimalField(max_digits=14, decimal_places=2)),
+        'units': Sum('quantity'),
+        'orders': Count('order_id', distinct=True),
+    }
+    for name, field in (('SalesDay', None), ('SalesCategoryDay', 'category_id'), ('SalesProductDay', 'product_id')):
+        rows = defaultdict(lambda: {'revenue': Decimal('0'), 'units': 0, 'orders': 0})
+        for item_name in ('OrderItem', 'ArchivedOrderItem'):
+            grouped = (
+                get(item_name).objects.filter(order__in_rollups=True)
+                .annotate(date=TruncDate('order__created_at'))
+                .values_list('date', *([field] if field else [])).order_by().annotate(**aggregates)
+            )
+            for *key, revenue, units, orders in grouped.iterator(chunk_size=1000):
+                totals = rows[tuple(key)]
+                totals['revenue'] += revenue
+                totals['units'] += units
+                totals['orders'] += orders
+        model = get(name)
+        model.objects.bulk_create(
+            [model(date=key[0], **({field: key[1]} if field else {}), **totals) for key, totals in rows.items()],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_salescategoryday_set_null'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_sales_rollups, migrations.RunPython.noop),
+    ]
@@ -21,12 +21,51 @@ class Product(models.Model):
     image_url = models.URLField(blank=True, null=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='products')
     in_stock = models.BooleanField(default=True)
+    # Остаток на складе; NULL - остаток не ведется. Резервируется при оформлении заказа (api.stock)
+    stock = models.PositiveIntegerField(null=True, blank=True)
+    # Денормализованные агрегаты отзывов, поддерживаются api.ratings
+    rating_sum = models.PositiveIntegerField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Если остаток ведется, наличие следует из него - как и при резерве в api.stock
+        if self.stock is not None:
+            self.in_stock = self.stock > 0
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'stock' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'in_stock'}
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def calculate_average_rating(rating_sum, review_count):
+        if not review_count:
+            return None
+        return round(rating_sum / review_count, 1)
+
+    @property
+    def average_rating(self):
+        return self.calculate_average_rating(self.rating_sum, self.review_count)
+
+    @property
+    def rating_histogram(self):
+        return {str(star): getattr(self, f'rating_{star}_count') for star in range(1, 6)}
+
+    class Meta:
+        indexes = [
+            # Ключ курсорной пагинации каталога: ORDER BY -created_at, id
+            models.Index(fields=['-created_at', 'id'], name='product_created_id_idx'),
+        ]
+
 class ProductSpecification(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='specifications')
     name = models.CharField(max_length=100)  # Название характеристики (например, "Размер", "Цвет", "Материал")
@@ -37,6 +76,26 @@ class ProductSpecification(models.Model):
 
     class Meta:
         unique_together = ['product', 'name']
+        indexes = [
+            models.Index(fields=['name', 'value'], name='spec_name_value_idx'),
+        ]
+
+class FacetCount(models.Model):
+    """Предрасчитанный счетчик фасета: сколько товаров в наличии имеют характеристику name=value.
+    category=None - счетчик по всему каталогу. Поддерживается api.facets."""
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='facet_counts')
+    name = models.CharField(max_length=100)
+    value = models.CharField(max_length=200)
+    product_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value} ({self.product_count})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'name', 'value'], name='facetcount_category_unique'),
+            models.UniqueConstraint(fields=['name', 'value'], condition=models.Q(category__isnull=True), name='facetcount_global_unique'),
+        ]
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -50,6 +109,12 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            # Одна строка на товар: на нее опираются upsert-операции корзины (api.carts)
+            models.UniqueConstraint(fields=['cart', 'product'], name='cartitem_cart_product_unique'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
@@ -110,12 +175,24 @@ class Order(models.Model):
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Заказ учтен в дневных сводках продаж (api.rollups); должно совпадать с status != 'cancelled'
+    in_rollups = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # История заказов пользователя: курсорная пагинация по (-created_at, -id)
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.user.username} - {self.status}"
 
     @property
     def total_items(self):
+        # OrderSerializer.setup_eager_loading считает сумму в SQL
+        annotated = getattr(self, 'annotated_total_items', None)
+        if annotated is not None:
+            return annotated
         return sum(item.quantity for item in self.items.all())
 
 class OrderItem(models.Model):
@@ -123,6 +200,9 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Цена на момент заказа
+    # Категория на момент заказа: по ней заказ учитывается в сводках продаж (api.rollups)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    reserved = models.BooleanField(default=False)  # Количество списано с Product.stock и вернется при отмене
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} (Order #{self.order.id})"
@@ -131,6 +211,62 @@ class OrderItem(models.Model):
     def total_price(self):
         return self.quantity * self.price
 
+class ArchivedOrder(models.Model):
+    """
+    Давний доставленный или отмененный заказ, перенесенный из Order командой
+    archive_orders (api.archive) с тем же id. Поля повторяют Order, поэтому
+    архив отдается теми же сериализаторами.
+    """
+    id = models.IntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    payment_method = models.CharField(max_length=20, choices=Order.PAYMENT_METHOD_CHOICES)
+    payment_card = models.ForeignKey(PaymentCard, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_orders')
+    first_name = models.CharField(max_length=100)
+    last_name = models.CharField(max_length=100)
+    email = models.EmailField()
+    phone = models.CharField(max_length=20)
+    address = models.TextField()
+    city = models.CharField(max_length=100)
+    postal_code = models.CharField(max_length=20, blank=True)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    in_rollups = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='archorder_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived order #{self.id} - {self.status}"
+
+    @property
+    def total_items(self):
+        annotated = getattr(self, 'annotated_total_items', None)
+        if annotated is not None:
+            return annotated
+        return sum(item.quantity for item in self.items.all())
+
+class ArchivedOrderItem(models.Model):
+    id = models.IntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='archived_order_items')
+    quantity = models.PositiveIntegerField(default=1)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    reserved = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} (Archived order #{self.order_id})"
+
+    @property
+    def total_price(self):
+        return self.quantity * self.price
+
 class Contact(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField()
@@ -154,12 +290,130 @@ class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     rating = models.IntegerField(choices=RATING_CHOICES)
     comment = models.TextField()
+    helpful_count = models.PositiveIntegerField(default=0)  # Сколько пользователей отметили отзыв полезным
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ['user', 'product']  # Один пользователь может оставить только один отзыв на товар
         ordering = ['-created_at']
+        indexes = [
+            # Курсорная пагинация отзывов товара: новые / самые полезные / с высокой оценкой
+            models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx'),
+            models.Index(fields=['product', '-helpful_count', '-id'], name='review_product_helpful_idx'),
+            models.Index(fields=['product', '-rating', '-id'], name='review_product_rating_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.product.name} - {self.rating} звезд"
+
+class ReviewVote(models.Model):
+    """Отметка "отзыв полезен" - не больше одной от пользователя"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='review_votes')
+    review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name='votes')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['user', 'review']
+
+    def __str__(self):
+        return f"{self.user.username} -> {self.review_id}"
+
+class IdempotencyRecord(models.Model):
+    """Сохраненный ответ на запрос с заголовком Idempotency-Key (см. api.idempotency)"""
+    owner = models.CharField(max_length=64)  # user:<id> или guest:<id гостевой корзины>
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)  # sha256 метода, пути и тела запроса
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'key'], name='idempotency_owner_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner} {self.key} -> {self.status_code}"
+
+class Job(models.Model):
+    """Фоновая задача (см. api.jobs); выполняется командой run_workers"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()  # Не раньше этого времени (отложенный запуск и backoff)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Выборка готовых к запуску: WHERE status = 'queued' AND run_at <= now ORDER BY run_at
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+            models.Index(fields=['status', 'finished_at'], name='job_status_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+class SalesDay(models.Model):
+    """Сводка продаж за день (без отмененных заказов). Поддерживается api.rollups"""
+    date = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date}: {self.revenue} ({self.orders})"
+
+class SalesCategoryDay(models.Model):
+    """Продажи категории за день; category=None - товары без категории. orders - заказы с товарами категории"""
+    date = models.DateField()
+    # Удаленная категория переходит в None, как и в позициях заказов (см. api.rollups.forget_category)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='sales_days')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category'], name='salescategoryday_unique'),
+            models.UniqueConstraint(fields=['date'], condition=models.Q(category__isnull=True), name='salescategoryday_none_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.category_id}: {self.revenue}"
+
+class SalesProductDay(models.Model):
+    """Продажи товара за день"""
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_days')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='salesproductday_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.product_id}: {self.revenue}"
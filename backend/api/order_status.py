@@ -0,0 +1,61 @@
+"""
+Смена статуса заказов администратором - одного или пачкой.
+
+Строки заказов блокируются SELECT ... FOR UPDATE в порядке id, допустимые
+переходы применяются одним UPDATE. Побочные эффекты отмены выполняются
+пачками: резерв товара возвращается тремя запросами (stock.release_orders),
+задачи пересчета сводок (api.rollups) ставятся одним INSERT.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import enqueue_many
+from .models import Order
+from .stock import release_orders
+
+CANCELLED = 'cancelled'
+
+
+def max_orders():
+    return getattr(settings, 'ORDER_STATUS_BATCH_MAX', 500)
+
+
+def transition_error(current, new_status):
+    """Текст ошибки, если переход current -> new_status запрещен, иначе None"""
+    if current == CANCELLED and new_status != CANCELLED:
+        return "Отмененный заказ нельзя вернуть в работу: резерв товара уже снят"
+    return None
+
+
+def change_status(order_ids, new_status):
+    """
+    Переводит заказы в new_status (статус уже проверен вызывающим). Сводка:
+    {"status", "updated": [id], "unchanged": [id], "rejected": [{"id", "error"}], "not_found": [id]}
+    """
+    order_ids = sorted(set(order_ids))
+    updated, unchanged, rejected = [], [], []
+    with transaction.atomic():
+        current = dict(
+            Order.objects.filter(id__in=order_ids).order_by('id').select_for_update().values_list('id', 'status')
+        )
+        for order_id, status in current.items():
+            error = transition_error(status, new_status)
+            if status == new_status:
+                unchanged.append(order_id)
+            elif error:
+                rejected.append({"id": order_id, "error": error})
+            else:
+                updated.append(order_id)
+        if updated:
+            Order.objects.filter(id__in=updated).update(status=new_status, updated_at=timezone.now())
+            if new_status == CANCELLED:
+                release_orders(updated)
+                enqueue_many('rollups.sync_order', [{'order_id': order_id} for order_id in updated])
+    return {
+        "status": new_status,
+        "updated": updated,
+        "unchanged": unchanged,
+        "rejected": rejected,
+        "not_found": [order_id for order_id in order_ids if order_id not in current],
+    }
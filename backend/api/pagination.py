@@ -0,0 +1,121 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+
+
+# Сортировка списков по умолчанию: новые первыми, id - для уникальности ключа
+DEFAULT_ORDERING = ('-created_at', 'id')
+
+
+class InvalidCursor(ValueError):
+    """Курсор не удалось декодировать или он не соответствует сортировке"""
+
+
+def get_page_size(request, default=None):
+    """Размер страницы из ?page_size=, ограниченный API_MAX_PAGE_SIZE"""
+    default = default or getattr(settings, 'API_PAGE_SIZE', 24)
+    max_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+    try:
+        size = int(request.query_params.get('page_size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, max_size))
+
+
+def _split_ordering(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def ordering_fields(ordering):
+    """Колонки ключа сортировки: их нужно выбрать в .values(), чтобы построить курсор"""
+    return tuple(name for name, _ in _split_ordering(ordering))
+
+
+def encode_cursor(obj, ordering):
+    """Непрозрачный курсор из значений полей сортировки последней строки (модель или dict из .values())"""
+    values = []
+    for name, _ in _split_ordering(ordering):
+        value = obj[name] if isinstance(obj, dict) else getattr(obj, name)
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    fields = _split_ordering(ordering)
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise InvalidCursor(cursor)
+        return [
+            model._meta.get_field(name).to_python(value)
+            for (name, _), value in zip(fields, values)
+        ]
+    except InvalidCursor:
+        raise
+    except Exception as e:
+        raise InvalidCursor(cursor) from e
+
+
+def keyset_filter(ordering, values):
+    """
+    Условие "строго после курсора" для составного ключа сортировки.
+    Для (-created_at, id): created_at < c OR (created_at = c AND id > i).
+    В отличие от OFFSET, стоимость не растет с номером страницы - база
+    сразу переходит к нужному месту индекса.
+    """
+    fields = _split_ordering(ordering)
+    condition = Q()
+    for i, (name, descending) in enumerate(fields):
+        step = Q(**{f'{name}__{"lt" if descending else "gt"}': values[i]})
+        for j in range(i):
+            step &= Q(**{fields[j][0]: values[j]})
+        condition |= step
+    return condition
+
+
+def _keyset_slice(queryset, cursor, ordering, limit):
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor, queryset.model, ordering)
+        queryset = queryset.filter(keyset_filter(ordering, values))
+    return list(queryset[:limit])
+
+
+def _page(rows, page_size, ordering):
+    # Берем на одну строку больше, чтобы понять, есть ли следующая страница
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1], ordering)
+    return rows, next_cursor
+
+
+def paginate_keyset(queryset, request, ordering=DEFAULT_ORDERING, page_size=None):
+    """
+    Возвращает (список объектов страницы, курсор следующей страницы или None).
+    Бросает InvalidCursor, если ?cursor= поврежден.
+    """
+    page_size = page_size or get_page_size(request)
+    rows = _keyset_slice(queryset, request.query_params.get('cursor'), ordering, page_size + 1)
+    return _page(rows, page_size, ordering)
+
+
+def paginate_keyset_merged(querysets, request, ordering=DEFAULT_ORDERING, page_size=None):
+    """
+    То же по нескольким таблицам с одинаковыми полями сортировки (заказы и
+    их архив): из каждой берется страница после курсора, страницы сливаются.
+    Ключ сортировки не должен повторяться в разных таблицах.
+    """
+    page_size = page_size or get_page_size(request)
+    cursor = request.query_params.get('cursor')
+    rows = []
+    for queryset in querysets:
+        rows += _keyset_slice(queryset, cursor, ordering, page_size + 1)
+    # Устойчивая сортировка от младшего поля к старшему
+    for name, descending in reversed(_split_ordering(ordering)):
+        rows.sort(key=lambda obj: getattr(obj, name), reverse=descending)
+    return _page(rows, page_size, ordering)
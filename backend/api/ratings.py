@@ -0,0 +1,49 @@
+from django.db.models import Count, F
+
+from .models import Product, Review
+
+RATING_FIELDS = ['rating_sum', 'review_count'] + [f'rating_{star}_count' for star in range(1, 6)]
+
+
+def apply_review_change(product_id, old_rating=None, new_rating=None):
+    """
+    Инкрементально обновляет агрегаты рейтинга товара одним UPDATE.
+    old_rating=None - отзыв создан, new_rating=None - отзыв удален.
+    Вызывается сигналами Review (api.signals) в транзакции записи самого отзыва.
+    """
+    if old_rating == new_rating:
+        return
+    updates = {
+        'rating_sum': F('rating_sum') + (new_rating or 0) - (old_rating or 0),
+    }
+    if old_rating is None:
+        updates['review_count'] = F('review_count') + 1
+    elif new_rating is None:
+        updates['review_count'] = F('review_count') - 1
+    if old_rating is not None:
+        updates[f'rating_{old_rating}_count'] = F(f'rating_{old_rating}_count') - 1
+    if new_rating is not None:
+        updates[f'rating_{new_rating}_count'] = F(f'rating_{new_rating}_count') + 1
+    Product.objects.filter(pk=product_id).update(**updates)
+
+
+def rebuild_ratings(batch_size=500):
+    """Полностью пересчитывает агрегаты по таблице отзывов. Возвращает число товаров."""
+    stats = {}
+    rows = Review.objects.values('product_id', 'rating').annotate(n=Count('id')).order_by()
+    for row in rows:
+        stats.setdefault(row['product_id'], {})[row['rating']] = row['n']
+
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(product_ids), batch_size):
+        products = []
+        for product_id in product_ids[start:start + batch_size]:
+            counts = stats.get(product_id, {})
+            product = Product(id=product_id)
+            product.rating_sum = sum(star * n for star, n in counts.items())
+            product.review_count = sum(counts.values())
+            for star in range(1, 6):
+                setattr(product, f'rating_{star}_count', counts.get(star, 0))
+            products.append(product)
+        Product.objects.bulk_update(products, RATING_FIELDS)
+    return len(product_ids)
@@ -0,0 +1,252 @@
+"""
+Дневные сводки продаж: выручка, штуки и заказы по дням (SalesDay),
+по категориям (SalesCategoryDay) и по товарам (SalesProductDay).
+
+Сводки обновляются инкрементально задачей 'rollups.sync_order', которую
+ставят в очередь оформление и смена статуса заказа. Задача сравнивает
+Order.in_rollups с тем, должен ли заказ учитываться (не отменен), и
+прибавляет или вычитает его позиции - поэтому повторное выполнение и
+порядок задач на результат не влияют. Вне транзакции оформления, чтобы
+заказы не ждали друг друга на строке сегодняшнего дня.
+Отчеты читают только сводки: O(дней), а не O(заказов). Категория берется
+из позиции (OrderItem.category - категория товара на момент заказа), поэтому
+перенос товара в другую категорию не сдвигает уже учтенные продажи.
+Полный пересчет - rebuild() (команда rebuild_sales_rollups).
+"""
+from collections import defaultdict
+import datetime
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .jobs import task
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, SalesCategoryDay, SalesDay, SalesProductDay
+
+COUNTED = ~Q(status='cancelled')
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+# Самый длинный период отчета (ряд по дням строится в памяти)
+MAX_PERIOD_DAYS = 3 * 366
+
+
+def _totals():
+    return {'revenue': Decimal('0'), 'units': 0, 'orders': 0}
+
+
+def _item_aggregates():
+    return {
+        'revenue': Sum(F('quantity') * F('price'), output_field=MONEY),
+        'units': Sum('quantity'),
+        'orders': Count('order_id', distinct=True),
+    }
+
+
+def _order_rollups(order_id):
+    """Вклад заказа: (итог дня, {category_id: итог}, {product_id: итог})"""
+    day = _totals()
+    categories = defaultdict(_totals)
+    products = defaultdict(_totals)
+    for product_id, category_id, quantity, price in OrderItem.objects.filter(order_id=order_id).values_list(
+            'product_id', 'category_id', 'quantity', 'price'):
+        for totals in (day, categories[category_id], products[product_id]):
+            totals['revenue'] += quantity * price
+            totals['units'] += quantity
+    # Заказ считается один раз в каждой строке, куда попали его позиции
+    for totals in (day, *categories.values(), *products.values()):
+        totals['orders'] = 1
+    return day, categories, products
+
+
+def _key_filter(field, keys):
+    # NULL в IN не попадает - категорию None проверяем отдельно
+    condition = Q(**{f'{field}__in': [key for key in keys if key is not None]})
+    if None in keys:
+        condition |= Q(**{f'{field}__isnull': True})
+    return condition
+
+
+def _increment(model, date, field, rows, sign):
+    """
+    Прибавляет sign * итоги к строкам (date, field=key) - два запроса на
+    таблицу: INSERT недостающих нулевых строк и один UPDATE с CASE по ключу.
+    """
+    if not rows:
+        return
+    model.objects.bulk_create([model(date=date, **{field: key}) for key in rows], ignore_conflicts=True)
+
+    def delta(name, output_field):
+        return Case(
+            *[When(**{field: key}, then=Value(sign * totals[name])) for key, totals in rows.items()],
+            output_field=output_field,
+        )
+    model.objects.filter(_key_filter(field, rows), date=date).update(
+        revenue=F('revenue') + delta('revenue', MONEY),
+        units=F('units') + delta('units', IntegerField()),
+        orders=F('orders') + delta('orders', IntegerField()),
+    )
+
+
+def apply_order(order_id, date, sign):
+    """Прибавляет (sign=1) или вычитает (sign=-1) заказ из сводок за date"""
+    day, categories, products = _order_rollups(order_id)
+    if not day['orders']:
+        return
+    SalesDay.objects.bulk_create([SalesDay(date=date)], ignore_conflicts=True)
+    SalesDay.objects.filter(date=date).update(
+        revenue=F('revenue') + sign * day['revenue'],
+        units=F('units') + sign * day['units'],
+        orders=F('orders') + sign,
+    )
+    _increment(SalesCategoryDay, date, 'category_id', categories, sign)
+    _increment(SalesProductDay, date, 'product_id', products, sign)
+
+
+@task('rollups.sync_order')
+def sync_order(order_id):
+    """Приводит вклад заказа в сводки к его текущему статусу"""
+    with transaction.atomic():
+        order = (
+            Order.objects.filter(id=order_id).select_for_update()
+            .values('status', 'created_at', 'in_rollups').first()
+        )
+        if order is None:
+            return
+        counted = order['status'] != 'cancelled'
+        if counted == order['in_rollups']:
+            return
+        apply_order(order_id, timezone.localdate(order['created_at']), 1 if counted else -1)
+        Order.objects.filter(id=order_id).update(in_rollups=counted)
+
+
+def rebuild(batch_size=1000):
+    """
+    Пересчитывает все сводки из заказов и их архива одной транзакцией.
+    Сначала помечает заказы (и блокирует их строки), затем считает по
+    помеченным: задачи sync_order, идущие параллельно, увидят уже
+    согласованный in_rollups.
+    """
+    with transaction.atomic():
+        for model in (Order, ArchivedOrder):
+            model.objects.update(in_rollups=Case(When(COUNTED, then=Value(True)), default=Value(False)))
+        for model in (SalesDay, SalesCategoryDay, SalesProductDay):
+            model.objects.all().delete()
+
+        aggregates = _item_aggregates()
+        # (модель, поле ключа в сводке, поле группировки позиций)
+        for model, field, lookup in ((SalesDay, None, None),
+                                     (SalesCategoryDay, 'category_id', 'category_id'),
+                                     (SalesProductDay, 'product_id', 'product_id')):
+            # Заказ лежит либо в оперативной таблице, либо в архиве - итоги просто складываются
+            rows = defaultdict(_totals)
+            for item_model in (OrderItem, ArchivedOrderItem):
+                grouped = (
+                    item_model.objects.filter(order__in_rollups=True)
+                    .annotate(date=TruncDate('order__created_at'))
+                    .values_list('date', *([lookup] if lookup else [])).order_by().annotate(**aggregates)
+                )
+                for *key, revenue, units, orders in grouped.iterator(chunk_size=batch_size):
+                    totals = rows[tuple(key)]
+                    totals['revenue'] += revenue
+                    totals['units'] += units
+                    totals['orders'] += orders
+            model.objects.bulk_create(
+                [
+                    model(date=key[0], **({field: key[1]} if field else {}), **totals)
+                    for key, totals in rows.items()
+                ],
+                batch_size=batch_size,
+            )
+
+
+def forget_category(category_id):
+    """
+    Перед удалением категории: удаляет ее строки SalesCategoryDay и возвращает
+    их дни. Строки нельзя просто перевести в category=None - за тот же день
+    там уже может быть строка, а заказ с товарами обеих нарушил бы счетчик orders.
+    """
+    rows = SalesCategoryDay.objects.filter(category_id=category_id)
+    dates = list(rows.values_list('date', flat=True))
+    rows.delete()
+    return dates
+
+
+def recount_uncategorized(dates):
+    """
+    После удаления категории (ее позиции уже без категории) пересчитывает
+    строки category=None за dates из позиций - так же, как rebuild().
+    """
+    if not dates:
+        return
+    rows = defaultdict(_totals)
+    for item_model in (OrderItem, ArchivedOrderItem):
+        grouped = (
+            item_model.objects.filter(order__in_rollups=True, category__isnull=True)
+            .annotate(date=TruncDate('order__created_at')).filter(date__in=dates)
+            .values_list('date').order_by().annotate(**_item_aggregates())
+        )
+        for date, revenue, units, orders in grouped:
+            rows[date]['revenue'] += revenue
+            rows[date]['units'] += units
+            rows[date]['orders'] += orders
+    SalesCategoryDay.objects.filter(category__isnull=True, date__in=dates).delete()
+    SalesCategoryDay.objects.bulk_create([SalesCategoryDay(date=date, **totals) for date, totals in rows.items()])
+
+
+def parse_period(date_from, date_to, default_days=30):
+    """Период отчета из строк YYYY-MM-DD; по умолчанию последние default_days дней. ValueError при ошибке"""
+    date_to = datetime.date.fromisoformat(date_to) if date_to else timezone.localdate()
+    if date_from:
+        date_from = datetime.date.fromisoformat(date_from)
+    else:
+        date_from = date_to - timedelta(days=default_days - 1)
+    if date_from > date_to:
+        raise ValueError('date_from позже date_to')
+    if (date_to - date_from).days >= MAX_PERIOD_DAYS:
+        raise ValueError(f'Период длиннее {MAX_PERIOD_DAYS} дней')
+    return date_from, date_to
+
+
+def _row(values):
+    return {
+        'revenue': str((values['revenue'] or Decimal('0')).quantize(Decimal('0.01'))),
+        'units': values['units'] or 0,
+        'orders': values['orders'] or 0,
+    }
+
+
+def sales_report(date_from, date_to, top=10):
+    """Отчет за период по сводкам (три запроса): итоги, ряд по дням с нулевыми днями, категории и топ товаров"""
+    period = {'date__gte': date_from, 'date__lte': date_to}
+    sums = {'revenue': Sum('revenue'), 'units': Sum('units'), 'orders': Sum('orders')}
+
+    days = {row['date']: row for row in SalesDay.objects.filter(**period).values('date', 'revenue', 'units', 'orders')}
+    empty = {'revenue': None, 'units': 0, 'orders': 0}
+    series = []
+    for offset in range((date_to - date_from).days + 1):
+        day = date_from + timedelta(days=offset)
+        series.append({'date': day.isoformat(), **_row(days.get(day, empty))})
+
+    categories = (
+        SalesCategoryDay.objects.filter(**period).values('category_id', 'category__name')
+        .annotate(**sums).order_by('-revenue', 'category_id')
+    )
+    products = (
+        SalesProductDay.objects.filter(**period).values('product_id', 'product__name', 'product__slug')
+        .annotate(**sums).order_by('-revenue', 'product_id')[:top]
+    )
+    return {
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'totals': _row({name: sum(row[name] for row in days.values()) for name in ('revenue', 'units', 'orders')}),
+        'days': series,
+        'categories': [
+            {'category_id': row['category_id'], 'name': row['category__name'], **_row(row)} for row in categories
+        ],
+        'top_products': [
+            {'product_id': row['product_id'], 'name': row['product__name'], 'slug': row['product__slug'], **_row(row)}
+            for row in products
+        ],
+    }
@@ -0,0 +1,177 @@
+"""
+Полнотекстовый поиск по каталогу.
+
+Индекс живет вне моделей Django (см. миграцию 0010_product_search_index):
+- SQLite: виртуальная таблица FTS5 api_product_fts, rowid = id товара;
+- PostgreSQL: таблица api_product_search с колонкой tsvector и GIN-индексом.
+Документ товара = name + значения ProductSpecification + description.
+Синхронизация идет через сигналы (api.signals) на запись товаров и характеристик.
+"""
+import re
+import time
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+SEARCH_CONFIG = 'russian'
+
+INDEX_TABLES = {
+    'sqlite': 'api_product_fts',
+    'postgresql': 'api_product_search',
+}
+
+_POSTGRES_DOCUMENT = f"""
+    setweight(to_tsvector('{SEARCH_CONFIG}', p.name), 'A')
+    || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(string_agg(s.value, ' '), '')), 'B')
+    || setweight(to_tsvector('{SEARCH_CONFIG}', p.description), 'C')
+"""
+
+# Отсутствие таблицы при чтении перепроверяется не чаще раза в столько секунд:
+# воркер, запущенный до миграции, начнет искать по индексу без перезапуска
+RECHECK_MISSING_SECONDS = 60
+
+_index_available = {}  # vendor -> (есть ли таблица, время проверки)
+
+
+def index_enabled(recheck=False):
+    """
+    Есть ли в текущей базе таблица индекса (FTS5 может быть не собран в SQLite).
+    Наличие запоминается навсегда, отсутствие - на RECHECK_MISSING_SECONDS;
+    recheck=True перепроверяет отсутствие сразу (запись в индекс не должна
+    теряться в первую минуту после миграции).
+    """
+    vendor = connection.vendor
+    table = INDEX_TABLES.get(vendor)
+    if not table:
+        return False
+    available, checked_at = _index_available.get(vendor, (False, None))
+    if available:
+        return True
+    now = time.monotonic()
+    if recheck or checked_at is None or now - checked_at >= RECHECK_MISSING_SECONDS:
+        available = table in connection.introspection.table_names()
+        _index_available[vendor] = (available, now)
+    return available
+
+
+def reset_index_state(**kwargs):
+    """Забывает результат проверки (обработчик post_migrate)"""
+    _index_available.clear()
+
+
+def index_product(product_id):
+    """Пересобирает документ одного товара одним-двумя запросами, без чтения в Python"""
+    index_products([product_id])
+
+
+def index_products(product_ids):
+    """То же для набора товаров (массовый импорт): один-два запроса на весь набор"""
+    product_ids = list(product_ids)
+    if not product_ids or not index_enabled(recheck=True):
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"""
+                INSERT INTO api_product_search (product_id, document)
+                SELECT p.id, {_POSTGRES_DOCUMENT}
+                FROM api_product p
+                LEFT JOIN api_productspecification s ON s.product_id = p.id
+                WHERE p.id = ANY(%s)
+                GROUP BY p.id
+                ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document
+            """, [product_ids])
+        else:
+            placeholders = ', '.join(['%s'] * len(product_ids))
+            cursor.execute(f"DELETE FROM api_product_fts WHERE rowid IN ({placeholders})", product_ids)
+            cursor.execute(f"""
+                INSERT INTO api_product_fts (rowid, name, description, specs)
+                SELECT p.id, p.name, p.description,
+                       coalesce((SELECT group_concat(s.value, ' ') FROM api_productspecification s
+                                 WHERE s.product_id = p.id), '')
+                FROM api_product p
+                WHERE p.id IN ({placeholders})
+            """, product_ids)
+
+
+def remove_product(product_id):
+    if not index_enabled(recheck=True):
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("DELETE FROM api_product_search WHERE product_id = %s", [product_id])
+        else:
+            cursor.execute("DELETE FROM api_product_fts WHERE rowid = %s", [product_id])
+
+
+def rebuild_index():
+    """Полная перестройка индекса (после loaddata или ручных правок в базе)"""
+    if not index_enabled(recheck=True):
+        return 0
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("DELETE FROM api_product_search")
+            cursor.execute(f"""
+                INSERT INTO api_product_search (product_id, document)
+                SELECT p.id, {_POSTGRES_DOCUMENT}
+                FROM api_product p
+                LEFT JOIN api_productspecification s ON s.product_id = p.id
+                GROUP BY p.id
+            """)
+        else:
+            cursor.execute("DELETE FROM api_product_fts")
+            cursor.execute("""
+                INSERT INTO api_product_fts (rowid, name, description, specs)
+                SELECT p.id, p.name, p.description,
+                       coalesce((SELECT group_concat(s.value, ' ') FROM api_productspecification s
+                                 WHERE s.product_id = p.id), '')
+                FROM api_product p
+            """)
+        return cursor.rowcount
+
+
+def _fts5_query(query):
+    # Каждое слово - отдельная фраза с префиксным поиском; спецсимволы FTS5 отбрасываем
+    words = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_product_ids(query, limit):
+    """Id товаров в наличии, отсортированные по релевантности"""
+    query = query.strip()
+    if not query:
+        return []
+
+    if not index_enabled():
+        # Без индекса (например, MySQL) - медленный, но корректный LIKE-поиск
+        products = Product.objects.filter(in_stock=True).filter(
+            Q(name__icontains=query) | Q(description__icontains=query) | Q(specifications__value__icontains=query)
+        ).distinct().order_by('-created_at', 'id')
+        return list(products.values_list('id', flat=True)[:limit])
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"""
+                SELECT s.product_id
+                FROM api_product_search s
+                JOIN api_product p ON p.id = s.product_id AND p.in_stock
+                CROSS JOIN websearch_to_tsquery('{SEARCH_CONFIG}', %s) q
+                WHERE s.document @@ q
+                ORDER BY ts_rank(s.document, q) DESC, s.product_id
+                LIMIT %s
+            """, [query, limit])
+        else:
+            match = _fts5_query(query)
+            if not match:
+                return []
+            # bm25: чем меньше, тем релевантнее; веса колонок name, description, specs
+            cursor.execute("""
+                SELECT api_product_fts.rowid
+                FROM api_product_fts
+                JOIN api_product p ON p.id = api_product_fts.rowid AND p.in_stock
+                WHERE api_product_fts MATCH %s
+                ORDER BY bm25(api_product_fts, 10.0, 1.0, 5.0), api_product_fts.rowid
+                LIMIT %s
+            """, [match, limit])
+        return [row[0] for row in cursor.fetchall()]
@@ -1,3 +1,5 @@
+from django.db.models import Prefetch, Sum
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
 from .models import Contact, Product, Cart, CartItem, Category, ProductSpecification, Order, OrderItem, PaymentCard, Review
 
@@ -16,41 +18,135 @@ class ProductSpecificationSerializer(serializers.ModelSerializer):
         model = ProductSpecification
         fields = ['name', 'value']
 
-class ProductSerializer(serializers.ModelSerializer):
+_money_field = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+def format_money(value):
+    """Денежная сумма в том же строковом формате, что и DecimalField в ответах"""
+    return _money_field.to_representation(value)
+
+def parse_fields_param(request):
+    """Список полей из ?fields=id,name,price или None"""
+    raw = request.query_params.get('fields') if request is not None else None
+    if not raw:
+        return None
+    return [name.strip() for name in raw.split(',') if name.strip()]
+
+class SparseFieldsetMixin:
+    """Оставляет в ответе только поля из fields=[...] (или ?fields= запроса из context)"""
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            fields = parse_fields_param(self.context.get('request'))
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class ProductEmbedSerializer(serializers.ModelSerializer):
+    """Товар внутри строки корзины или заказа"""
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'slug', 'price', 'image_url', 'in_stock']
+
+class ProductListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Карточка товара в списках: без характеристик, отзывов и гистограммы"""
+    category = CategorySerializer(read_only=True)
+    average_rating = serializers.ReadOnlyField()
+    review_count = serializers.ReadOnlyField()
+
+    # Колонки модели для полей, имя которых не совпадает с колонкой
+    MODEL_COLUMNS = {
+        'average_rating': ['rating_sum', 'review_count'],
+    }
+    # Вычисляемые поля для api.fastserialize
+    fast_fields = {
+        'average_rating': (['rating_sum', 'review_count'], Product.calculate_average_rating),
+    }
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'slug', 'description', 'price', 'image_url', 'category', 'in_stock', 'average_rating', 'review_count', 'created_at']
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        """Загружаем только колонки выбранных полей (+ ключ курсорной пагинации)"""
+        fields = [name for name in (fields or cls.Meta.fields) if name in cls.Meta.fields]
+        columns = {'id', 'created_at'}
+        for name in fields:
+            columns.update(cls.MODEL_COLUMNS.get(name, [name]))
+        queryset = queryset.only(*columns)
+        if 'category' in fields:
+            queryset = queryset.select_related('category')
+        return queryset
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
     specifications = ProductSpecificationSerializer(many=True, read_only=True)
     reviews = serializers.SerializerMethodField()
-    average_rating = serializers.SerializerMethodField()
+    average_rating = serializers.ReadOnlyField()
+    review_count = serializers.ReadOnlyField()
+    rating_histogram = serializers.ReadOnlyField()
+
+    # Сколько последних отзывов встраивается в ответ о товаре
+    REVIEWS_LIMIT = 10
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'slug', 'description', 'price', 'image_url', 'category', 'category_id', 'in_stock', 'specifications', 'reviews', 'average_rating', 'created_at']
+        fields = ['id', 'name', 'slug', 'description', 'price', 'image_url', 'category', 'category_id', 'in_stock', 'specifications', 'reviews', 'average_rating', 'review_count', 'rating_histogram', 'created_at']
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """
+        Категория - JOIN, характеристики - один запрос, последние REVIEWS_LIMIT
+        отзывов с авторами - один оконный запрос (ROW_NUMBER() OVER PARTITION BY
+        product_id) на всю страницу товаров, сколько бы отзывов у них ни было.
+        """
+        latest_reviews = Review.objects.select_related('user').only(
+            'id', 'product', 'rating', 'comment', 'helpful_count', 'created_at', 'updated_at', 'user__id', 'user__username',
+        ).order_by('-created_at', '-id')[:cls.REVIEWS_LIMIT]
+        return queryset.select_related('category').prefetch_related(
+            'specifications',
+            Prefetch('reviews', queryset=latest_reviews, to_attr='latest_reviews'),
+        )
     
     def get_reviews(self, obj):
-        try:
-            reviews = obj.reviews.all()[:10]  # Ограничиваем количество отзывов для списка
-            return ReviewSerializer(reviews, many=True).data
-        except Exception:
-            return []
-    
-    def get_average_rating(self, obj):
-        try:
-            reviews = obj.reviews.all()
-            if reviews.exists():
-                return round(sum(review.rating for review in reviews) / reviews.count(), 1)
-        except Exception:
-            pass
-        return None
+        reviews = getattr(obj, 'latest_reviews', None)
+        if reviews is None:
+            reviews = obj.reviews.select_related('user').order_by('-created_at', '-id')[:self.REVIEWS_LIMIT]
+        return ReviewSerializer(reviews, many=True).data
+
+class AdminProductSerializer(ProductSerializer):
+    """Карточка товара для администратора: с точным остатком на складе"""
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['stock']
 
 class CartItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+    product = ProductEmbedSerializer(read_only=True)
     total_price = serializers.ReadOnlyField()
 
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'quantity', 'total_price']
 
+class CartProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'image_url']
+
+class CartLineSerializer(serializers.ModelSerializer):
+    """Компактная строка корзины; сериализуется через api.fastserialize"""
+    product = CartProductSerializer(read_only=True)
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    fast_fields = {
+        'total_price': (['quantity', 'product__price'], lambda quantity, price: quantity * price),
+    }
+
+    class Meta:
+        model = CartItem
+        fields = ['id', 'product', 'quantity', 'total_price']
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True, source='items.all')
 
@@ -59,9 +155,13 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'items', 'created_at']
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+    product = ProductEmbedSerializer(read_only=True)
     total_price = serializers.ReadOnlyField()
 
+    fast_fields = {
+        'total_price': (['quantity', 'price'], lambda quantity, price: quantity * price),
+    }
+
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'quantity', 'price', 'total_price']
@@ -83,18 +183,45 @@ class OrderSerializer(serializers.ModelSerializer):
     payment_card = PaymentCardSerializer(read_only=True)
     payment_card_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
 
+    fast_fields = {
+        'total_items': (['items'], lambda items: sum(item['quantity'] for item in items)),
+    }
+
     class Meta:
         model = Order
         fields = ['id', 'user', 'status', 'total_price', 'total_items', 'payment_method', 'payment_card', 'payment_card_id', 'first_name', 'last_name', 'email', 'phone', 'address', 'city', 'postal_code', 'notes', 'items', 'created_at', 'updated_at']
         read_only_fields = ['user', 'status', 'total_price', 'created_at', 'updated_at']
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, with_items=True):
+        """
+        total_items - SUM в том же запросе, карта - JOIN, позиции с товарами -
+        один запрос на всю страницу заказов (with_items=False - без позиций).
+        """
+        queryset = queryset.select_related('payment_card').annotate(
+            annotated_total_items=Coalesce(Sum('items__quantity'), 0),
+        )
+        if with_items:
+            # Та же загрузка подходит и для архива (ArchivedOrder.items)
+            item_model = queryset.model._meta.get_field('items').related_model
+            items = item_model.objects.select_related('product').only(
+                'id', 'order', 'quantity', 'price', *[f'product__{name}' for name in ProductEmbedSerializer.Meta.fields],
+            ).order_by('id')
+            queryset = queryset.prefetch_related(Prefetch('items', queryset=items))
+        return queryset
+
+class OrderSummarySerializer(OrderSerializer):
+    """Заказ без позиций - для компактной истории заказов (?summary=1)"""
+    class Meta(OrderSerializer.Meta):
+        fields = [name for name in OrderSerializer.Meta.fields if name != 'items']
+
 class ReviewSerializer(serializers.ModelSerializer):
     user = serializers.SerializerMethodField()
     
     class Meta:
         model = Review
-        fields = ['id', 'user', 'rating', 'comment', 'created_at', 'updated_at']
-        read_only_fields = ['user', 'created_at', 'updated_at']
+        fields = ['id', 'user', 'rating', 'comment', 'helpful_count', 'created_at', 'updated_at']
+        read_only_fields = ['user', 'helpful_count', 'created_at', 'updated_at']
     
     def get_user(self, obj):
         return {
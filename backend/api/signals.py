@@ -0,0 +1,151 @@
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import cache, facets, ratings, rollups, search
+from .models import Category, Product, ProductSpecification, Review, ReviewVote
+
+
+# Поисковый индекс
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, raw=False, **kwargs):
+    # raw - loaddata; после загрузки фикстур нужен rebuild_search_index
+    if not raw:
+        search.index_product(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+
+# Миграция могла создать (или удалить) таблицу индекса
+post_migrate.connect(search.reset_index_state, dispatch_uid='api.search.reset_index_state')
+
+
+@receiver(post_save, sender=ProductSpecification)
+@receiver(post_delete, sender=ProductSpecification)
+def reindex_specification_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_product(instance.product_id)
+
+
+# Фасеты: запоминаем прежнее состояние, чтобы пересчитать и старые, и новые пары
+@receiver(pre_save, sender=ProductSpecification)
+def remember_specification_pair(sender, instance, raw=False, **kwargs):
+    instance._facet_old_pair = None
+    if instance.pk and not raw:
+        instance._facet_old_pair = sender.objects.filter(pk=instance.pk).values_list('name', 'value').first()
+
+
+@receiver(post_save, sender=ProductSpecification)
+def refresh_saved_specification_facets(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    pairs = {(instance.name, instance.value)}
+    if getattr(instance, '_facet_old_pair', None):
+        pairs.add(instance._facet_old_pair)
+    facets.schedule_refresh(pairs)
+
+
+@receiver(post_delete, sender=ProductSpecification)
+def refresh_deleted_specification_facets(sender, instance, **kwargs):
+    facets.schedule_refresh({(instance.name, instance.value)})
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_state(sender, instance, raw=False, **kwargs):
+    instance._old_state = None
+    if instance.pk and not raw:
+        instance._old_state = sender.objects.filter(pk=instance.pk).values_list('in_stock', 'category_id', 'slug').first()
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_facets(sender, instance, created=False, raw=False, **kwargs):
+    # У нового товара еще нет характеристик; пересчет нужен только при смене наличия или категории
+    old_state = getattr(instance, '_old_state', None)
+    if raw or created or old_state is None or old_state[:2] == (instance.in_stock, instance.category_id):
+        return
+    facets.schedule_refresh(instance.specifications.values_list('name', 'value'))
+
+
+# Агрегаты рейтинга товара (api.ratings) - через сигналы, чтобы их учитывали и
+# удаления каскадом (вместе с пользователем), и правки из Django admin.
+# raw (loaddata) пропускаем - после загрузки фикстур нужен rebuild_ratings
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, raw=False, **kwargs):
+    instance._old_rating = None
+    if instance.pk and not raw:
+        instance._old_rating = sender.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def apply_saved_review_rating(sender, instance, created=False, raw=False, **kwargs):
+    old = getattr(instance, '_old_rating', None)
+    if raw or (not created and old is None):
+        return
+    if old and old[0] != instance.product_id:
+        # Отзыв перенесен на другой товар: вычитаем у старого, прибавляем новому
+        ratings.apply_review_change(old[0], old_rating=old[1])
+        old = None
+    ratings.apply_review_change(instance.product_id, old_rating=old[1] if old else None, new_rating=instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def apply_deleted_review_rating(sender, instance, **kwargs):
+    ratings.apply_review_change(instance.product_id, old_rating=instance.rating)
+
+
+# Сводки продаж: продажи удаленной категории переходят в "без категории",
+# иначе инкрементальные сводки разошлись бы с rollups.rebuild()
+@receiver(pre_delete, sender=Category)
+def forget_category_sales(sender, instance, **kwargs):
+    instance._sales_dates = rollups.forget_category(instance.pk)
+
+
+@receiver(post_delete, sender=Category)
+def recount_uncategorized_sales(sender, instance, **kwargs):
+    rollups.recount_uncategorized(getattr(instance, '_sales_dates', []))
+
+
+# Кэш ответов каталога: обработчики объявлены последними, чтобы версии
+# увеличивались уже после пересчета фасетов в on_commit
+def _product_scopes(product_id, slug=None, lists=True):
+    """Области товара; lists=False - только карточка, если изменение не видно в списках"""
+    scopes = ['products', f'product:{product_id}'] if lists else [f'product:{product_id}']
+    if slug is None:
+        slug = Product.objects.filter(pk=product_id).values_list('slug', flat=True).first()
+    if slug:
+        scopes.append(f'product:{slug}')
+    return scopes
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    scopes = _product_scopes(instance.pk, instance.slug)
+    old_state = getattr(instance, '_old_state', None)
+    if old_state and old_state[2] != instance.slug:
+        scopes.append(f'product:{old_state[2]}')
+    cache.bump_on_commit(*scopes)
+
+
+@receiver(post_save, sender=ProductSpecification)
+@receiver(post_delete, sender=ProductSpecification)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_product_child_cache(sender, instance, **kwargs):
+    cache.bump_on_commit(*_product_scopes(instance.product_id))
+
+
+@receiver(post_save, sender=ReviewVote)
+def invalidate_review_vote_cache(sender, instance, **kwargs):
+    # helpful_count меняется через UPDATE, поэтому сбрасываем кэш по самой отметке.
+    # В списках товаров отзывов нет - их кэш голос не трогает
+    cache.bump_on_commit(*_product_scopes(instance.review.product_id, lists=False))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    # Категория встроена в ответы товаров, поэтому сбрасываем и списки, и карточки
+    cache.bump_on_commit('categories', 'products')
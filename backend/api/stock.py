@@ -0,0 +1,124 @@
+"""
+Резервирование остатков (Product.stock) при оформлении заказа.
+
+Списание - один условный UPDATE ... SET stock = stock - n WHERE stock >= n
+на все товары заказа. Перед ним строки этих товаров (и только они)
+блокируются SELECT ... FOR UPDATE в порядке id, поэтому два параллельных
+заказа с пересекающимися товарами не взаимоблокируются, а вся таблица не
+блокируется никогда. Товары с stock = NULL остатков не ведут и не резервируются.
+Тем же UPDATE флаг in_stock снимается, когда остаток доходит до нуля, и
+возвращается, когда отмена заказа возвращает товар на пустой склад; для таких
+товаров пересчитываются фасеты и сбрасывается кэш списков каталога.
+Вызывать внутри transaction.atomic().
+"""
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from . import cache, facets
+from .models import OrderItem, Product, ProductSpecification
+
+
+class OutOfStock(Exception):
+    """Остатка не хватает; items - [{"product_id", "name", "requested", "available"}]"""
+
+    def __init__(self, items):
+        super().__init__(items)
+        self.items = items
+
+
+def _amount(quantities):
+    # Одно значение для всех товаров - константа, иначе CASE по id
+    amounts = set(quantities.values())
+    if len(amounts) == 1:
+        return Value(amounts.pop())
+    return Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+def _bump_products(rows, flipped):
+    """
+    Остаток виден только в карточке товара; списки каталога и фасеты
+    меняются, только если у товаров flipped сменился in_stock
+    """
+    scopes = []
+    for product_id, slug in rows:
+        scopes += [f'product:{product_id}', f'product:{slug}']
+    if flipped:
+        scopes.append('products')
+        facets.schedule_refresh(
+            ProductSpecification.objects.filter(product_id__in=flipped).values_list('name', 'value').distinct()
+        )
+    if scopes:
+        cache.bump_on_commit(*scopes)
+
+
+def reserve(quantities):
+    """
+    Списывает {product_id: quantity} с остатков. Возвращает множество id
+    товаров, для которых остаток ведется и был списан; бросает OutOfStock.
+    """
+    if not quantities:
+        return set()
+    locked = list(
+        Product.objects.filter(id__in=list(quantities), stock__isnull=False)
+        .order_by('id').select_for_update().values_list('id', 'slug', 'name', 'stock')
+    )
+    shortages = [
+        {"product_id": product_id, "name": name, "requested": quantities[product_id], "available": stock}
+        for product_id, _, name, stock in locked if stock < quantities[product_id]
+    ]
+    if shortages:
+        raise OutOfStock(shortages)
+
+    reserved = {product_id: quantities[product_id] for product_id, _, _, _ in locked}
+    if not reserved:
+        return set()
+    amount = _amount(reserved)
+    updated = Product.objects.filter(id__in=list(reserved), stock__gte=amount).update(
+        stock=F('stock') - amount,
+        # В SET справа - значения до UPDATE: stock = amount значит, что остаток станет нулевым
+        in_stock=Case(When(stock=amount, then=Value(False)), default=F('in_stock')),
+    )
+    if updated != len(reserved):
+        # Строки заблокированы выше, так что сюда попадаем только на базах без FOR UPDATE
+        raise OutOfStock([{"product_id": product_id, "name": name, "requested": quantities[product_id], "available": None}
+                          for product_id, _, name, _ in locked])
+    _bump_products(
+        [(product_id, slug) for product_id, slug, _, _ in locked],
+        [product_id for product_id, _, _, stock in locked if stock == reserved[product_id]],
+    )
+    return set(reserved)
+
+
+def release(order_id):
+    """Возвращает на склад зарезервированные позиции заказа (при отмене)"""
+    release_orders([order_id])
+
+
+def release_orders(order_ids):
+    """
+    Возвращает на склад резерв нескольких заказов: четыре запроса при любом их
+    числе (агрегат позиций, блокировка товаров, UPDATE товаров и позиций)
+    """
+    items = OrderItem.objects.filter(order_id__in=list(order_ids), reserved=True)
+    quantities = dict(
+        items.values('product_id').order_by().annotate(total=Sum('quantity')).values_list('product_id', 'total')
+    )
+    if not quantities:
+        return
+    # Блокируем в том же порядке, что и reserve(), и узнаем, какие товары вернутся в наличие
+    locked = list(
+        Product.objects.filter(id__in=list(quantities), stock__isnull=False)
+        .order_by('id').select_for_update().values_list('id', 'slug', 'stock')
+    )
+    amount = _amount(quantities)
+    Product.objects.filter(id__in=list(quantities), stock__isnull=False).update(
+        stock=F('stock') + amount,
+        in_stock=Case(When(stock=0, then=Value(True)), default=F('in_stock')),
+    )
+    items.update(reserved=False)
+    _bump_products(
+        [(product_id, slug) for product_id, slug, _ in locked],
+        [product_id for product_id, _, stock in locked if stock == 0],
+    )
@@ -0,0 +1,44 @@
+"""
+Фоновые задачи (api.jobs). Ставятся в очередь из вью, выполняются run_workers.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import mail_admins, send_mail
+
+from .jobs import task
+from .models import Contact, Order
+
+
+@task('orders.send_confirmation')
+def send_order_confirmation(order_id):
+    order = Order.objects.filter(id=order_id).values('id', 'first_name', 'email', 'total_price').first()
+    if order is None or not order['email']:
+        return
+    send_mail(
+        f"Заказ #{order['id']} принят",
+        f"{order['first_name']}, спасибо за заказ #{order['id']} на сумму {order['total_price']}. "
+        f"Мы свяжемся с вами для подтверждения доставки.",
+        settings.DEFAULT_FROM_EMAIL,
+        [order['email']],
+    )
+
+
+@task('users.send_welcome')
+def send_welcome_email(user_id):
+    user = User.objects.filter(id=user_id).values('username', 'email').first()
+    if user is None or not user['email']:
+        return
+    send_mail(
+        "Добро пожаловать!",
+        f"{user['username']}, вы успешно зарегистрировались в магазине.",
+        settings.DEFAULT_FROM_EMAIL,
+        [user['email']],
+    )
+
+
+@task('contacts.notify_admins')
+def notify_admins_about_contact(contact_id):
+    contact = Contact.objects.filter(id=contact_id).values('name', 'email', 'message').first()
+    if contact is None:
+        return
+    mail_admins(f"Новое сообщение от {contact['name']}", f"{contact['email']}\n\n{contact['message']}")
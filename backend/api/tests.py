@@ -1,3 +1,1503 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.db.models.query import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from . import cache, facets, jobs, search
+from .archive import archive_orders
+from .carts import fold_operations
+from .exports import _csv_cell
+from .idempotency import idempotent
+from .ratings import RATING_FIELDS, rebuild_ratings
+from .serializers import ProductSerializer
+from .models import (
+    ArchivedOrder, Cart, CartItem, Category, FacetCount, IdempotencyRecord, Job, Order, OrderItem, Product,
+    ProductSpecification, Review, SalesCategoryDay, SalesDay, SalesProductDay,
+)
+from .rollups import rebuild, sync_order
+
+
+class ProductPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Товар {i}', slug=f'product-{i}', description='', price='10.50') for i in range(5)
+        ])
+
+    def collect(self, url, **params):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get(url, {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            ids += [product['id'] for product in response.data['results']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_pages_follow_cursor(self):
+        response = self.client.get('/api/products/', {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next_cursor'])
+        ids = self.collect('/api/products/', page_size=2)
+        self.assertEqual(sorted(ids), sorted(product.id for product in self.products))
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/products/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(API_MAX_PAGE_SIZE=3)
+    def test_page_size_is_capped(self):
+        response = self.client.get('/api/products/', {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNotNone(response.data['next_cursor'])
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Мяч', slug='ball', description='', price='10.50')
+        self.clients = []
+        for name in ('first', 'second'):
+            user = User.objects.create_user(username=name, password='password')
+            order = Order.objects.create(user=user, first_name='Иван', last_name='Иванов', email='ivan@example.com',
+                                         phone='1', address='ул. Ленина, 1', city='Минск')
+            OrderItem.objects.create(order=order, product=self.product, quantity=1, price='10.50')
+            client = APIClient()
+            client.force_authenticate(user)
+            self.clients.append(client)
+
+    def review(self, client, rating):
+        url = f'/api/products/{self.product.id}/reviews/create/'
+        return client.post(url, {'rating': rating, 'comment': 'Отзыв'}, format='json').data['id']
+
+    def aggregates(self):
+        return Product.objects.values_list(*RATING_FIELDS).get(pk=self.product.pk)
+
+    def assert_matches_rebuild(self):
+        incremental = self.aggregates()
+        rebuild_ratings()
+        self.assertEqual(incremental, self.aggregates())
+
+    def test_aggregates_follow_reviews(self):
+        first, second = self.clients
+        review_id = self.review(first, 5)
+        self.review(second, 2)
+        first.patch(f'/api/reviews/{review_id}/', {'rating': 4}, format='json')
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.review_count, product.average_rating), (2, 3.0))
+        self.assertEqual((product.rating_4_count, product.rating_5_count), (1, 0))
+        self.assert_matches_rebuild()
+
+        self.assertEqual(first.delete(f'/api/reviews/{review_id}/').status_code, 204)
+        self.assertEqual(first.delete(f'/api/reviews/{review_id}/').status_code, 404)
+        self.assertEqual(self.aggregates()[:2], (2, 1))
+        self.assert_matches_rebuild()
+
+    def test_cascade_delete_updates_aggregates(self):
+        self.review(self.clients[0], 5)
+        User.objects.get(username='first').delete()
+        self.assertEqual(self.aggregates(), (0,) * len(RATING_FIELDS))
+
+
+class ReviewPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.product = Product.objects.create(name='Мяч', slug='ball', description='', price='10.50')
+        users = User.objects.bulk_create([User(username=f'user-{i}') for i in range(13)])
+        # Много одинаковых оценок и счетчиков - порядок решает id
+        self.reviews = Review.objects.bulk_create([
+            Review(product=self.product, user=user, rating=i % 3 + 3, comment='Отзыв', helpful_count=i % 4)
+            for i, user in enumerate(users)
+        ])
+        self.url = f'/api/products/{self.product.id}/reviews/'
+
+    def walk(self, **params):
+        ids, cursor = [], None
+        while True:
+            # Наличие товара и страница отзывов с авторами
+            with self.assertNumQueries(2):
+                response = self.client.get(self.url, {'page_size': 4, **params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 4)
+            ids += [review['id'] for review in response.data['results']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                return ids
+
+    def expected(self, key, reviews=None):
+        return [review.id for review in sorted(reviews or self.reviews, key=key, reverse=True)]
+
+    def test_sorts_walk_all_pages_without_gaps(self):
+        self.assertEqual(self.walk(sort='helpful'), self.expected(lambda review: (review.helpful_count, review.id)))
+        self.assertEqual(self.walk(sort='rating'), self.expected(lambda review: (review.rating, review.id)))
+        newest = self.walk()
+        self.assertEqual(sorted(newest), sorted(review.id for review in self.reviews))
+        self.assertEqual(len(set(newest)), len(newest))
+
+    def test_rating_filter(self):
+        fives = [review for review in self.reviews if review.rating == 5]
+        ids = self.walk(rating=5, sort='helpful')
+        self.assertEqual(ids, self.expected(lambda review: (review.helpful_count, review.id), fives))
+        self.assertEqual(self.client.get(self.url, {'rating': 6}).status_code, 400)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'sort': 'oldest'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'cursor': 'garbage'}).status_code, 400)
+        cursor = self.client.get(self.url, {'page_size': 4, 'sort': 'helpful'}).data['next_cursor']
+        self.assertEqual(self.client.get(self.url, {'cursor': cursor[:-3]}).status_code, 400)
+        self.assertEqual(self.client.get('/api/products/0/reviews/').status_code, 404)
+
+    def test_query_count_does_not_grow(self):
+        users = User.objects.bulk_create([User(username=f'more-{i}') for i in range(40)])
+        Review.objects.bulk_create([Review(product=self.product, user=user, rating=4, comment='Отзыв') for user in users])
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'page_size': 20})
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['results'][0]['user']['username'], 'more-39')
+
+
+class ProductDetailReviewsTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Товар {i}', slug=f'product-{i}', description='', price='10.50') for i in range(2)
+        ])
+        ProductSpecification.objects.create(product=self.products[0], name='Бренд', value='Nike')
+
+    def add_reviews(self, product, count):
+        start = User.objects.count()
+        users = User.objects.bulk_create([User(username=f'reviewer-{start + i}') for i in range(count)])
+        Review.objects.bulk_create([Review(product=product, user=user, rating=5, comment='Отзыв') for user in users])
+
+    def detail(self):
+        cache.bump('product:product-0')
+        # Товар с категорией, характеристики, окно последних отзывов с авторами
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/products/product-0/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_query_count_is_constant(self):
+        self.add_reviews(self.products[0], 2)
+        self.assertEqual(len(self.detail()['reviews']), 2)
+        self.add_reviews(self.products[0], 3 * ProductSerializer.REVIEWS_LIMIT)
+        reviews = self.detail()['reviews']
+        self.assertEqual(len(reviews), ProductSerializer.REVIEWS_LIMIT)
+        newest = Review.objects.filter(product=self.products[0]).order_by('-created_at', '-id')
+        self.assertEqual([review['id'] for review in reviews], list(newest.values_list('id', flat=True)[:ProductSerializer.REVIEWS_LIMIT]))
+
+    def test_only_latest_reviews_are_fetched(self):
+        for product in self.products:
+            self.add_reviews(product, ProductSerializer.REVIEWS_LIMIT + 5)
+        with CaptureQueriesContext(connection) as queries:
+            products = list(ProductSerializer.setup_eager_loading(Product.objects.order_by('id')))
+        self.assertEqual(len(queries), 3)
+        # Отсечение по ROW_NUMBER() в SQL: лишние отзывы не читаются и не создаются объектами
+        self.assertIn('ROW_NUMBER()', queries[2]['sql'].upper())
+        self.assertEqual([len(product.latest_reviews) for product in products], [ProductSerializer.REVIEWS_LIMIT] * 2)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.ball = Product.objects.create(name='Футбольный мяч', slug='ball', description='Размер 5', price='10.50')
+        ProductSpecification.objects.create(product=self.ball, name='Бренд', value='Adidas')
+        self.rope = Product.objects.create(name='Скакалка', slug='rope', description='Для фитнеса', price='2.50')
+
+    def search(self, query):
+        response = self.client.get('/api/products/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.data['results']]
+
+    def test_search_by_name_description_and_specs(self):
+        self.assertEqual(self.search('мяч'), [self.ball.id])
+        self.assertEqual(self.search('adidas'), [self.ball.id])
+        self.assertEqual(self.search('фитнес'), [self.rope.id])
+        self.assertEqual(self.search(''), [])
+
+    def test_index_follows_writes(self):
+        self.rope.name = 'Прыгалка'
+        self.rope.save()
+        self.assertEqual(self.search('прыгалка'), [self.rope.id])
+        self.assertEqual(self.search('скакалка'), [])
+        ProductSpecification.objects.filter(product=self.ball).delete()
+        self.assertEqual(self.search('adidas'), [])
+        Product.objects.filter(id=self.rope.id).update(in_stock=False)
+        self.assertEqual(self.search('прыгалка'), [])
+        self.ball.delete()
+        self.assertEqual(self.search('мяч'), [])
+
+    def test_missing_table_is_rechecked(self):
+        if not search.index_enabled():
+            self.skipTest('База без полнотекстового индекса')
+        vendor = connection.vendor
+        search._index_available[vendor] = (False, time.monotonic())
+        self.assertFalse(search.index_enabled())
+        search._index_available[vendor] = (False, time.monotonic() - search.RECHECK_MISSING_SECONDS)
+        self.assertTrue(search.index_enabled())
+        search._index_available[vendor] = (False, time.monotonic())
+        self.assertTrue(search.index_enabled(recheck=True))
+
+
+class FacetCountTests(TestCase):
+    def setUp(self):
+        self.balls = Category.objects.create(name='Мячи', slug='balls')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products = Product.objects.bulk_create([
+                Product(name=f'Мяч {i}', slug=f'ball-{i}', description='', price='10.50',
+                        category=self.balls if i < 2 else None)
+                for i in range(3)
+            ])
+            for product in self.products:
+                ProductSpecification.objects.create(product=product, name='Бренд', value='Nike')
+            ProductSpecification.objects.create(product=self.products[0], name='Размер', value='5')
+
+    def counts(self, category=None):
+        return facets.facet_counts(category)
+
+    def test_counts_per_category_and_catalog(self):
+        self.assertEqual(self.counts(), {
+            'Бренд': [{'value': 'Nike', 'count': 3}],
+            'Размер': [{'value': '5', 'count': 1}],
+        })
+        self.assertEqual(self.counts('balls')['Бренд'], [{'value': 'Nike', 'count': 2}])
+        response = APIClient().get('/api/products/', {'category': 'balls', 'spec.Размер': '5'})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.products[0].id])
+        self.assertEqual(response.data['facets'], self.counts('balls'))
+
+    def test_counts_follow_changes(self):
+        product = self.products[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            product.in_stock = False
+            product.save()
+        self.assertEqual(self.counts(), {'Бренд': [{'value': 'Nike', 'count': 2}]})
+        with self.captureOnCommitCallbacks(execute=True):
+            spec = ProductSpecification.objects.get(product=self.products[1])
+            spec.value = 'Adidas'
+            spec.save()
+        self.assertEqual(self.counts('balls'), {'Бренд': [{'value': 'Adidas', 'count': 1}]})
+
+    def test_repeated_refresh_matches_full_rebuild(self):
+        pairs = [('Бренд', 'Nike'), ('Размер', '5'), ('Бренд', 'Puma')]
+        facets.refresh_facets(pairs)
+        facets.refresh_facets(pairs)
+        incremental = sorted(FacetCount.objects.values_list('category_id', 'name', 'value', 'product_count'), key=str)
+        facets.refresh_facets()
+        self.assertEqual(
+            incremental, sorted(FacetCount.objects.values_list('category_id', 'name', 'value', 'product_count'), key=str),
+        )
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+        category = Category.objects.create(name='Мячи', slug='balls')
+        self.ball, self.rope = [
+            Product.objects.create(name=name, slug=slug, description='', price='10.50', category=category)
+            for name, slug in (('Мяч', 'ball'), ('Скакалка', 'rope'))
+        ]
+        self.voter = User.objects.create_user(username='voter', password='password')
+        self.review = Review.objects.create(
+            product=self.ball, user=User.objects.create_user(username='author', password='password'),
+            rating=5, comment='Отличный',
+        )
+
+    def assertCached(self, url, cached=True):
+        if cached:
+            with self.assertNumQueries(0):
+                return self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertGreater(len(queries), 0, url)
+        return response
+
+    def warm(self, *urls):
+        for url in urls:
+            self.client.get(url)
+
+    def test_hit_and_miss_after_write(self):
+        self.warm('/api/products/')
+        response = self.assertCached('/api/products/')
+        self.assertEqual([product['name'] for product in response.data['results']], ['Скакалка', 'Мяч'])
+        self.assertEqual(cache.get_stats()['products']['hits'], 1)
+        # Другие параметры - другой ключ
+        self.assertCached('/api/products/?category=balls', cached=False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ball.name = 'Футбольный мяч'
+            self.ball.save()
+        response = self.assertCached('/api/products/', cached=False)
+        self.assertEqual([product['name'] for product in response.data['results']], ['Скакалка', 'Футбольный мяч'])
+        self.assertCached('/api/products/')
+
+    def test_invalidation_is_per_scope(self):
+        urls = ['/api/products/', '/api/products/ball/', '/api/products/rope/', '/api/categories/']
+        self.warm(*urls)
+        voter = APIClient()
+        voter.force_authenticate(self.voter)
+        # Голос "полезно" виден только в карточке товара
+        with self.captureOnCommitCallbacks(execute=True):
+            voter.post(f'/api/reviews/{self.review.id}/helpful/')
+        response = self.assertCached('/api/products/ball/', cached=False)
+        self.assertEqual(response.data['reviews'][0]['helpful_count'], 1)
+        for url in ('/api/products/', '/api/products/rope/', '/api/categories/'):
+            self.assertCached(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(slug='rope').save()
+        self.assertCached('/api/products/', cached=False)
+        self.assertCached('/api/products/rope/', cached=False)
+        self.assertCached('/api/products/ball/')
+        self.assertCached('/api/categories/')
+
+        # Категория встроена во все ответы товаров
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.filter(slug='balls').get().save()
+        for url in urls:
+            self.assertCached(url, cached=False)
+
+    def test_bump_waits_for_commit(self):
+        self.warm('/api/products/')
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.rope.save()
+            self.assertCached('/api/products/')
+        for callback in callbacks:
+            callback()
+        self.assertCached('/api/products/', cached=False)
+
+
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Мячи', slug='balls')
+        self.product = Product.objects.create(name='Мяч', slug='ball', description='', price='10.50', category=self.category)
+
+    def assertConditional(self, url, client=None):
+        """Первый ответ 200 с валидаторами; повтор с любым из них - 304 без тела. Возвращает ETag"""
+        client = client or self.client
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertTrue(etag.startswith('"'))
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        response = client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+        return etag
+
+    def test_catalog_lists(self):
+        products_etag = self.assertConditional('/api/products/')
+        categories_etag = self.assertConditional('/api/categories/')
+        # ETag зависит от параметров запроса
+        self.assertNotEqual(self.client.get('/api/products/', {'category': 'balls'})['ETag'], products_etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = '12.00'
+            self.product.save()
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=products_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['price'], '12.00')
+        self.assertNotEqual(response['ETag'], products_etag)
+        self.assertEqual(self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=categories_etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Мячи и шары'
+            self.category.save()
+        self.assertEqual(self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=categories_etag).status_code, 200)
+
+    def test_order_detail(self):
+        owner = User.objects.create_user(username='buyer', password='password')
+        order = Order.objects.create(user=owner, first_name='Иван', last_name='Иванов', email='ivan@example.com',
+                                     phone='1', address='ул. Ленина, 1', city='Минск')
+        OrderItem.objects.create(order=order, product=self.product, quantity=1, price='10.50')
+        client = APIClient()
+        client.force_authenticate(owner)
+        url = f'/api/orders/{order.id}/'
+        etag = self.assertConditional(url, client)
+
+        # Валидаторы считаются только по заказам пользователя: чужой заказ - 404, а не 304
+        stranger = APIClient()
+        stranger.force_authenticate(User.objects.create_user(username='stranger', password='password'))
+        last_modified = client.get(url)['Last-Modified']
+        for headers in ({'HTTP_IF_NONE_MATCH': etag}, {'HTTP_IF_MODIFIED_SINCE': last_modified}):
+            self.assertEqual(stranger.get(url, **headers).status_code, 404)
+        self.assertEqual(APIClient().get(url, HTTP_IF_NONE_MATCH=etag).status_code, 401)
+
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_user(username='admin', password='password', is_staff=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.put(f'/api/admin/orders/{order.id}/status/', {'status': 'processing'}, format='json')
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data['status']), (200, 'processing'))
+        etag = response['ETag']
+        # В заказ встроены товары - изменение каталога тоже меняет ETag
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class FastSerializationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = APIClient()
+        user = User.objects.create_user(username='admin', password='password', is_staff=True)
+        self.admin.force_authenticate(user)
+        category = Category.objects.create(name='Мячи', slug='balls')
+        products = Product.objects.bulk_create([
+            Product(name=f'Мяч {i}', slug=f'ball-{i}', description='', price='10.50',
+                    category=category if i % 2 else None)
+            for i in range(5)
+        ])
+        ProductSpecification.objects.create(product=products[0], name='Бренд', value='Nike')
+        Review.objects.create(product=products[1], user=user, rating=4, comment='Хороший')
+        for product in products[:3]:
+            order = Order.objects.create(user=user, first_name='Иван', last_name='Иванов', email='ivan@example.com',
+                                         phone='1', address='ул. Ленина, 1', city='Минск', total_price='21.00')
+            OrderItem.objects.create(order=order, product=product, quantity=2, price='10.50')
+
+    def get_both(self, client, url, params):
+        """Ответ быстрого пути и обычной сериализации DRF"""
+        responses = []
+        for fast in (True, False):
+            cache.bump('products')
+            with override_settings(API_FAST_SERIALIZATION=fast):
+                response = client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            responses.append(response.content)
+        return responses
+
+    def test_fast_path_matches_drf_byte_for_byte(self):
+        for client, url, params in [
+            (self.client, '/api/products/', {}),
+            (self.client, '/api/products/', {'fields': 'name,price', 'page_size': 2}),
+            (self.admin, '/api/admin/orders/', {'page_size': 2}),
+        ]:
+            fast, drf = self.get_both(client, url, params)
+            self.assertEqual(fast, drf)
+
+    def test_fields_with_next_cursor(self):
+        response = self.client.get('/api/products/', {'fields': 'name', 'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), {'name'})
+        response = self.client.get('/api/products/', {'fields': 'name', 'cursor': response.data['next_cursor']})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_admin_orders_are_paginated(self):
+        response = self.admin.get('/api/admin/orders/', {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.admin.get('/api/admin/orders/', {'cursor': response.data['next_cursor']})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next_cursor'])
+
+
+class CartViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, lines):
+        products = Product.objects.bulk_create([
+            Product(name=f'Товар {i}', slug=f'product-{i}', description='', price='10.50')
+            for i in range(lines)
+        ])
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=product, quantity=2) for product in products
+        ])
+
+    def test_compact_payload(self):
+        self.fill_cart(1)
+        response = self.client.get('/api/cart/')
+        self.assertEqual(response.status_code, 200)
+        item = response.data['items'][0]
+        self.assertEqual(set(item['product']), {'id', 'name', 'price', 'image_url'})
+        self.assertEqual(item['total_price'], '21.00')
+        self.assertEqual(response.data['total_price'], '21.00')
+        self.assertEqual(response.data['total_items'], 2)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        for lines in (1, 200):
+            CartItem.objects.all().delete()
+            Product.objects.all().delete()
+            self.fill_cart(lines)
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/cart/')
+            self.assertEqual(len(response.data['items']), lines)
+            self.assertEqual(response.data['total_price'], f'{21 * lines:.2f}')
+
+    def test_missing_cart(self):
+        self.cart.delete()
+        response = self.client.get('/api/cart/')
+        self.assertEqual(response.data['items'], [])
+        self.assertEqual(response.data['total_price'], '0.00')
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Товар {i}', slug=f'product-{i}', description='', price='10.50') for i in range(3)
+        ])
+
+    def batch(self, *operations):
+        return self.client.post('/api/cart/batch/', {'operations': list(operations)}, format='json')
+
+    def quantities(self):
+        return dict(CartItem.objects.values_list('product_id', 'quantity'))
+
+    def test_fold_operations(self):
+        self.assertEqual(fold_operations([('add', 1, 2), ('add', 1, 3)]), {1: ('add', 5)})
+        self.assertEqual(fold_operations([('set', 1, 2), ('add', 1, 3)]), {1: ('set', 5)})
+        self.assertEqual(fold_operations([('add', 1, 2), ('remove', 1, 0), ('add', 1, 1)]), {1: ('set', 1)})
+        self.assertEqual(fold_operations([('add', 1, 2), ('set', 1, 0)]), {1: ('remove', 0)})
+        with override_settings(CART_MAX_QUANTITY=5):
+            self.assertEqual(fold_operations([('add', 1, 4), ('add', 1, 4)]), {1: ('add', 5)})
+
+    def test_update_item_uses_cart_operations(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        url = f'/api/cart/update/{item.id}/'
+        response = self.client.put(url, {'quantity': 3}, format='json')
+        self.assertEqual((response.status_code, response.data['id'], response.data['quantity']), (200, item.id, 3))
+        for quantity in (1000000, -1, 'много', None):
+            response = self.client.put(url, {'quantity': quantity}, format='json')
+            self.assertEqual(response.status_code, 400, quantity)
+        self.assertEqual(self.quantities(), {self.products[0].id: 3})
+        Product.objects.filter(id=self.products[0].id).update(in_stock=False)
+        self.assertEqual(self.client.put(url, {'quantity': 2}, format='json').status_code, 409)
+        response = self.client.put(url, {'quantity': 0}, format='json')
+        self.assertEqual(response.data, {"message": "Item removed from cart"})
+        self.assertEqual(self.quantities(), {})
+        self.assertEqual(self.client.put(url, {'quantity': 1}, format='json').status_code, 404)
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other', password='password'))
+        item = CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=1)
+        self.assertEqual(other.put(f'/api/cart/update/{item.id}/', {'quantity': 2}, format='json').status_code, 404)
+
+    def test_batch_is_applied_in_order(self):
+        first, second, third = self.products
+        CartItem.objects.create(cart=self.cart, product=first, quantity=1)
+        CartItem.objects.create(cart=self.cart, product=second, quantity=1)
+        response = self.batch(
+            {'op': 'add', 'product_id': first.id, 'quantity': 2},
+            {'op': 'remove', 'product_id': second.id},
+            {'op': 'set', 'product_id': third.id, 'quantity': 4},
+            {'op': 'add', 'product_id': third.id},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {first.id: 3, third.id: 5})
+        self.assertEqual(response.data['total_items'], 8)
+
+    def test_invalid_operations_change_nothing(self):
+        product_id = self.products[0].id
+        response = self.batch(
+            {'op': 'add', 'product_id': product_id},
+            {'op': 'add', 'product_id': product_id, 'quantity': 2 ** 40},
+        )
+        self.assertEqual((response.status_code, response.data['index']), (400, 1))
+        response = self.batch({'op': 'set', 'product_id': 0, 'quantity': 1})
+        self.assertEqual((response.status_code, response.data['product_ids']), (404, [0]))
+        self.assertEqual(self.quantities(), {})
+
+    @override_settings(CART_MAX_QUANTITY=10)
+    def test_added_quantity_is_capped(self):
+        product = self.products[0]
+        CartItem.objects.create(cart=self.cart, product=product, quantity=8)
+        self.batch({'op': 'add', 'product_id': product.id, 'quantity': 5})
+        self.assertEqual(self.quantities(), {product.id: 10})
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Товар {i}', slug=f'product-{i}', description='', price='10.50') for i in range(3)
+        ])
+
+    def add(self, product, quantity=1, token=None):
+        headers = {'HTTP_X_GUEST_CART': token} if token else {}
+        return self.client.post('/api/cart/add/', {'product_id': product.id, 'quantity': quantity}, format='json',
+                                **headers)
+
+    def test_guest_cart_lives_in_cache(self):
+        token = self.add(self.products[0], 2).data['guest_token']
+        response = self.add(self.products[1], token=token)
+        self.assertEqual(response.data['guest_token'], token)
+        response = self.client.get('/api/cart/', HTTP_X_GUEST_CART=token)
+        self.assertEqual([item['quantity'] for item in response.data['items']], [2, 1])
+        self.assertEqual(response.data['total_price'], '31.50')
+        self.assertFalse(CartItem.objects.exists())
+
+    @override_settings(GUEST_CART_MAX_LINES=2)
+    def test_guest_cart_lines_are_capped(self):
+        token = self.add(self.products[0]).data['guest_token']
+        self.add(self.products[1], token=token)
+        response = self.add(self.products[2], token=token)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.add(self.products[1], token=token).status_code, 201)
+        response = self.client.get('/api/cart/', HTTP_X_GUEST_CART=token)
+        self.assertEqual(len(response.data['items']), 2)
+
+    def test_guest_cart_is_merged_on_login(self):
+        user = User.objects.create_user(username='buyer', password='password')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+        token = self.add(self.products[0], 2).data['guest_token']
+        self.add(self.products[1], token=token)
+        response = self.client.post('/api/token/', {'username': 'buyer', 'password': 'password'}, format='json',
+                                    HTTP_X_GUEST_CART=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(CartItem.objects.values_list('product_id', 'quantity')),
+            {self.products[0].id: 3, self.products[1].id: 1},
+        )
+        response = self.client.get('/api/cart/', HTTP_X_GUEST_CART=token)
+        self.assertEqual(response.data['items'], [])
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(name='Мяч', slug='ball', description='', price='10.50')
+
+    def add(self, key, quantity=1):
+        return self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': quantity},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def quantity(self):
+        return CartItem.objects.get().quantity
+
+    def test_server_error_rolls_back_view_writes(self):
+        calls = []
+
+        @api_view(['POST'])
+        @idempotent
+        def failing_view(request):
+            calls.append(request.data)
+            Product.objects.create(name='Скакалка', slug=f'rope-{len(calls)}', description='', price='2.50')
+            return Response({"error": "Сервис недоступен"}, status=503)
+
+        for _ in range(2):
+            request = APIRequestFactory().post('/api/failing/', {'n': 1}, format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+            force_authenticate(request, self.user)
+            self.assertEqual(failing_view(request).status_code, 503)
+        # Ответ не сохранен, повтор выполнил вью заново, записи вью откатились
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(list(Product.objects.values_list('slug', flat=True)), ['ball'])
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_repeat_replays_stored_response(self):
+        first = self.add('key-1', 2)
+        second = self.add('key-1', 2)
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.quantity(), 2)
+        self.add('key-2', 2)
+        self.assertEqual(self.quantity(), 4)
+
+    def test_key_reused_with_another_body(self):
+        self.add('key-1', 2)
+        response = self.add('key-1', 3)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.quantity(), 2)
+
+    def test_concurrent_duplicate_gets_committed_response(self):
+        stored = self.add('key-1', 2)
+        first = QuerySet.first
+        calls = []
+
+        def miss_once(queryset):
+            # Первый поиск ключа "не успел" увидеть коммит параллельного запроса
+            calls.append(queryset)
+            return None if len(calls) == 1 else first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', autospec=True, side_effect=miss_once):
+            response = self.add('key-1', 2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), stored.json())
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.quantity(), 2)
+
+    @override_settings(IDEMPOTENCY_KEY_TTL=60)
+    def test_expired_key_runs_again(self):
+        self.add('key-1', 2)
+        IdempotencyRecord.objects.update(created_at=timezone.now() - timedelta(seconds=61))
+        response = self.add('key-1', 2)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(self.quantity(), 4)
+        self.assertEqual(IdempotencyRecord.objects.count(), 1)
+
+
+class CreateOrderTests(TestCase):
+    ORDER_DATA = {
+        'first_name': 'Иван', 'last_name': 'Иванов', 'email': 'ivan@example.com',
+        'phone': '+375291234567', 'address': 'ул. Ленина, 1', 'city': 'Минск',
+    }
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, lines):
+        products = Product.objects.bulk_create([
+            Product(name=f'Товар {i}', slug=f'product-{i}', description='', price='10.50')
+            for i in range(lines)
+        ])
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=product, quantity=2) for product in products
+        ])
+
+    def test_order_is_created_from_cart(self):
+        self.fill_cart(3)
+        response = self.client.post('/api/orders/create/', self.ORDER_DATA, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_price'], '63.00')
+        self.assertEqual(response.data['total_items'], 6)
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertTrue(all(item['id'] for item in response.data['items']))
+        self.assertEqual(OrderItem.objects.filter(order_id=response.data['id']).count(), 3)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        for lines in (1, 50):
+            Product.objects.all().delete()
+            self.fill_cart(lines)
+            # SAVEPOINT, строки корзины, INSERT заказа, INSERT позиций, задачи письма и сводок, DELETE корзины, RELEASE
+            with self.assertNumQueries(8):
+                response = self.client.post('/api/orders/create/', self.ORDER_DATA, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data['items']), lines)
+
+    def test_empty_cart(self):
+        response = self.client.post('/api/orders/create/', self.ORDER_DATA, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_failure_leaves_no_partial_order(self):
+        self.fill_cart(2)
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.client.post('/api/orders/create/', self.ORDER_DATA, format='json')
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_stock_is_reserved_with_fixed_query_budget(self):
+        for lines in (1, 50):
+            Product.objects.all().delete()
+            self.fill_cart(lines)
+            Product.objects.update(stock=5)
+            # + блокировка строк товаров и условный UPDATE остатков
+            with self.assertNumQueries(10):
+                response = self.client.post('/api/orders/create/', self.ORDER_DATA, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {3})
+
+    def test_out_of_stock_rolls_back_checkout(self):
+        self.fill_cart(2)
+        first, second = Product.objects.order_by('id')
+        Product.objects.filter(id=first.id).update(stock=5)
+        Product.objects.filter(id=second.id).update(stock=1)
+        response = self.client.post('/api/orders/create/', self.ORDER_DATA, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['items'], [
+            {'product_id': second.id, 'name': second.name, 'requested': 2, 'available': 1},
+        ])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertEqual(Product.objects.get(id=first.id).stock, 5)
+
+    def test_cancel_releases_reserved_stock_once(self):
+        self.fill_cart(1)
+        Product.objects.update(stock=5)
+        order_id = self.client.post('/api/orders/create/', self.ORDER_DATA, format='json').data['id']
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_user(username='admin', password='password', is_staff=True))
+        for _ in range(2):
+            response = admin.put(f'/api/admin/orders/{order_id}/status/', {'status': 'cancelled'}, format='json')
+            self.assertEqual(response.data['status'], 'cancelled')
+        self.assertEqual(Product.objects.get().stock, 5)
+        response = admin.put(f'/api/admin/orders/{order_id}/status/', {'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_sold_out_product_leaves_catalog_until_released(self):
+        self.fill_cart(1)
+        product = Product.objects.get()
+        Product.objects.update(stock=2)
+        ProductSpecification.objects.create(product=product, name='Бренд', value='Nike')
+        with self.captureOnCommitCallbacks(execute=True):
+            order_id = self.client.post('/api/orders/create/', self.ORDER_DATA, format='json').data['id']
+        self.assertEqual(Product.objects.values_list('stock', 'in_stock').get(), (0, False))
+        self.assertEqual(self.client.get('/api/products/').data['results'], [])
+        self.assertEqual(self.client.get('/api/products/').data['facets'], {})
+        response = self.client.post('/api/cart/add/', {'product_id': product.id}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_user(username='admin', password='password', is_staff=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.put(f'/api/admin/orders/{order_id}/status/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(Product.objects.values_list('stock', 'in_stock').get(), (2, True))
+        self.assertEqual(len(self.client.get('/api/products/').data['results']), 1)
+        self.assertEqual(self.client.get('/api/products/').data['facets'], {'Бренд': [{'value': 'Nike', 'count': 1}]})
+
+    def test_stock_is_admin_only_and_drives_in_stock(self):
+        caches['default'].clear()
+        product = Product.objects.create(name='Мяч', slug='ball', description='', price='10.50', stock=3)
+        self.assertNotIn('stock', self.client.get('/api/products/ball/').data)
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_user(username='admin', password='password', is_staff=True))
+        url = f'/api/admin/products/{product.id}/'
+        self.assertEqual(admin.get(url).data['stock'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = admin.put(url, {'stock': 0}, format='json')
+        self.assertEqual((response.data['stock'], response.data['in_stock']), (0, False))
+        self.assertEqual(self.client.get('/api/products/').data['results'], [])
+        # Пока остаток ведется, наличие не задать в обход него
+        response = admin.put(url, {'stock': 0, 'in_stock': True}, format='json')
+        self.assertFalse(response.data['in_stock'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = admin.put(url, {'stock': 5}, format='json')
+        self.assertTrue(response.data['in_stock'])
+        self.assertEqual(len(self.client.get('/api/products/').data['results']), 1)
+
+        admin.generic('POST', '/api/admin/products/import/', b'slug,stock\nball,0\n', content_type='text/csv')
+        self.assertEqual(Product.objects.values_list('stock', 'in_stock').get(), (0, False))
+        admin.generic('POST', '/api/admin/products/import/', b'slug,stock\nball,2\n', content_type='text/csv')
+        self.assertEqual(Product.objects.values_list('stock', 'in_stock').get(), (2, True))
+
+    def test_bulk_status_change(self):
+        product = Product.objects.create(name='Товар', slug='product', description='', price='10.50', stock=0)
+        orders = Order.objects.bulk_create([
+            Order(user=self.user, status='pending', first_name='Иван', last_name='Иванов', email='ivan@example.com',
+                  phone='1', address='ул. Ленина, 1', city='Минск')
+            for _ in range(20)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=2, price='10.50', reserved=True) for order in orders
+        ])
+        Order.objects.filter(id=orders[0].id).update(status='cancelled')
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_user(username='admin', password='password', is_staff=True))
+        ids = [order.id for order in orders]
+        # SAVEPOINT, блокировка заказов, UPDATE заказов, резерв (агрегат, блокировка и UPDATE товаров, позиции),
+        # характеристики вернувшегося в наличие товара для фасетов, задачи сводок, RELEASE
+        with self.assertNumQueries(10):
+            response = admin.post('/api/admin/orders/status/', {'order_ids': ids + [0], 'status': 'cancelled'}, format='json')
+        self.assertEqual(response.data['updated'], ids[1:])
+        self.assertEqual(response.data['unchanged'], [ids[0]])
+        self.assertEqual(response.data['not_found'], [0])
+        self.assertEqual(Product.objects.get().stock, 38)
+        response = admin.post('/api/admin/orders/status/', {'order_ids': ids[:2], 'status': 'shipped'}, format='json')
+        self.assertEqual(response.data['updated'], [])
+        self.assertEqual([row['id'] for row in response.data['rejected']], ids[:2])
+        self.assertEqual(Order.objects.filter(status='cancelled').count(), 20)
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Товар {i}', slug=f'product-{i}', description='', price='10.50') for i in range(3)
+        ])
+
+    def create_orders(self, count):
+        orders = Order.objects.bulk_create([
+            Order(user=self.user, first_name='Иван', last_name='Иванов', email='ivan@example.com', phone='1',
+                  address='ул. Ленина, 1', city='Минск')
+            for _ in range(count)
+        ])
+        # У заказа i позиции с количествами 1..i+1 (не больше трех товаров)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=quantity, price='10.50')
+            for i, order in enumerate(orders)
+            for quantity, product in enumerate(self.products[:i % 3 + 1], start=1)
+        ])
+        # Первый заказ - в архиве, страница собирается из обеих таблиц
+        Order.objects.filter(id=orders[0].id).update(
+            status='delivered', in_rollups=True, created_at=timezone.now() - timedelta(days=400),
+        )
+        archive_orders(days=365)
+        return orders
+
+    def test_query_count_does_not_depend_on_history_length(self):
+        for count in (2, 30):
+            Order.objects.all().delete()
+            ArchivedOrder.objects.all().delete()
+            self.create_orders(count)
+            # Заказы с SUM(quantity) и позиции с товарами - по разу для оперативной таблицы и архива
+            with self.assertNumQueries(4):
+                response = self.client.get('/api/orders/', {'page_size': 20})
+            self.assertEqual(len(response.data['results']), min(count, 20))
+            with self.assertNumQueries(2):
+                self.client.get('/api/orders/', {'page_size': 20, 'summary': 1})
+
+    def test_total_items_with_items_prefetch(self):
+        orders = self.create_orders(3)
+        expected = {order.id: sum(range(1, i % 3 + 2)) for i, order in enumerate(orders)}
+        for params in ({}, {'summary': 1}):
+            response = self.client.get('/api/orders/', params)
+            self.assertEqual({order['id']: order['total_items'] for order in response.data['results']}, expected)
+        for order in self.client.get('/api/orders/').data['results']:
+            self.assertEqual(order['total_items'], sum(item['quantity'] for item in order['items']))
+            self.assertEqual(len(order['items']), len(set(item['id'] for item in order['items'])))
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        registry = {'tests.ok': lambda **payload: self.calls.append(payload), 'tests.fail': self.fail_job}
+        patcher = mock.patch.dict(jobs._registry, registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fail_job(self, **payload):
+        raise RuntimeError('boom')
+
+    def test_claim_takes_ready_jobs_in_order(self):
+        later = jobs.enqueue('tests.ok', {'n': 0}, delay=60)
+        first, second, third = [jobs.enqueue('tests.ok', {'n': n}) for n in range(1, 4)]
+        claimed = jobs.Worker('a', batch_size=2).claim()
+        self.assertEqual([job.id for job in claimed], [first.id, second.id])
+        self.assertEqual([job.id for job in jobs.Worker('b', batch_size=2).claim()], [third.id])
+        self.assertEqual(jobs.Worker('c').claim(), [])
+        self.assertEqual(Job.objects.get(id=later.id).status, Job.QUEUED)
+        # Токен захвата - имя воркера (с суффиксом в ветке без SKIP LOCKED)
+        owners = Job.objects.filter(status=Job.RUNNING).values_list('locked_by', flat=True)
+        self.assertEqual({owner.split(':')[0] for owner in owners}, {'a', 'b'})
+
+    def test_skip_locked_claim(self):
+        jobs.enqueue('tests.ok', {'n': 1})
+        # На SQLite FOR UPDATE не пишется в SQL, но проверяется ветка захвата для PostgreSQL
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', True):
+            claimed = jobs.Worker('a').claim()
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(Job.objects.get().locked_by, 'a')
+        self.assertEqual(jobs.Worker('b').run_batch(), {})
+
+    def test_fallback_claim_skips_jobs_taken_by_another_worker(self):
+        first, second = jobs.enqueue('tests.ok', {'n': 1}), jobs.enqueue('tests.ok', {'n': 2})
+        update = QuerySet.update
+
+        def steal_first(queryset, **kwargs):
+            # Другой воркер забирает первую задачу между выборкой id и UPDATE
+            if not Job.objects.filter(locked_by='other').exists():
+                update(Job.objects.filter(id=first.id), status=Job.RUNNING, locked_by='other')
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', False), \
+                mock.patch.object(QuerySet, 'update', autospec=True, side_effect=steal_first):
+            claimed = jobs.Worker('a').claim()
+        self.assertEqual([job.id for job in claimed], [second.id])
+        self.assertEqual(Job.objects.get(id=first.id).locked_by, 'other')
+
+    @override_settings(JOB_RETRY_BASE_DELAY=10, JOB_RETRY_MAX_DELAY=30)
+    def test_retry_with_backoff_then_fail(self):
+        job = jobs.enqueue('tests.fail', max_attempts=4)
+        worker = jobs.Worker('a')
+        delays = []
+        with mock.patch('api.jobs.random.uniform', return_value=1.0), self.assertLogs('api.jobs', 'WARNING'):
+            for attempt in range(1, 4):
+                Job.objects.filter(id=job.id).update(run_at=timezone.now())
+                before = timezone.now()
+                self.assertEqual(worker.run_batch(), {'retried': 1})
+                job.refresh_from_db()
+                self.assertEqual((job.status, job.attempts), (Job.QUEUED, attempt))
+                self.assertIn('boom', job.last_error)
+                delays.append(round((job.run_at - before).total_seconds()))
+                # Повтор еще не наступил
+                self.assertEqual(worker.run_batch(), {})
+        self.assertEqual(delays, [10, 20, 30])
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        with self.assertLogs('api.jobs', 'WARNING'):
+            self.assertEqual(worker.run_batch(), {'failed': 1})
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 4))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_retry_delay_jitter(self):
+        with override_settings(JOB_RETRY_BASE_DELAY=10, JOB_RETRY_MAX_DELAY=3600):
+            for _ in range(20):
+                self.assertTrue(8 <= jobs.retry_delay(1) <= 12)
+                self.assertTrue(32 <= jobs.retry_delay(3) <= 48)
+
+    def test_success(self):
+        job = jobs.enqueue('tests.ok', {'n': 1})
+        self.assertEqual(jobs.Worker('a').run_batch(), {'done': 1})
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (Job.DONE, 1, ''))
+        self.assertEqual(self.calls, [{'n': 1}])
+
+    @override_settings(JOB_LOCK_TIMEOUT=60)
+    def test_requeue_stale(self):
+        stale = jobs.enqueue('tests.ok', {'n': 1}, max_attempts=3)
+        exhausted = jobs.enqueue('tests.ok', {'n': 2}, max_attempts=3)
+        fresh = jobs.enqueue('tests.ok', {'n': 3})
+        jobs.Worker('dead').claim()
+        long_ago = timezone.now() - timedelta(seconds=120)
+        Job.objects.filter(id__in=[stale.id, exhausted.id]).update(locked_at=long_ago)
+        Job.objects.filter(id=exhausted.id).update(attempts=2)
+
+        self.assertEqual(jobs.requeue_stale(), 2)
+        stale.refresh_from_db()
+        exhausted.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.attempts, stale.locked_by), (Job.QUEUED, 1, ''))
+        self.assertIsNone(stale.finished_at)
+        self.assertEqual((exhausted.status, exhausted.attempts), (Job.FAILED, 3))
+        self.assertIsNotNone(exhausted.finished_at)
+        self.assertIn('JOB_LOCK_TIMEOUT', exhausted.last_error)
+        self.assertEqual(fresh.status, Job.RUNNING)
+        self.assertEqual(jobs.Worker('a').run_batch(), {'done': 1})
+        self.assertEqual(self.calls, [{'n': 1}])
+
+
+class SalesRollupTests(TestCase):
+    ORDER_DATA = CreateOrderTests.ORDER_DATA
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.admin = APIClient()
+        self.admin.force_authenticate(User.objects.create_user(username='admin', password='password', is_staff=True))
+        category = Category.objects.create(name='Мячи', slug='balls')
+        self.products = Product.objects.bulk_create([
+            Product(name='Мяч', slug='ball', description='', price='10.00', category=category),
+            Product(name='Скакалка', slug='rope', description='', price='2.50'),
+        ])
+
+    def checkout(self, quantities):
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=product, quantity=quantity)
+            for product, quantity in zip(self.products, quantities) if quantity
+        ])
+        order_id = self.client.post('/api/orders/create/', self.ORDER_DATA, format='json').data['id']
+        sync_order(order_id)
+        return order_id
+
+    def snapshot(self):
+        fields = ('date', 'revenue', 'units', 'orders')
+        return (
+            sorted(SalesDay.objects.values_list(*fields)),
+            sorted(SalesCategoryDay.objects.values_list('category_id', *fields), key=str),
+            sorted(SalesProductDay.objects.values_list('product_id', *fields)),
+        )
+
+    def category_rows(self):
+        return sorted(SalesCategoryDay.objects.values_list('category_id', 'revenue', 'units', 'orders'))
+
+    def test_incremental_rollups_match_rebuild(self):
+        self.checkout([2, 1])
+        cancelled = self.checkout([1, 4])
+        self.checkout([3, 0])
+        self.admin.put(f'/api/admin/orders/{cancelled}/status/', {'status': 'cancelled'}, format='json')
+        sync_order(cancelled)
+        sync_order(cancelled)  # повтор задачи ничего не меняет
+        incremental = self.snapshot()
+        rebuild()
+        self.assertEqual(incremental, self.snapshot())
+        day = SalesDay.objects.get()
+        self.assertEqual((day.revenue, day.units, day.orders), (Decimal('52.50'), 6, 2))
+        self.assertEqual(SalesProductDay.objects.get(product=self.products[1]).orders, 1)
+
+    def test_category_change_does_not_move_counted_sales(self):
+        first = self.checkout([2, 0])
+        balls = self.products[0].category
+        rackets = Category.objects.create(name='Ракетки', slug='rackets')
+        Product.objects.filter(id=self.products[0].id).update(category=rackets)
+        self.checkout([1, 0])
+        self.assertEqual(self.category_rows(), [(balls.id, Decimal('20.00'), 2, 1), (rackets.id, Decimal('10.00'), 1, 1)])
+        incremental = self.snapshot()
+        rebuild()
+        self.assertEqual(incremental, self.snapshot())
+        # Отмена вычитается из той же строки, куда заказ был прибавлен
+        self.admin.put(f'/api/admin/orders/{first}/status/', {'status': 'cancelled'}, format='json')
+        sync_order(first)
+        self.assertEqual(self.category_rows(), [(balls.id, Decimal('0.00'), 0, 0), (rackets.id, Decimal('10.00'), 1, 1)])
+
+    def test_deleted_category_sales_move_to_uncategorized(self):
+        self.checkout([2, 1])
+        self.checkout([1, 0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].category.delete()
+        # Заказ с товарами обеих строк считается в "без категории" один раз
+        self.assertEqual(self.category_rows(), [(None, Decimal('32.50'), 4, 2)])
+        incremental = self.snapshot()
+        rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_migration_backfills_orders_placed_before_rollups(self):
+        self.checkout([2, 1])
+        cancelled = self.checkout([1, 0])
+        Order.objects.filter(id=cancelled).update(status='cancelled')
+        # Заказы, оформленные до 0019: не учтены в сводках
+        Order.objects.update(in_rollups=False)
+        for model in (SalesDay, SalesCategoryDay, SalesProductDay):
+            model.objects.all().delete()
+        migration = importlib.import_module('api.migrations.0024_backfill_sales_rollups')
+        migration.rebuild_sales_rollups(django_apps, None)
+        self.assertEqual(
+            dict(Order.objects.values_list('id', 'in_rollups')), {cancelled - 1: True, cancelled: False},
+        )
+        day = SalesDay.objects.get()
+        self.assertEqual((day.revenue, day.units, day.orders), (Decimal('22.50'), 3, 1))
+        backfilled = self.snapshot()
+        rebuild()
+        self.assertEqual(backfilled, self.snapshot())
+
+    def test_stats_endpoint_reads_rollups(self):
+        self.checkout([1, 2])
+        # Дни, категории, топ товаров - независимо от числа заказов
+        with self.assertNumQueries(3):
+            response = self.admin.get('/api/admin/stats/', {'top': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['days']), 30)
+        self.assertEqual(response.data['totals'], {'revenue': '15.00', 'units': 3, 'orders': 1})
+        self.assertEqual(response.data['days'][-1]['revenue'], '15.00')
+        self.assertEqual([row['name'] for row in response.data['categories']], ['Мячи', None])
+        self.assertEqual(len(response.data['top_products']), 1)
+        response = self.admin.get('/api/admin/stats/', {'date_from': '2024-02-01', 'date_to': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.admin = APIClient()
+        self.admin.force_authenticate(User.objects.create_user(username='admin', password='password', is_staff=True))
+        user = User.objects.create_user(username='buyer', password='password')
+        product = Product.objects.create(name='Мяч', slug='ball', description='', price='10.00')
+        self.orders = Order.objects.bulk_create([
+            Order(user=user, status=order_status, payment_method=payment_method, total_price='20.00',
+                  first_name=first_name, last_name='Иванов', email='ivan@example.com', phone='+375 29 123-45-67',
+                  address='ул. Ленина, 1', city='Минск')
+            for order_status, payment_method, first_name in (
+                ('pending', 'card', 'Иван'), ('delivered', 'cash', '=HYPERLINK("x")'), ('cancelled', 'card', 'Петр'),
+            )
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=2, price='10.00') for order in self.orders
+        ])
+        for order, day in zip(self.orders, ('2026-01-10', '2026-01-20', '2026-02-01')):
+            Order.objects.filter(id=order.id).update(created_at=f'{day}T12:00:00Z')
+
+    def export(self, **params):
+        response = self.admin.get('/api/admin/orders/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response = self.admin.get('/api/admin/orders/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="orders-', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([int(row['id']) for row in rows], [order.id for order in self.orders])
+        self.assertEqual(rows[0]['username'], 'buyer')
+        self.assertEqual(rows[0]['phone'], '+375 29 123-45-67')
+        self.assertEqual(rows[1]['first_name'], '\'=HYPERLINK("x")')
+        self.assertEqual(rows[0]['created_at'], '2026-01-10T12:00:00+00:00')
+
+    def test_ndjson_items(self):
+        lines = self.export(type='ndjson', items='1').splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['order_id'], self.orders[0].id)
+        self.assertEqual((rows[0]['product_slug'], rows[0]['quantity'], rows[0]['price']), ('ball', 2, '10.00'))
+        # Формулы экранируются только в CSV
+        rows = [json.loads(line) for line in self.export(type='ndjson').splitlines()]
+        self.assertEqual(rows[1]['first_name'], '=HYPERLINK("x")')
+
+    def test_filters(self):
+        def ids(**params):
+            return [json.loads(line)['id'] for line in self.export(type='ndjson', **params).splitlines()]
+
+        first, second, third = [order.id for order in self.orders]
+        self.assertEqual(ids(date_from='2026-01-20'), [second, third])
+        # date_to включительно
+        self.assertEqual(ids(date_to='2026-01-20'), [first, second])
+        self.assertEqual(ids(status='pending,cancelled'), [first, third])
+        self.assertEqual(ids(payment_method='cash'), [second])
+        self.assertEqual(ids(status='cancelled', date_to='2026-01-31'), [])
+        items = [json.loads(line)['order_id'] for line in self.export(type='ndjson', items='1', status='delivered').splitlines()]
+        self.assertEqual(items, [second])
+
+    def test_invalid_parameters(self):
+        for params in ({'status': 'pending,lost'}, {'payment_method': 'crypto'}, {'date_from': '2026-13-01'},
+                       {'type': 'xlsx'}):
+            response = self.admin.get('/api/admin/orders/export/', params)
+            self.assertEqual(response.status_code, 400, params)
+        response = self.admin.get('/api/admin/orders/export/', {'status': 'pending,lost'})
+        self.assertIn('lost', response.data['error'])
+
+    def test_csv_cell_escapes_formulas(self):
+        for value in ('=1+1', '+SUM(A1)', '-2+3', '@cmd', '\tx', '\r=1'):
+            self.assertEqual(_csv_cell(value), "'" + value)
+        for value in ('+375 29 123-45-67', '-5', 'Иван', '', 5):
+            self.assertEqual(_csv_cell(value), value)
+
+
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(name='Товар', slug='product', description='', price='10.50')
+        for status in ['delivered', 'cancelled', 'pending', 'delivered']:
+            order = Order.objects.create(user=self.user, status=status, first_name='Иван', last_name='Иванов',
+                                         email='ivan@example.com', phone='1', address='ул. Ленина, 1', city='Минск')
+            OrderItem.objects.create(order=order, product=product, quantity=2, price='10.50')
+            sync_order(order.id)
+        self.old, self.cancelled, self.pending, self.recent = Order.objects.order_by('id')
+        Order.objects.exclude(id=self.recent.id).update(created_at=timezone.now() - timedelta(days=400))
+
+    def test_old_final_orders_are_archived_and_still_readable(self):
+        self.assertEqual(archive_orders(days=365, batch_size=1), (2, 2, 0))
+        self.assertEqual(list(Order.objects.order_by('id').values_list('id', flat=True)), [self.pending.id, self.recent.id])
+        response = self.client.get('/api/orders/', {'page_size': 3})
+        self.assertEqual([order['id'] for order in response.data['results']], [self.recent.id, self.pending.id, self.cancelled.id])
+        response = self.client.get('/api/orders/', {'cursor': response.data['next_cursor']})
+        self.assertEqual([order['id'] for order in response.data['results']], [self.old.id])
+        self.assertIsNone(response.data['next_cursor'])
+        response = self.client.get(f'/api/orders/{self.old.id}/')
+        self.assertEqual((response.data['status'], response.data['total_items']), ('delivered', 2))
+        self.assertTrue(ArchivedOrder.objects.filter(id=self.old.id).exists())
+
+
+    def test_orders_with_unsettled_rollups_are_skipped_and_reported(self):
+        # Доставлен до появления сводок (in_rollups=False) - архивировать нельзя, пока вклад не учтен
+        Order.objects.filter(id=self.old.id).update(in_rollups=False)
+        out = io.StringIO()
+        call_command('archive_orders', '--days=365', stdout=out)
+        self.assertIn('Пропущено заказов: 1', out.getvalue())
+        self.assertIn('Перенесено заказов: 1,', out.getvalue())
+        self.assertFalse(ArchivedOrder.objects.filter(id=self.old.id).exists())
+        sync_order(self.old.id)
+        self.assertEqual(archive_orders(days=365), (1, 1, 0))
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='password', is_staff=True))
+        Category.objects.create(name='Мячи', slug='balls')
+
+    def post_csv(self, body):
+        if isinstance(body, str):
+            body = body.encode()
+        return self.client.generic('POST', '/api/admin/products/import/', body, content_type='text/csv')
+
+    def test_upsert_by_slug_with_row_errors(self):
+        response = self.post_csv(
+            'slug,name,price,category,spec.Бренд\n'
+            'ball,Мяч,10.50,balls,Nike\n'
+            'bad,Мяч,цена,balls,Nike\n'
+            'rope,Скакалка,2.50,,\n'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['error_count']), (2, 1))
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertEqual(list(ProductSpecification.objects.values_list('name', 'value')), [('Бренд', 'Nike')])
+
+        response = self.post_csv('slug,price,spec.Бренд\nball,12.00,Adidas\nrope,2.50,\n')
+        self.assertEqual((response.data['updated'], response.data['unchanged']), (1, 1))
+        self.assertEqual(str(Product.objects.get(slug='ball').price), '12.00')
+        self.assertEqual(list(ProductSpecification.objects.values_list('value', flat=True)), ['Adidas'])
+
+
+    def test_partial_specifications_keep_the_rest(self):
+        self.post_csv('slug,name,price,spec.Бренд,spec.Цвет,spec.Размер\nball,Мяч,10.50,Nike,Белый,5\n')
+        # Меняются только колонки файла; пустая ячейка удаляет характеристику
+        response = self.post_csv('slug,spec.Бренд,spec.Цвет\nball,Adidas,\n')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(
+            sorted(ProductSpecification.objects.values_list('name', 'value')), [('Бренд', 'Adidas'), ('Размер', '5')],
+        )
+        line = json.dumps({'slug': 'ball', 'specifications': {'Вес': '400 г'}}).encode()
+        response = self.client.generic('POST', '/api/admin/products/import/', line, content_type='application/x-ndjson')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(ProductSpecification.objects.count(), 3)
+
+    def test_file_not_in_utf8(self):
+        # Заголовок в cp1251 (CSV из Excel) - файл отклоняется до первой пачки
+        response = self.post_csv('slug,name,price,spec.Бренд\nball,Мяч,10.50,Nike\n'.encode('cp1251'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('UTF-8', response.data['error'])
+        response = self.client.generic('POST', '/api/admin/products/import/', '[{"slug": "Мяч"}]'.encode('cp1251'),
+                                       content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.exists())
+
+    def test_undecodable_and_malformed_rows_are_row_errors(self):
+        body = b''.join([
+            'slug,name,price\nball,Мяч,10.50\n'.encode(),
+            'rope,Скакалка,2.50\n'.encode('cp1251'),
+            f'net,"{"x" * 200000}",1.00\n'.encode(),
+            'bat,Бита,5.00\n'.encode(),
+        ])
+        with override_settings(PRODUCT_IMPORT_BATCH_SIZE=1):
+            response = self.post_csv(body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['error_count']), (2, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3])
+        self.assertEqual(sorted(Product.objects.values_list('slug', flat=True)), ['ball', 'bat'])
+        lines = [json.dumps({'slug': 'ball', 'price': '11.00'}).encode(), '{"slug": "Мяч"}'.encode('cp1251'), b'']
+        response = self.client.generic('POST', '/api/admin/products/import/', b'\n'.join(lines),
+                                       content_type='application/x-ndjson')
+        self.assertEqual((response.data['updated'], response.data['error_count']), (1, 1))
+
+    def test_command_rejects_file_not_in_utf8(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as upload:
+            upload.write('slug,name,price,spec.Бренд\nball,Мяч,10.50,Nike\n'.encode('cp1251'))
+            upload.flush()
+            with self.assertRaisesMessage(CommandError, 'UTF-8'):
+                call_command('add_products', upload.name, stdout=io.StringIO())
+        self.assertFalse(Product.objects.exists())
+
+    def test_non_scalar_values_are_row_errors(self):
+        rows = [
+            {'slug': 'ball', 'name': 'Мяч', 'price': '10.50', 'category': ['balls']},
+            {'slug': 'rope', 'name': ['Скакалка'], 'price': '2.50'},
+            {'slug': 'bat', 'name': 'Бита', 'price': '5.00', 'specifications': {'Бренд': {'name': 'Nike'}}},
+            {'slug': 'net', 'name': 'Сетка', 'price': '5.00', 'specifications': [{'name': 'Цвет', 'value': ['Белый']}]},
+        ]
+        response = self.client.post('/api/admin/products/import/', rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['error_count'], 4)
+        self.assertEqual([list(error['errors']) for error in response.data['errors']],
+                         [['category'], ['name'], ['specifications'], ['specifications']])
+        self.assertFalse(Product.objects.exists())
+
+
+class AddProductsCommandTests(TestCase):
+    CSV = 'slug,name,price,spec.Бренд,spec.Цвет\nball,Мяч,10.50,Nike,Белый\nrope,Скакалка,2.50,,\n'
+
+    def run_command(self, body, *args, stdin=False):
+        out = io.StringIO()
+        if stdin:
+            with mock.patch('sys.stdin', io.TextIOWrapper(io.BytesIO(body.encode()))):
+                call_command('add_products', '-', *args, stdout=out)
+            return out.getvalue()
+        with tempfile.NamedTemporaryFile(suffix='.csv') as upload:
+            upload.write(body.encode())
+            upload.flush()
+            call_command('add_products', upload.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_counts(self):
+        self.assertIn('Создано: 2, Обновлено: 0, Без изменений: 0, Ошибок: 0', self.run_command(self.CSV))
+        self.assertIn('Создано: 0, Обновлено: 0, Без изменений: 2, Ошибок: 0', self.run_command(self.CSV))
+        output = self.run_command('slug,price\nball,12.00\nrope,2.50\nbat,\n')
+        self.assertIn('Создано: 0, Обновлено: 1, Без изменений: 1, Ошибок: 1', output)
+        self.assertIn('строка 3 (bat)', output)
+        self.assertEqual(str(Product.objects.get(slug='ball').price), '12.00')
+
+    def test_dry_run(self):
+        output = self.run_command(self.CSV, '--dry-run')
+        self.assertIn('Проверка (--dry-run), ничего не записано. Готово! Создано: 2', output)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(ProductSpecification.objects.exists())
+
+    def test_format_and_stdin(self):
+        ndjson = json.dumps({'slug': 'ball', 'name': 'Мяч', 'price': '10.50', 'specifications': {'Бренд': 'Nike'}})
+        # Формат stdin не определить по расширению
+        with self.assertRaisesMessage(CommandError, '--format'):
+            self.run_command(ndjson, stdin=True)
+        self.assertIn('Создано: 1', self.run_command(ndjson, '--format', 'ndjson', stdin=True))
+        self.assertEqual(list(ProductSpecification.objects.values_list('name', 'value')), [('Бренд', 'Nike')])
+        # Явный --format важнее расширения файла
+        self.assertIn('Без изменений: 1', self.run_command(ndjson + '\n', '--format=ndjson'))
+
+    def test_replace_specs(self):
+        self.run_command(self.CSV)
+        self.run_command('slug,spec.Бренд\nball,Adidas\n')
+        self.assertEqual(
+            sorted(ProductSpecification.objects.values_list('name', 'value')), [('Бренд', 'Adidas'), ('Цвет', 'Белый')],
+        )
+        # Полная выгрузка: выпавшие характеристики удаляются
+        self.assertIn('Обновлено: 1', self.run_command('slug,spec.Бренд\nball,Adidas\n', '--replace-specs'))
+        self.assertEqual(list(ProductSpecification.objects.values_list('name', 'value')), [('Бренд', 'Adidas')])
+
+    def test_demo_catalog(self):
+        output = io.StringIO()
+        call_command('add_products', stdout=output)
+        self.assertIn('Без изменений: 0, Ошибок: 0', output.getvalue())
+        self.assertEqual(Category.objects.count(), 4)
+        created = Product.objects.count()
+        self.assertGreater(created, 0)
+        output = io.StringIO()
+        call_command('add_products', stdout=output)
+        self.assertIn(f'Создано: 0, Обновлено: 0, Без изменений: {created}', output.getvalue())
+
+
+class AdminProductSpecificationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='password', is_staff=True))
+        self.product = Product.objects.create(name='Мяч', slug='ball', description='', price='10.50')
+        ProductSpecification.objects.bulk_create([
+            ProductSpecification(product=self.product, name=name, value=value)
+            for name, value in [('Бренд', 'Nike'), ('Размер', '5'), ('Цвет', 'Белый')]
+        ])
+        self.url = f'/api/admin/products/{self.product.id}/'
+
+    def put_specs(self, specs):
+        return self.client.put(self.url, {'specifications': [{'name': n, 'value': v} for n, v in specs]}, format='json')
+
+    def test_unchanged_specifications_are_not_rewritten(self):
+        ids = list(ProductSpecification.objects.order_by('id').values_list('id', flat=True))
+        versions = cache.get_versions(['products', f'product:{self.product.id}'])
+        with mock.patch('api.catalog_import.search.index_product') as index_product, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.put_specs([('Бренд', 'Nike'), ('Размер', '5'), ('Цвет', 'Белый')])
+        self.assertEqual(response.status_code, 200)
+        index_product.assert_not_called()
+        self.assertEqual(callbacks, [])
+        self.assertEqual(list(ProductSpecification.objects.order_by('id').values_list('id', flat=True)), ids)
+        self.assertEqual(cache.get_versions(['products', f'product:{self.product.id}']), versions)
+
+    def test_specifications_are_diffed(self):
+        brand = ProductSpecification.objects.get(name='Бренд')
+        versions = cache.get_versions([f'product:{self.product.id}'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.put_specs([('Бренд', 'Nike'), ('Размер', '6'), ('Вес', '400 г')])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(cache.get_versions([f'product:{self.product.id}']), versions)
+        self.assertEqual(
+            dict(ProductSpecification.objects.values_list('name', 'value')),
+            {'Бренд': 'Nike', 'Размер': '6', 'Вес': '400 г'},
+        )
+        self.assertEqual(ProductSpecification.objects.get(name='Бренд').id, brand.id)
+        self.assertEqual(len(response.data['specifications']), 3)
@@ -1,25 +1,26 @@
 from django.urls import path
-from rest_framework_simplejwt.views import TokenObtainPairView
 from . import views
 
 urlpatterns = [
     # Authentication endpoints
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('token/', views.TokenObtainPairWithCartView.as_view(), name='token_obtain_pair'),
     path('register/', views.register_view, name='register'),
     path('user/', views.user_view, name='user'),
     
     # Public endpoints
     path('contact/', views.contact_view, name='contact'),
     path('products/', views.products_view, name='products'),
+    path('products/search/', views.product_search_view, name='product-search'),
     # Review endpoints должны быть ПЕРЕД product-detail, чтобы избежать конфликтов
     path('products/<int:product_id>/reviews/', views.product_reviews_view, name='product-reviews'),
     path('products/<int:product_id>/reviews/create/', views.create_review_view, name='create-review'),
     path('products/<str:slug>/', views.product_detail_view, name='product-detail'),
     path('categories/', views.categories_view, name='categories'),
     
-    # Cart endpoints (authenticated)
+    # Cart endpoints (cart/, cart/add/, cart/batch/ доступны и гостям)
     path('cart/', views.cart_view, name='cart'),
     path('cart/add/', views.add_to_cart_view, name='add-to-cart'),
+    path('cart/batch/', views.cart_batch_view, name='cart-batch'),
     path('cart/remove/<int:item_id>/', views.remove_from_cart_view, name='remove-from-cart'),
     path('cart/update/<int:item_id>/', views.update_cart_item_view, name='update-cart-item'),
     
@@ -34,12 +35,19 @@ urlpatterns = [
     
     # Review endpoints (remaining)
     path('reviews/<int:review_id>/', views.review_detail_view, name='review-detail'),
+    path('reviews/<int:review_id>/helpful/', views.review_helpful_view, name='review-helpful'),
     
     # Admin endpoints
     path('admin/products/', views.admin_products_view, name='admin-products'),
+    path('admin/products/import/', views.admin_products_import_view, name='admin-products-import'),
     path('admin/products/<int:product_id>/', views.admin_product_detail_view, name='admin-product-detail'),
     path('admin/categories/', views.admin_categories_view, name='admin-categories'),
     path('admin/orders/', views.admin_orders_view, name='admin-orders'),
+    path('admin/orders/export/', views.admin_orders_export_view, name='admin-orders-export'),
+    path('admin/orders/status/', views.admin_orders_status_view, name='admin-orders-status'),
     path('admin/orders/<int:order_id>/status/', views.admin_order_status_view, name='admin-order-status'),
     path('admin/contacts/', views.admin_contacts_view, name='admin-contacts'),
+    path('admin/cache-stats/', views.admin_cache_stats_view, name='admin-cache-stats'),
+    path('admin/jobs/stats/', views.admin_job_stats_view, name='admin-job-stats'),
+    path('admin/stats/', views.admin_stats_view, name='admin-stats'),
 ]
\ No newline at end of file
@@ -3,19 +3,79 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.http import condition
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
+import io
 import logging
-from .models import Contact, Product, Cart, CartItem, Order, OrderItem, Category, ProductSpecification, PaymentCard, Review
+from datetime import datetime, timezone as dt_timezone
+from .pagination import DEFAULT_ORDERING, InvalidCursor, get_page_size, ordering_fields, paginate_keyset, paginate_keyset_merged
+from .archive import get_order
+from .search import search_product_ids
+from .facets import facet_counts, filter_by_specs, parse_spec_filters
+from .fastserialize import compile_serializer
+from . import guest_carts
+from .carts import (
+    CartOperationError, UnavailableProducts, UnknownProducts, apply_operations, check_products, compact_cart_payload,
+    parse_operations,
+)
+from .idempotency import idempotent
+from .jobs import enqueue as enqueue_job, queue_stats as job_queue_stats
+from .stock import OutOfStock, reserve as reserve_stock
+from .order_status import change_status as change_order_status, max_orders as max_status_orders
+from .rollups import parse_period, sales_report
+from . import catalog_import, exports
+from .cache import cache_response, get_scope_state, get_stats as get_cache_stats, scope_etag, scope_last_modified
+from .models import Contact, Product, Cart, CartItem, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, Category, ProductSpecification, PaymentCard, Review, ReviewVote
 from .serializers import (
-    ContactSerializer, ProductSerializer, CartSerializer, CartItemSerializer,
-    OrderSerializer, OrderItemSerializer, CategorySerializer, ProductSpecificationSerializer,
-    PaymentCardSerializer, PaymentCardCreateSerializer, ReviewSerializer
+    AdminProductSerializer, ContactSerializer, ProductSerializer, ProductListSerializer, CartItemSerializer,
+    OrderSerializer, OrderSummarySerializer, OrderItemSerializer, CategorySerializer, ProductSpecificationSerializer,
+    PaymentCardSerializer, PaymentCardCreateSerializer, ProductEmbedSerializer, ReviewSerializer, parse_fields_param
 )
 
 logger = logging.getLogger(__name__)
 
+# Области версий кэша (api.cache), от которых зависит ответ эндпоинта
+def products_scopes(request):
+    return ['products']
+
+def product_detail_scopes(request, slug):
+    return [f'product:{slug}', 'categories']
+
+def categories_scopes(request):
+    return ['categories']
+
+def _order_validators(request, order_id):
+    """(ETag, Last-Modified) заказа из updated_at и версии каталога - один легкий запрос"""
+    if not hasattr(request, '_order_validators'):
+        updated_at = get_order(
+            Order.objects.values_list('updated_at', flat=True),
+            ArchivedOrder.objects.values_list('updated_at', flat=True),
+            id=order_id, user=request.user,
+        )
+        if updated_at is None:
+            request._order_validators = (None, None)
+        else:
+            # В заказ встроены товары, поэтому учитываем и изменения каталога
+            (version,), catalog_mtime = get_scope_state(['products'])
+            last_modified = max(updated_at, datetime.fromtimestamp(catalog_mtime, tz=dt_timezone.utc))
+            request._order_validators = (f'order-{order_id}-{updated_at.timestamp()}-{version}', last_modified)
+    return request._order_validators
+
+def order_etag(request, order_id):
+    return _order_validators(request, order_id)[0]
+
+def order_last_modified(request, order_id):
+    return _order_validators(request, order_id)[1]
+
 # Authentication endpoints
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -45,6 +105,8 @@ def register_view(request):
         
         # Create user
         user = User.objects.create_user(username=username, email=email, password=password)
+        enqueue_job('users.send_welcome', {'user_id': user.id})
+        guest_carts.merge_into_user(request, user)
         refresh = RefreshToken.for_user(user)
         
         logger.info(f"User created successfully: {username}")
@@ -59,6 +121,18 @@ def register_view(request):
         logger.error(f"Registration error: {error_msg}", exc_info=True)
         return Response({"error": "Произошла ошибка при регистрации. Пожалуйста, попробуйте снова."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class TokenObtainPairWithCartView(TokenObtainPairView):
+    """Вход по логину и паролю; гостевая корзина из X-Guest-Cart переносится в корзину пользователя"""
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0]) from e
+        guest_carts.merge_into_user(request, serializer.user)
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_view(request):
@@ -75,75 +149,158 @@ def contact_view(request):
     if request.method == 'POST':
         serializer = ContactSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            contact = serializer.save()
+            enqueue_job('contacts.notify_admins', {'contact_id': contact.id})
             return Response({"message": "Сообщение отправлено успешно"}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@condition(etag_func=scope_etag('products', products_scopes), last_modified_func=scope_last_modified(products_scopes))
+@cache_response('products', products_scopes)
 def products_view(request):
     category_slug = request.query_params.get('category', None)
-    products = Product.objects.filter(in_stock=True).prefetch_related('reviews', 'reviews__user')
+    fields = parse_fields_param(request)
+    products = ProductListSerializer.setup_eager_loading(Product.objects.filter(in_stock=True), fields)
     
     if category_slug:
         products = products.filter(category__slug=category_slug)
+    # Фасетные фильтры: ?spec.Бренд=Nike&spec.Материал=...
+    products = filter_by_specs(products, parse_spec_filters(request.query_params))
     
-    products = products.order_by('-created_at')
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    compiled = None
+    if settings.API_FAST_SERIALIZATION:
+        compiled = compile_serializer(ProductListSerializer, fields)
+        # Колонки ключа сортировки нужны для курсора, даже если их нет в ?fields=
+        products = compiled.values(products, extra=ordering_fields(DEFAULT_ORDERING))
+    
+    try:
+        page, next_cursor = paginate_keyset(products, request)
+    except InvalidCursor:
+        return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+    if compiled:
+        results = compiled.serialize_rows(page)
+    else:
+        results = ProductListSerializer(page, many=True, fields=fields).data
+    return Response({
+        "results": results,
+        "next_cursor": next_cursor,
+        "facets": facet_counts(category_slug),
+    })
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def product_search_view(request):
+    """Полнотекстовый поиск по названию, описанию и характеристикам (?q=)"""
+    query = request.query_params.get('q', '')
+    fields = parse_fields_param(request)
+    product_ids = search_product_ids(query, limit=get_page_size(request))
+    products = ProductListSerializer.setup_eager_loading(Product.objects.all(), fields).in_bulk(product_ids)
+    # Сохраняем порядок релевантности из индекса
+    page = [products[pk] for pk in product_ids if pk in products]
+    serializer = ProductListSerializer(page, many=True, fields=fields)
+    return Response({"results": serializer.data})
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cache_response('product-detail', product_detail_scopes)
 def product_detail_view(request, slug):
     # Try to get by slug first, then by ID
     # Не фильтруем по in_stock, чтобы пользователь мог видеть товар даже если он временно недоступен
+    products = ProductSerializer.setup_eager_loading(Product.objects.all())
     try:
-        product = Product.objects.get(slug=slug)
+        product = products.get(slug=slug)
     except Product.DoesNotExist:
         try:
-            product = Product.objects.get(id=int(slug))
+            product = products.get(id=int(slug))
         except (Product.DoesNotExist, ValueError):
             return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
     
-    serializer = ProductSerializer(product)
+    serializer = ProductSerializer(product, fields=parse_fields_param(request))
     return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@condition(etag_func=scope_etag('categories', categories_scopes), last_modified_func=scope_last_modified(categories_scopes))
+@cache_response('categories', categories_scopes)
 def categories_view(request):
     categories = Category.objects.all().order_by('name')
     serializer = CategorySerializer(categories, many=True)
     return Response(serializer.data)
 
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([AllowAny])
+@idempotent
 def add_to_cart_view(request):
+    """Гостю (без JWT) отвечает всей гостевой корзиной с guest_token, см. api.guest_carts"""
     user = request.user
-    cart, created = Cart.objects.get_or_create(user=user)
     product_id = request.data.get('product_id')
     quantity = request.data.get('quantity', 1)
 
     try:
-        product = Product.objects.get(id=product_id)
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product, defaults={'quantity': quantity})
-        if not created:
-            cart_item.quantity += int(quantity)
-            cart_item.save()
-        serializer = CartItemSerializer(cart_item)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-    except Product.DoesNotExist:
+        operations = parse_operations([{'op': 'add', 'product_id': product_id, 'quantity': quantity}])
+        check_products(operations)
+    except CartOperationError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except UnknownProducts:
         return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+    except UnavailableProducts:
+        return Response({"error": "Товара нет в наличии"}, status=status.HTTP_409_CONFLICT)
+
+    if not user.is_authenticated:
+        token, guest_cart_id = guest_carts.resolve(request, create=True)
+        try:
+            items = guest_carts.apply_operations(guest_cart_id, operations)
+        except CartOperationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(guest_carts.cart_payload(token, items), status=status.HTTP_201_CREATED)
+
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=user)
+        apply_operations(cart.id, operations)
+    cart_item = CartItem.objects.select_related('product').get(cart=cart, product_id=operations[0][1])
+    serializer = CartItemSerializer(cart_item)
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def cart_batch_view(request):
+    """
+    Пачка операций над корзиной в одной транзакции:
+    {"operations": [{"op": "add"|"set"|"remove", "product_id": 1, "quantity": 2}, ...]}.
+    Операции применяются по порядку; в ответе - обновленная компактная корзина.
+    Без JWT операции применяются к гостевой корзине в кэше.
+    """
+    try:
+        operations = parse_operations(request.data.get('operations'))
+        check_products(operations)
+    except CartOperationError as e:
+        return Response({"error": str(e), "index": e.index}, status=status.HTTP_400_BAD_REQUEST)
+    except UnknownProducts as e:
+        return Response({"error": "Product not found", "product_ids": e.product_ids}, status=status.HTTP_404_NOT_FOUND)
+    except UnavailableProducts as e:
+        return Response({"error": "Товара нет в наличии", "product_ids": e.product_ids}, status=status.HTTP_409_CONFLICT)
+
+    if not request.user.is_authenticated:
+        token, guest_cart_id = guest_carts.resolve(request, create=True)
+        try:
+            items = guest_carts.apply_operations(guest_cart_id, operations)
+        except CartOperationError as e:
+            return Response({"error": str(e), "index": e.index}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(guest_carts.cart_payload(token, items))
+
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        apply_operations(cart.id, operations)
+    return Response(compact_cart_payload(request.user))
 
 @api_view(['GET'])
-@permission_classes([IsAuthenticated])
+@permission_classes([AllowAny])
 def cart_view(request):
-    user = request.user
-    try:
-        cart = Cart.objects.get(user=user)
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
-    except Cart.DoesNotExist:
-        return Response({"items": []})
+    if not request.user.is_authenticated:
+        token, guest_cart_id = guest_carts.resolve(request)
+        return Response(guest_carts.cart_payload(token, guest_carts.load(guest_cart_id)))
+    return Response(compact_cart_payload(request.user))
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
@@ -160,29 +317,41 @@ def remove_from_cart_view(request, item_id):
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_cart_item_view(request, item_id):
-    user = request.user
+    """Новое количество строки - операция set (см. api.carts); quantity 0 удаляет строку"""
+    line = CartItem.objects.filter(id=item_id, cart__user=request.user).values_list('cart_id', 'product_id').first()
+    if line is None:
+        return Response({"error": "Item not found"}, status=status.HTTP_404_NOT_FOUND)
+    cart_id, product_id = line
+
     try:
-        cart = Cart.objects.get(user=user)
-        cart_item = CartItem.objects.get(id=item_id, cart=cart)
-        quantity = request.data.get('quantity', 1)
-        if int(quantity) <= 0:
-            cart_item.delete()
-            return Response({"message": "Item removed from cart"})
-        cart_item.quantity = int(quantity)
-        cart_item.save()
-        serializer = CartItemSerializer(cart_item)
-        return Response(serializer.data)
-    except (Cart.DoesNotExist, CartItem.DoesNotExist):
+        operations = parse_operations([{'op': 'set', 'product_id': product_id, 'quantity': request.data.get('quantity', 1)}])
+        check_products(operations)
+    except CartOperationError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except UnknownProducts:
         return Response({"error": "Item not found"}, status=status.HTTP_404_NOT_FOUND)
+    except UnavailableProducts:
+        return Response({"error": "Товара нет в наличии"}, status=status.HTTP_409_CONFLICT)
+
+    with transaction.atomic():
+        apply_operations(cart_id, operations)
+    if operations[0][2] == 0:
+        return Response({"message": "Item removed from cart"})
+    cart_item = CartItem.objects.select_related('product').get(cart_id=cart_id, product_id=product_id)
+    serializer = CartItemSerializer(cart_item)
+    return Response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_order_view(request):
+    """
+    Оформление заказа из корзины в одной транзакции. Число запросов не зависит
+    от размера корзины: строки с товарами (один JOIN), INSERT заказа, один
+    bulk INSERT позиций, задача письма-подтверждения, DELETE строк корзины (+ чтение карты при оплате картой,
+    + блокировка и UPDATE остатков, если они ведутся хотя бы по одному товару).
+    """
     user = request.user
-    cart = Cart.objects.filter(user=user).first()
-    
-    if not cart or not cart.items.exists():
-        return Response({"error": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
     
     # Получаем данные заказа
     order_data = request.data.copy()
@@ -205,54 +374,100 @@ def create_order_view(request):
         except PaymentCard.DoesNotExist:
             return Response({"error": "Карта не найдена"}, status=status.HTTP_404_NOT_FOUND)
     
-    # Создаем заказ
-    order = Order.objects.create(
-        user=user,
-        payment_method=payment_method,
-        payment_card=payment_card,
-        first_name=order_data.get('first_name'),
-        last_name=order_data.get('last_name'),
-        email=order_data.get('email'),
-        phone=order_data.get('phone'),
-        address=order_data.get('address'),
-        city=order_data.get('city'),
-        postal_code=order_data.get('postal_code', ''),
-        notes=order_data.get('notes', ''),
-    )
-    
-    # Переносим товары из корзины в заказ
-    total_price = 0
-    for cart_item in cart.items.all():
-        OrderItem.objects.create(
-            order=order,
-            product=cart_item.product,
-            quantity=cart_item.quantity,
-            price=cart_item.product.price
-        )
-        total_price += cart_item.quantity * cart_item.product.price
-    
-    order.total_price = total_price
-    order.save()
-    
-    # Очищаем корзину
-    cart.items.all().delete()
+    try:
+        with transaction.atomic():
+            # Блокируем строки корзины: повторный параллельный checkout дождется
+            # коммита и увидит уже пустую корзину
+            cart_items = list(
+                CartItem.objects.filter(cart__user=user)
+                .select_related('product')
+                .only('id', 'quantity', 'product__stock', 'product__category_id', *[f'product__{name}' for name in ProductEmbedSerializer.Meta.fields])
+                .select_for_update(of=('self',))
+                .order_by('id')
+            )
+            if not cart_items:
+                return Response({"error": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Списываем остатки товаров, по которым они ведутся
+            reserved = reserve_stock({
+                cart_item.product.id: cart_item.quantity
+                for cart_item in cart_items if cart_item.product.stock is not None
+            })
+            
+            # Позиции и сумма заказа за один проход по корзине
+            order_items = []
+            total_price = 0
+            for cart_item in cart_items:
+                order_items.append(OrderItem(
+                    product=cart_item.product, quantity=cart_item.quantity, price=cart_item.product.price,
+                    category_id=cart_item.product.category_id, reserved=cart_item.product.id in reserved,
+                ))
+                total_price += cart_item.quantity * cart_item.product.price
+            
+            order = Order.objects.create(
+                user=user,
+                payment_method=payment_method,
+                payment_card=payment_card,
+                total_price=total_price,
+                first_name=order_data.get('first_name'),
+                last_name=order_data.get('last_name'),
+                email=order_data.get('email'),
+                phone=order_data.get('phone'),
+                address=order_data.get('address'),
+                city=order_data.get('city'),
+                postal_code=order_data.get('postal_code', ''),
+                notes=order_data.get('notes', ''),
+            )
+            for order_item in order_items:
+                order_item.order = order
+            OrderItem.objects.bulk_create(order_items)
+            enqueue_job('orders.send_confirmation', {'order_id': order.id})
+            enqueue_job('rollups.sync_order', {'order_id': order.id})
+            
+            # Очищаем корзину
+            CartItem.objects.filter(id__in=[cart_item.id for cart_item in cart_items]).delete()
+    except OutOfStock as e:
+        return Response({"error": "Недостаточно товара на складе", "items": e.items}, status=status.HTTP_409_CONFLICT)
     
+    # Позиции уже в памяти - сериализатор не делает дополнительных запросов
+    order._prefetched_objects_cache = {'items': order_items}
     serializer = OrderSerializer(order)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def orders_view(request):
-    user = request.user
-    orders = Order.objects.filter(user=user).order_by('-created_at')
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    """
+    История заказов страницами (?cursor=, ?page_size=). ?summary=1 - без позиций.
+    Не больше четырех запросов на страницу при любой длине истории: заказы и их
+    позиции из оперативной таблицы и из архива (в режиме summary - два).
+    """
+    summary = request.query_params.get('summary') in ('1', 'true')
+    # Давние заказы лежат в архиве (api.archive) - страница сливается из обеих таблиц
+    orders = [
+        OrderSerializer.setup_eager_loading(model.objects.filter(user=request.user), with_items=not summary)
+        for model in (Order, ArchivedOrder)
+    ]
+    try:
+        page, next_cursor = paginate_keyset_merged(orders, request, ordering=('-created_at', '-id'))
+    except InvalidCursor:
+        return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+    serializer_class = OrderSummarySerializer if summary else OrderSerializer
+    serializer = serializer_class(page, many=True)
+    return Response({"results": serializer.data, "next_cursor": next_cursor})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=order_etag, last_modified_func=order_last_modified)
 def order_detail_view(request, order_id):
     user = request.user
-    order = get_object_or_404(Order, id=order_id, user=user)
+    order = get_order(
+        OrderSerializer.setup_eager_loading(Order.objects.all()),
+        OrderSerializer.setup_eager_loading(ArchivedOrder.objects.all()),
+        id=order_id, user=user,
+    )
+    if order is None:
+        raise Http404('No Order matches the given query.')
     serializer = OrderSerializer(order)
     return Response(serializer.data)
 
@@ -261,11 +476,19 @@ def order_detail_view(request, order_id):
 @permission_classes([IsAdminUser])
 def admin_products_view(request):
     if request.method == 'GET':
-        products = Product.objects.all().order_by('-created_at')
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        fields = parse_fields_param(request)
+        products = ProductListSerializer.setup_eager_loading(Product.objects.all(), fields)
+        category_slug = request.query_params.get('category', None)
+        if category_slug:
+            products = products.filter(category__slug=category_slug)
+        try:
+            page, next_cursor = paginate_keyset(products, request)
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ProductListSerializer(page, many=True, fields=fields)
+        return Response({"results": serializer.data, "next_cursor": next_cursor})
     elif request.method == 'POST':
-        serializer = ProductSerializer(data=request.data)
+        serializer = AdminProductSerializer(data=request.data)
         if serializer.is_valid():
             product = serializer.save()
             # Handle specifications
@@ -277,35 +500,68 @@ def admin_products_view(request):
                         name=spec['name'],
                         defaults={'value': spec['value']}
                     )
-            return Response(ProductSerializer(product).data, status=status.HTTP_201_CREATED)
+            return Response(AdminProductSerializer(product).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def admin_products_import_view(request):
+    """
+    Массовый импорт товаров с upsert по slug (см. api.catalog_import): файл в поле
+    file (multipart) или тело запроса text/csv, application/x-ndjson, application/json.
+    ?type= задает формат явно, ?dry_run=1 - только проверка, ?replace_specs=1 - характеристики
+    строки заменяют весь набор товара. Ответ - счетчики и ошибки строк.
+    """
+    if request.content_type.startswith('multipart/form-data'):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Нет файла в поле file"}, status=status.HTTP_400_BAD_REQUEST)
+        stream, name, content_type = upload, upload.name, upload.content_type
+    else:
+        # Тело читаем потоком, минуя парсеры DRF
+        stream, name, content_type = request.stream, '', request.content_type
+    import_format = request.query_params.get('type') or catalog_import.detect_format(name, content_type)
+    if import_format not in catalog_import.READERS:
+        return Response({"error": f"Не удалось определить формат. Доступны: {', '.join(catalog_import.READERS)}"},
+                       status=status.HTTP_400_BAD_REQUEST)
+    records = catalog_import.READERS[import_format](stream if stream is not None else io.BytesIO())
+    try:
+        summary = catalog_import.import_products(
+            records, dry_run=request.query_params.get('dry_run') in ('1', 'true'),
+            replace_specs=request.query_params.get('replace_specs') in ('1', 'true'),
+        )
+    except catalog_import.ImportFormatError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(summary)
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAdminUser])
 def admin_product_detail_view(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
+    products = AdminProductSerializer.setup_eager_loading(Product.objects.all())
+    product = get_object_or_404(products, id=product_id)
     
     if request.method == 'GET':
-        serializer = ProductSerializer(product)
+        serializer = AdminProductSerializer(product)
         return Response(serializer.data)
     elif request.method == 'PUT':
-        serializer = ProductSerializer(product, data=request.data, partial=True)
+        serializer = AdminProductSerializer(product, data=request.data, partial=True)
         if serializer.is_valid():
-            product = serializer.save()
-            # Handle specifications
+            specifications = None
             if 'specifications' in request.data:
-                # Delete existing specifications
-                ProductSpecification.objects.filter(product=product).delete()
-                # Add new specifications
-                specifications = request.data.get('specifications', [])
-                for spec in specifications:
-                    if spec.get('name') and spec.get('value'):
-                        ProductSpecification.objects.create(
-                            product=product,
-                            name=spec['name'],
-                            value=spec['value']
-                        )
-            return Response(ProductSerializer(product).data)
+                try:
+                    specifications = catalog_import.clean_specifications(request.data.get('specifications') or [])
+                except DjangoValidationError as e:
+                    return Response({"specifications": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+            # Без изменений полей товар не сохраняем: save() сбросил бы кэш товара и каталога
+            changed = any(getattr(product, name) != value for name, value in serializer.validated_data.items())
+            with transaction.atomic():
+                if changed:
+                    product = serializer.save()
+                if specifications is not None:
+                    # Дифф с текущими характеристиками: DELETE, UPDATE и INSERT одним запросом каждый
+                    catalog_import.update_specifications(product, specifications)
+            # Перечитываем, чтобы не отдать устаревшие предзагруженные характеристики
+            return Response(AdminProductSerializer(products.get(pk=product.pk)).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     elif request.method == 'DELETE':
         product.delete()
@@ -328,21 +584,105 @@ def admin_categories_view(request):
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def admin_orders_view(request):
-    orders = Order.objects.all().order_by('-created_at')
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    """Все заказы страницами (?cursor=, ?page_size=), новые первыми"""
+    ordering = ('-created_at', '-id')
+    compiled = None
+    if settings.API_FAST_SERIALIZATION:
+        compiled = compile_serializer(OrderSerializer)
+        orders = compiled.values(Order.objects.all(), extra=ordering_fields(ordering))
+    else:
+        orders = OrderSerializer.setup_eager_loading(Order.objects.all())
+    try:
+        page, next_cursor = paginate_keyset(orders, request, ordering=ordering)
+    except InvalidCursor:
+        return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+    if compiled:
+        results = compiled.serialize_rows(page)
+    else:
+        results = OrderSerializer(page, many=True).data
+    return Response({"results": results, "next_cursor": next_cursor})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def admin_orders_export_view(request):
+    """
+    Потоковая выгрузка заказов: ?type=csv|ndjson, ?items=1 - по строке на позицию,
+    ?archive=1 - из архива. Фильтры ?date_from=, ?date_to=, ?status=, ?payment_method= (см. api.exports)
+    """
+    export_type = request.query_params.get('type', 'csv')
+    if export_type not in exports.FORMATS:
+        return Response({"error": f"Недопустимый type. Доступны: {', '.join(exports.FORMATS)}"},
+                       status=status.HTTP_400_BAD_REQUEST)
+    items = request.query_params.get('items') in ('1', 'true')
+    try:
+        headers, rows = exports.export_queryset(
+            request.query_params, items=items, archived=request.query_params.get('archive') in ('1', 'true'),
+        )
+    except ValueError as e:
+        return Response({"error": f"Некорректные параметры: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+    response = StreamingHttpResponse(exports.STREAMS[export_type](headers, rows), content_type=exports.FORMATS[export_type])
+    filename = f"{'order-items' if items else 'orders'}-{timezone.now():%Y%m%d-%H%M%S}.{export_type}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 @api_view(['PUT'])
 @permission_classes([IsAdminUser])
 def admin_order_status_view(request, order_id):
     order = get_object_or_404(Order, id=order_id)
     new_status = request.data.get('status')
-    if new_status in dict(Order.STATUS_CHOICES):
-        order.status = new_status
-        order.save()
-        serializer = OrderSerializer(order)
-        return Response(serializer.data)
-    return Response({"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
+    if new_status not in dict(Order.STATUS_CHOICES):
+        return Response({"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
+    result = change_order_status([order.id], new_status)
+    if result['rejected']:
+        return Response({"error": result['rejected'][0]['error']}, status=status.HTTP_400_BAD_REQUEST)
+    order.refresh_from_db()
+    serializer = OrderSerializer(order)
+    return Response(serializer.data)
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def admin_orders_status_view(request):
+    """
+    Смена статуса пачки заказов: {"order_ids": [...], "status": "..."}.
+    Ответ - сводка по id (обновлены / без изменений / отклонены / не найдены), без сериализации заказов
+    """
+    new_status = request.data.get('status')
+    order_ids = request.data.get('order_ids')
+    if new_status not in dict(Order.STATUS_CHOICES):
+        return Response({"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
+    if (not isinstance(order_ids, list) or not order_ids
+            or not all(isinstance(order_id, int) and not isinstance(order_id, bool) for order_id in order_ids)):
+        return Response({"error": "order_ids должен быть непустым списком id"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(order_ids) > max_status_orders():
+        return Response({"error": f"Не больше {max_status_orders()} заказов за запрос"},
+                       status=status.HTTP_400_BAD_REQUEST)
+    return Response(change_order_status(order_ids, new_status))
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def admin_cache_stats_view(request):
+    """Счетчики попаданий и промахов кэша каталога"""
+    return Response(get_cache_stats())
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def admin_job_stats_view(request):
+    """Очередь фоновых задач: глубина по статусам, задержка и пропускная способность"""
+    return Response(job_queue_stats())
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def admin_stats_view(request):
+    """
+    Продажи за период (?date_from=, ?date_to= в формате YYYY-MM-DD, по умолчанию
+    последние 30 дней; ?top= - сколько товаров в топе) из дневных сводок api.rollups
+    """
+    try:
+        date_from, date_to = parse_period(request.query_params.get('date_from'), request.query_params.get('date_to'))
+        top = int(request.query_params.get('top', 10))
+    except ValueError as e:
+        return Response({"error": f"Некорректные параметры: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(sales_report(date_from, date_to, top=min(max(top, 0), 100)))
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
@@ -360,6 +700,7 @@ def admin_contacts_view(request):
 # Payment Card endpoints
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def payment_cards_view(request):
     user = request.user
     
@@ -422,18 +763,43 @@ def payment_card_detail_view(request, card_id):
                        status=status.HTTP_400_BAD_REQUEST)
 
 # Review endpoints
+# Порядки сортировки отзывов; каждый поддержан индексом Review.Meta.indexes
+REVIEW_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'helpful': ('-helpful_count', '-id'),
+    'rating': ('-rating', '-id'),
+}
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def product_reviews_view(request, product_id):
-    """Получить все отзывы для товара"""
-    try:
-        product = Product.objects.get(id=product_id)
-    except Product.DoesNotExist:
+    """
+    Отзывы товара страницами: ?sort=newest|helpful|rating, ?rating=1..5, ?cursor=, ?page_size=.
+    Два запроса на страницу независимо от числа отзывов.
+    """
+    if not Product.objects.filter(id=product_id).exists():
         return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
     
-    reviews = Review.objects.filter(product=product).order_by('-created_at')
-    serializer = ReviewSerializer(reviews, many=True)
-    return Response(serializer.data)
+    ordering = REVIEW_ORDERINGS.get(request.query_params.get('sort', 'newest'))
+    if ordering is None:
+        return Response({"error": f"Недопустимая сортировка. Доступны: {', '.join(REVIEW_ORDERINGS)}"},
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    reviews = Review.objects.filter(product_id=product_id).select_related('user').only(
+        'id', 'rating', 'comment', 'helpful_count', 'created_at', 'updated_at', 'user__id', 'user__username',
+    )
+    rating = request.query_params.get('rating')
+    if rating:
+        if rating not in {str(value) for value, _ in Review.RATING_CHOICES}:
+            return Response({"error": "Invalid rating"}, status=status.HTTP_400_BAD_REQUEST)
+        reviews = reviews.filter(rating=int(rating))
+    
+    try:
+        page, next_cursor = paginate_keyset(reviews, request, ordering=ordering)
+    except InvalidCursor:
+        return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = ReviewSerializer(page, many=True)
+    return Response({"results": serializer.data, "next_cursor": next_cursor})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -452,6 +818,9 @@ def create_review_view(request, product_id):
         order__user=user,
         order__status__in=['pending', 'processing', 'shipped', 'delivered'],
         product=product
+    ).exists() or ArchivedOrderItem.objects.filter(
+        # В архиве только доставленные и отмененные заказы
+        order__user=user, order__status='delivered', product=product,
     ).exists()
     
     if not has_purchased:
@@ -471,7 +840,9 @@ def create_review_view(request, product_id):
     # Создаем отзыв
     serializer = ReviewSerializer(data=request.data)
     if serializer.is_valid():
-        review = serializer.save(user=user, product=product)
+        # Агрегаты рейтинга товара обновляет сигнал (api.signals) в этой же транзакции
+        with transaction.atomic():
+            review = serializer.save(user=user, product=product)
         return Response(ReviewSerializer(review).data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -490,13 +861,36 @@ def review_detail_view(request, review_id):
         )
     
     if request.method == 'DELETE':
-        review.delete()
+        with transaction.atomic():
+            # Блокируем строку: параллельное удаление дождется коммита и уже не найдет отзыв,
+            # поэтому post_delete (и вычитание из агрегатов) сработает один раз
+            if Review.objects.select_for_update().filter(pk=review.pk).exists():
+                review.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
     
     # PUT или PATCH
     partial = request.method == 'PATCH'
     serializer = ReviewSerializer(review, data=request.data, partial=partial)
     if serializer.is_valid():
-        serializer.save()
+        with transaction.atomic():
+            # Блокируем строку, чтобы параллельная правка не исказила агрегаты:
+            # pre_save прочитает прежнюю оценку уже после чужого коммита
+            if not Review.objects.select_for_update().filter(pk=review.pk).exists():
+                raise Http404('No Review matches the given query.')
+            serializer.save()
         return Response(serializer.data)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def review_helpful_view(request, review_id):
+    """Отметить отзыв полезным (повторная отметка ничего не меняет)"""
+    review = get_object_or_404(Review.objects.only('id', 'product_id'), id=review_id)
+    try:
+        with transaction.atomic():
+            ReviewVote.objects.create(user=request.user, review=review)
+            Review.objects.filter(id=review.id).update(helpful_count=F('helpful_count') + 1)
+    except IntegrityError:
+        pass
+    helpful_count = Review.objects.values_list('helpful_count', flat=True).get(id=review.id)
+    return Response({"helpful_count": helpful_count})
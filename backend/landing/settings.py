@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -33,6 +35,9 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
 ]
 
+# Токен гостевой корзины (api.guest_carts) и ключ идемпотентности (api.idempotency)
+CORS_ALLOW_HEADERS = (*default_headers, 'x-guest-cart', 'idempotency-key')
+
 
 # Application definition
 
@@ -101,6 +106,22 @@ DATABASES = {
 #     }
 # }
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Локально - locmem; в production нужен общий для всех воркеров бэкенд,
+# например django.core.cache.backends.redis.RedisCache
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sport-store',
+    }
+}
+
+# Кэш ответов каталога (api.cache)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 300
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -147,6 +168,47 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Курсорная пагинация списков (?page_size=, ?cursor=)
+API_PAGE_SIZE = 24
+API_MAX_PAGE_SIZE = 100
+
+# Быстрая сериализация read-only списков из .values() (api.fastserialize)
+API_FAST_SERIALIZATION = True
+
+# Строк в одной транзакции массового импорта товаров (api.catalog_import)
+PRODUCT_IMPORT_BATCH_SIZE = 1000
+
+# Сколько строк за раз читает потоковая выгрузка заказов (api.exports)
+ORDER_EXPORT_CHUNK_SIZE = 2000
+
+# Максимум заказов в одном запросе /api/admin/orders/status/
+ORDER_STATUS_BATCH_MAX = 500
+
+# Максимум операций в одном запросе /api/cart/batch/
+CART_BATCH_MAX_OPERATIONS = 100
+# Максимальное количество одного товара в корзине
+CART_MAX_QUANTITY = 999
+
+# Гостевые корзины (api.guest_carts): хранятся в кэше, TTL продлевается при записи.
+# Для нескольких процессов нужен общий бэкенд кэша (Redis), а не locmem
+GUEST_CART_CACHE_ALIAS = 'default'
+GUEST_CART_TTL = 7 * 24 * 60 * 60
+GUEST_CART_MAX_LINES = 100
+
+# Сколько хранится ответ на запрос с Idempotency-Key (api.idempotency)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Очередь фоновых задач (api.jobs, manage.py run_workers)
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE_DELAY = 10  # секунд; удваивается с каждой попыткой
+JOB_RETRY_MAX_DELAY = 60 * 60
+JOB_LOCK_TIMEOUT = 10 * 60  # после этого задача упавшего воркера возвращается в очередь
+JOB_KEEP_FINISHED = 7 * 24 * 60 * 60
+
+# Почта: локально письма печатаются в консоль воркера; в production - SMTP
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'noreply@sport-store.local'
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
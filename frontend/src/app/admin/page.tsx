@@ -32,9 +32,12 @@ const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api';
 export default function AdminPage() {
   const [activeTab, setActiveTab] = useState<'products' | 'orders' | 'contacts'>('products');
   const [products, setProducts] = useState<Product[]>([]);
+  const [productsCursor, setProductsCursor] = useState<string | null>(null);
   const [orders, setOrders] = useState<Order[]>([]);
+  const [ordersCursor, setOrdersCursor] = useState<string | null>(null);
   const [contacts, setContacts] = useState<Contact[]>([]);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchData();
@@ -53,7 +56,8 @@ export default function AdminPage() {
         });
         if (response.ok) {
           const data = await response.json();
-          setProducts(data);
+          setProducts(data.results);
+          setProductsCursor(data.next_cursor);
         }
       } else if (activeTab === 'orders') {
         const response = await fetch(`${API_URL}/admin/orders/`, {
@@ -63,7 +67,8 @@ export default function AdminPage() {
         });
         if (response.ok) {
           const data = await response.json();
-          setOrders(data);
+          setOrders(data.results);
+          setOrdersCursor(data.next_cursor);
         }
       } else if (activeTab === 'contacts') {
         const response = await fetch(`${API_URL}/admin/contacts/`, {
@@ -83,6 +88,34 @@ export default function AdminPage() {
     }
   };
 
+  // Следующая страница товаров или заказов по курсору из предыдущего ответа
+  const loadMore = async (tab: 'products' | 'orders') => {
+    const cursor = tab === 'products' ? productsCursor : ordersCursor;
+    if (!cursor) return;
+    setLoadingMore(true);
+    try {
+      const token = localStorage.getItem('access_token');
+      const response = await fetch(
+        `${API_URL}/admin/${tab}/?cursor=${encodeURIComponent(cursor)}`,
+        { headers: { Authorization: `Bearer ${token}` } },
+      );
+      if (response.ok) {
+        const data = await response.json();
+        if (tab === 'products') {
+          setProducts((prev) => [...prev, ...data.results]);
+          setProductsCursor(data.next_cursor);
+        } else {
+          setOrders((prev) => [...prev, ...data.results]);
+          setOrdersCursor(data.next_cursor);
+        }
+      }
+    } catch (error) {
+      console.error('Error fetching data:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const updateOrderStatus = async (orderId: number, newStatus: string) => {
     try {
       const token = localStorage.getItem('access_token');
@@ -209,6 +242,17 @@ export default function AdminPage() {
                     </tbody>
                   </table>
                 </div>
+                {productsCursor && (
+                  <div className="mt-4 text-center">
+                    <button
+                      onClick={() => loadMore('products')}
+                      disabled={loadingMore}
+                      className="px-4 py-2 border border-orange-600 text-orange-600 rounded-lg hover:bg-orange-50 disabled:opacity-50"
+                    >
+                      {loadingMore ? 'Загрузка...' : 'Показать еще'}
+                    </button>
+                  </div>
+                )}
               </div>
             )}
 
@@ -262,6 +306,17 @@ export default function AdminPage() {
                     </tbody>
                   </table>
                 </div>
+                {ordersCursor && (
+                  <div className="mt-4 text-center">
+                    <button
+                      onClick={() => loadMore('orders')}
+                      disabled={loadingMore}
+                      className="px-4 py-2 border border-orange-600 text-orange-600 rounded-lg hover:bg-orange-50 disabled:opacity-50"
+                    >
+                      {loadingMore ? 'Загрузка...' : 'Показать еще'}
+                    </button>
+                  </div>
+                )}
               </div>
             )}
 
@@ -129,6 +129,10 @@ export default function CartPage() {
           const data = await cartResponse.json();
           setCart(data);
         }
+      } else {
+        // Больше CART_MAX_QUANTITY или товара нет в наличии
+        const data = await response.json().catch(() => ({}));
+        alert(data.error || 'Ошибка при обновлении количества');
       }
     } catch (error) {
       console.error('Error updating cart:', error);
@@ -21,9 +21,19 @@ export default function CatalogPage() {
   const [products, setProducts] = useState<Product[]>([]);
   const [categories, setCategories] = useState<Category[]>([]);
   const [selectedCategory, setSelectedCategory] = useState<string>('');
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
+  const productsUrl = (cursor?: string | null) => {
+    const params = new URLSearchParams();
+    if (selectedCategory) params.set('category', selectedCategory);
+    if (cursor) params.set('cursor', cursor);
+    const query = params.toString();
+    return `${API_URL}/products/${query ? `?${query}` : ''}`;
+  };
+
   useEffect(() => {
     const fetchData = async () => {
       try {
@@ -39,7 +49,8 @@ export default function CatalogPage() {
         const productsData = await productsRes.json();
         const categoriesData = await categoriesRes.json();
 
-        setProducts(productsData);
+        setProducts(productsData.results);
+        setNextCursor(productsData.next_cursor);
         setCategories(categoriesData);
       } catch (err) {
         setError(err instanceof Error ? err.message : 'An error occurred');
@@ -54,13 +65,11 @@ export default function CatalogPage() {
   useEffect(() => {
     const fetchProducts = async () => {
       try {
-        const url = selectedCategory
-          ? `${API_URL}/products/?category=${selectedCategory}`
-          : `${API_URL}/products/`;
-        const response = await fetch(url);
+        const response = await fetch(productsUrl());
         if (!response.ok) throw new Error('Failed to fetch products');
         const data = await response.json();
-        setProducts(data);
+        setProducts(data.results);
+        setNextCursor(data.next_cursor);
       } catch (err) {
         setError(err instanceof Error ? err.message : 'An error occurred');
       }
@@ -69,6 +78,23 @@ export default function CatalogPage() {
     fetchProducts();
   }, [selectedCategory]);
 
+  // Следующая страница по курсору из предыдущего ответа
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await fetch(productsUrl(nextCursor));
+      if (!response.ok) throw new Error('Failed to fetch products');
+      const data = await response.json();
+      setProducts((prev) => [...prev, ...data.results]);
+      setNextCursor(data.next_cursor);
+    } catch (err) {
+      setError(err instanceof Error ? err.message : 'An error occurred');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleAddToCart = async (productId: number) => {
     if (!isAuthenticated) {
       alert('Для добавления в корзину необходимо войти в систему');
@@ -170,6 +196,18 @@ export default function CatalogPage() {
             ))}
           </div>
         )}
+
+        {nextCursor && (
+          <div className="mt-8 text-center">
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="px-6 py-3 bg-orange-600 text-white rounded-lg font-medium hover:bg-orange-700 transition-colors disabled:opacity-50"
+            >
+              {loadingMore ? 'Загрузка...' : 'Показать еще'}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -13,13 +13,13 @@ export function Products() {
     const fetchProducts = async () => {
       try {
         const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api';
-        const response = await fetch(`${API_URL}/products/`);
+        const response = await fetch(`${API_URL}/products/?page_size=6`);
         if (!response.ok) {
           throw new Error('Failed to fetch products');
         }
         const data = await response.json();
         // Show only first 6 products on home page
-        setProducts(data.slice(0, 6));
+        setProducts(data.results);
       } catch (err) {
         setError(err instanceof Error ? err.message : 'An error occurred');
       } finally {
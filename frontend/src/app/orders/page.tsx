@@ -69,7 +69,9 @@ export default function OrdersPage() {
   const router = useRouter();
   const { isAuthenticated, loading: authLoading } = useAuth();
   const [orders, setOrders] = useState<Order[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [expandedOrder, setExpandedOrder] = useState<number | null>(null);
 
   useEffect(() => {
@@ -92,7 +94,8 @@ export default function OrdersPage() {
       });
       if (response.ok) {
         const data = await response.json();
-        setOrders(data);
+        setOrders(data.results);
+        setNextCursor(data.next_cursor);
       } else {
         console.error('Error fetching orders');
       }
@@ -103,6 +106,31 @@ export default function OrdersPage() {
     }
   };
 
+  // Следующая страница истории по курсору из предыдущего ответа
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const token = localStorage.getItem('access_token');
+      const response = await fetch(`${API_URL}/orders/?cursor=${encodeURIComponent(nextCursor)}`, {
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      if (response.ok) {
+        const data = await response.json();
+        setOrders((prev) => [...prev, ...data.results]);
+        setNextCursor(data.next_cursor);
+      } else {
+        console.error('Error fetching orders');
+      }
+    } catch (error) {
+      console.error('Error fetching orders:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const formatDate = (dateString: string) => {
     const date = new Date(dateString);
     return date.toLocaleDateString('ru-RU', {
@@ -347,6 +375,17 @@ export default function OrdersPage() {
                 </div>
               </div>
             ))}
+            {nextCursor && (
+              <div className="text-center">
+                <button
+                  onClick={loadMore}
+                  disabled={loadingMore}
+                  className="px-6 py-3 bg-orange-600 text-white rounded-lg font-medium hover:bg-orange-700 transition-colors disabled:opacity-50"
+                >
+                  {loadingMore ? 'Загрузка...' : 'Показать еще'}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>
@@ -38,6 +38,7 @@ interface Product {
   specifications: ProductSpecification[];
   reviews?: Review[];
   average_rating?: number;
+  review_count?: number;
 }
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api';
@@ -51,7 +52,9 @@ export default function ProductPage() {
   const [error, setError] = useState<string | null>(null);
   const [quantity, setQuantity] = useState(1);
   const [reviews, setReviews] = useState<Review[]>([]);
+  const [reviewsCursor, setReviewsCursor] = useState<string | null>(null);
   const [loadingReviews, setLoadingReviews] = useState(false);
+  const [loadingMoreReviews, setLoadingMoreReviews] = useState(false);
   const [showReviewForm, setShowReviewForm] = useState(false);
   const [editingReview, setEditingReview] = useState<Review | null>(null);
   const [reviewForm, setReviewForm] = useState({
@@ -95,7 +98,8 @@ export default function ProductPage() {
       const response = await fetch(`${API_URL}/products/${product.id}/reviews/`);
       if (response.ok) {
         const data = await response.json();
-        setReviews(data);
+        setReviews(data.results);
+        setReviewsCursor(data.next_cursor);
       }
     } catch (error) {
       console.error('Error fetching reviews:', error);
@@ -104,6 +108,26 @@ export default function ProductPage() {
     }
   };
 
+  // Следующая страница отзывов по курсору из предыдущего ответа
+  const loadMoreReviews = async () => {
+    if (!product?.id || !reviewsCursor) return;
+    setLoadingMoreReviews(true);
+    try {
+      const response = await fetch(
+        `${API_URL}/products/${product.id}/reviews/?cursor=${encodeURIComponent(reviewsCursor)}`
+      );
+      if (response.ok) {
+        const data = await response.json();
+        setReviews((prev) => [...prev, ...data.results]);
+        setReviewsCursor(data.next_cursor);
+      }
+    } catch (error) {
+      console.error('Error fetching reviews:', error);
+    } finally {
+      setLoadingMoreReviews(false);
+    }
+  };
+
   const handleAddToCart = async () => {
     if (!isAuthenticated) {
       alert('Для добавления в корзину необходимо войти в систему');
@@ -208,6 +232,8 @@ export default function ProductPage() {
   };
 
   const userReview = reviews.find((r) => r.user.id === user?.id);
+  // Отзывы загружаются страницами, поэтому общее число берем из товара
+  const reviewCount = product?.review_count ?? reviews.length;
   const canReview = isAuthenticated && !userReview;
 
   if (loading) {
@@ -375,7 +401,7 @@ export default function ProductPage() {
                     ))}
                   </div>
                   <span className="text-gray-600">
-                    {product.average_rating} ({reviews.length} {reviews.length === 1 ? 'отзыв' : reviews.length < 5 ? 'отзыва' : 'отзывов'})
+                    {product.average_rating} ({reviewCount} {reviewCount === 1 ? 'отзыв' : reviewCount < 5 ? 'отзыва' : 'отзывов'})
                   </span>
                 </div>
               )}
@@ -530,6 +556,17 @@ export default function ProductPage() {
                   <p className="text-gray-700 mt-2">{review.comment}</p>
                 </div>
               ))}
+              {reviewsCursor && (
+                <div className="text-center">
+                  <button
+                    onClick={loadMoreReviews}
+                    disabled={loadingMoreReviews}
+                    className="px-4 py-2 border border-orange-600 text-orange-600 rounded-lg hover:bg-orange-50 disabled:opacity-50"
+                  >
+                    {loadingMoreReviews ? 'Загрузка...' : 'Показать еще отзывы'}
+                  </button>
+                </div>
+              )}
             </div>
           )}
         </div>